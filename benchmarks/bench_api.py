@@ -0,0 +1,231 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_gemini_server import FakeGeminiServer
+from generate_corpus import generate_corpus
+from stage_modules import install_missing_stage_modules
+from utils.genai_client import API_ENDPOINT_ENV
+from utils.quota_coordinator import QuotaCoordinator
+from utils.summary_cache import post_fingerprint
+
+SUMMARIZE_PATH = ROOT_DIR / "preprocessing" / "2_summarize_and_prepare.py"
+LABEL_PATH = ROOT_DIR / "labeling" / "3_gemini_label.py"
+# Kích thước batch cố định của run_optimized_labeling
+LABEL_BATCH_SIZE = 50
+VALID_LABELS = {'PHAN_DONG', 'KHONG_PHAN_DONG', 'KHONG_LIEN_QUAN'}
+SUMMARY_LAST_SECTION = "3. Phản động/tin giả:"
+
+
+def load_stage(path, name):
+    """Import script của một bước (tên file bắt đầu bằng số nên không import trực tiếp được)"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    install_missing_stage_modules()
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def stage_output(verbose):
+    """Bỏ output print của script (rất nhiều mỗi batch) trừ khi verbose"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def server_request(endpoint, path, method="GET"):
+    request = urllib.request.Request(f"{endpoint}{path}", data=b"" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read() or b"{}")
+
+
+def run_summarize(stage, df, keys, model, args, quota):
+    """Tóm tắt các post duy nhất qua summarize_posts (cùng đường gửi request với process_single_file)"""
+    posts = {}
+    for post in df['post_raw'].dropna():
+        posts.setdefault(post_fingerprint(post), post)
+    batches = stage.build_batches(posts, args.max_input_tokens, args.max_output_tokens)
+    api_manager = stage.APIKeyManager(keys, model, args.max_in_flight_per_key, quota)
+    summaries = stage.summarize_posts(api_manager, posts, batches, args.max_input_tokens, args.max_output_tokens,
+                                      stream=not args.no_stream)
+    succeeded = [summary for summary in summaries.values() if stage.is_successful_summary(summary)]
+    # Summary của server giả luôn có đủ 3 mục; thiếu mục cuối là summary bị parse cắt mất nội dung
+    incomplete = sum(1 for summary in succeeded if SUMMARY_LAST_SECTION not in summary)
+    context = {post: summaries.get(fingerprint, "") for fingerprint, post in posts.items()}
+    return {'items': len(posts), 'succeeded': len(succeeded), 'incomplete': incomplete,
+            'batches': len(batches)}, context
+
+
+def run_label(stage, df, keys, model, post_context, quota):
+    """Gán nhãn comment theo từng post, batch LABEL_BATCH_SIZE comment như run_optimized_labeling"""
+    stage.rate_manager = stage.RateLimitManager(keys, model, quota=quota)
+    labeled = 0
+    batches = 0
+    for post, group in df.groupby('post_raw', sort=False):
+        summary = post_context.get(post) or post
+        for start in range(0, len(group), LABEL_BATCH_SIZE):
+            batch_df = group.iloc[start:start + LABEL_BATCH_SIZE]
+            labels_dict = stage.label_comments_batch(batch_df, summary)
+            # parse_json_labels điền nhãn mặc định cho comment thiếu; chỉ đếm nhãn model trả về
+            labeled += sum(1 for idx in batch_df.index if labels_dict.get(str(idx)) in VALID_LABELS)
+            batches += 1
+    return {'items': len(df), 'succeeded': labeled, 'batches': batches}
+
+
+def stage_report(result, seconds, server_stats, keys, rpm):
+    """Throughput, mức dùng quota và request lãng phí của một bước"""
+    totals = server_stats['totals']
+    requests = totals.get('requests', 0)
+    ok = totals.get('ok', 0)
+    # Số request quota cho phép trong thời gian chạy (cửa sổ 60 giây, bắt đầu từ quota trống)
+    capacity = len(keys) * rpm * max(1, math.ceil(seconds / 60))
+    return {
+        **result,
+        'seconds': round(seconds, 2),
+        'items_per_sec': round(result['items'] / seconds, 2) if seconds > 0 else None,
+        'success_rate': round(result['succeeded'] / result['items'], 4) if result['items'] else None,
+        'requests': requests,
+        'ok': ok,
+        'wasted_requests': requests - ok,
+        'rate_limited': totals.get('rate_limited', 0),
+        'server_errors': totals.get('server_errors', 0),
+        'safety_blocked': totals.get('safety_blocked', 0),
+        'malformed': totals.get('malformed', 0),
+        'truncated': totals.get('truncated', 0),
+        'prompt_tokens': totals.get('prompt_tokens', 0),
+        'output_tokens': totals.get('output_tokens', 0),
+        'quota_utilization': round(ok / capacity, 4) if capacity else None,
+        'requests_per_key': {key: values.get('requests', 0) for key, values in sorted(server_stats['keys'].items())},
+    }
+
+
+def format_report(name, report):
+    return "\n".join([
+        f"  {name}:",
+        f"    {report['succeeded']:,}/{report['items']:,} xong ({report['success_rate']:.1%}) trong {report['seconds']:.1f}s"
+        f" → {report['items_per_sec']:,.2f} items/s, {report['batches']:,} batch"
+        + (f", {report['incomplete']:,} summary bị cắt mất nội dung" if report.get('incomplete') else ""),
+        f"    requests: {report['requests']:,} gửi, {report['ok']:,} ok, {report['wasted_requests']:,} lãng phí"
+        f" (429: {report['rate_limited']}, 5xx: {report['server_errors']}, bị chặn: {report['safety_blocked']});"
+        f" JSON lỗi: {report['malformed']}, cắt cụt: {report['truncated']}",
+        f"    quota: {report['quota_utilization']:.1%} RPM đã dùng;"
+        f" tokens {report['prompt_tokens']:,} in / {report['output_tokens']:,} out",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end API benchmark of the summarize and label stages '
+                                                 'against the local fake Gemini server')
+    parser.add_argument('--stage', choices=['summarize', 'label', 'both'], default='both')
+    parser.add_argument('--comments', type=int, default=2000, help='Synthetic comments (posts are derived from them)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keys', type=int, default=3, help='Number of fake API keys')
+    parser.add_argument('--model', default='gemini-2.0-flash')
+    parser.add_argument('--endpoint', help='Use an already running fake server instead of starting one')
+    parser.add_argument('--rpm', type=int, default=15, help='Server RPM per key (started server only)')
+    parser.add_argument('--rpd', type=int, default=1500, help='Server RPD per key (started server only)')
+    parser.add_argument('--latency-ms', type=float, default=800.0)
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--ms-per-token', type=float, default=2.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--safety-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--max-in-flight-per-key', type=int, default=2)
+    parser.add_argument('--max-input-tokens', type=int, default=8000)
+    parser.add_argument('--max-output-tokens', type=int, default=4096)
+    parser.add_argument('--no-stream', action='store_true', help='Summarize without streaming responses')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the stage scripts')
+    parser.add_argument('--output', '-o', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    server = None
+    if args.endpoint:
+        endpoint = args.endpoint.rstrip('/')
+        rpm = server_request(endpoint, '/stats')['limits']['rpm']
+    else:
+        server = FakeGeminiServer(rpm=args.rpm, rpd=args.rpd, latency_ms=args.latency_ms,
+                                  latency_sigma=args.latency_sigma, ms_per_token=args.ms_per_token,
+                                  error_rate=args.error_rate, safety_rate=args.safety_rate,
+                                  malformed_rate=args.malformed_rate, seed=args.seed).start()
+        endpoint = server.url
+        rpm = args.rpm
+    # Các script đọc biến này khi tạo client (utils.genai_client)
+    os.environ[API_ENDPOINT_ENV] = endpoint
+    keys = [f"bench-key-{i + 1}" for i in range(args.keys)]
+
+    df = generate_corpus(args.comments, seed=args.seed)
+    print(f"BENCHMARK API: {len(df):,} comments / {df['post_raw'].nunique():,} posts, {len(keys)} keys,"
+          f" model {args.model}, server {endpoint}")
+
+    results = {}
+    # Sổ quota riêng cho lần chạy (không dùng chung ~/.cache với các lần chạy thật); giữ qua
+    # cả hai bước như cửa sổ quota của server
+    quota_dir = tempfile.TemporaryDirectory()
+    quota = QuotaCoordinator(Path(quota_dir.name) / "api_quota.sqlite")
+    try:
+        post_context = {}
+        if args.stage in ('summarize', 'both'):
+            stage = load_stage(SUMMARIZE_PATH, "summarize_stage")
+            server_request(endpoint, '/reset', "POST")
+            start = time.perf_counter()
+            with stage_output(args.verbose):
+                result, post_context = run_summarize(stage, df, keys, args.model, args, quota)
+            results['summarize'] = stage_report(result, time.perf_counter() - start,
+                                                server_request(endpoint, '/stats'), keys, rpm)
+            print(format_report('summarize', results['summarize']))
+
+        if args.stage in ('label', 'both'):
+            stage = load_stage(LABEL_PATH, "label_stage")
+            server_request(endpoint, '/reset', "POST")
+            start = time.perf_counter()
+            with stage_output(args.verbose):
+                result = run_label(stage, df, keys, args.model, post_context, quota)
+            results['label'] = stage_report(result, time.perf_counter() - start,
+                                            server_request(endpoint, '/stats'), keys, rpm)
+            print(format_report('label', results['label']))
+    finally:
+        quota.close()
+        quota_dir.cleanup()
+        if server is not None:
+            server.stop()
+
+    if args.output:
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'comments': len(df),
+                'posts': int(df['post_raw'].nunique()),
+                'seed': args.seed,
+                'keys': len(keys),
+                'model': args.model,
+                'server': {name: getattr(args, name) for name in (
+                    'rpm', 'rpd', 'latency_ms', 'latency_sigma', 'ms_per_token',
+                    'error_rate', 'safety_rate', 'malformed_rate')} if server is not None else {'endpoint': endpoint},
+                'stream': not args.no_stream,
+                'max_in_flight_per_key': args.max_in_flight_per_key,
+                'python': platform.python_version(),
+            },
+            'results': results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\nĐã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
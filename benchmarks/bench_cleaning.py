@@ -0,0 +1,346 @@
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate_corpus import SIZES, SYNTHETIC_ABBREVIATIONS, generate_corpus, parse_size
+from stage_modules import install_missing_stage_modules
+from utils import text_normalization
+from utils.text_normalization import TextNormalizer, load_abbreviation_dictionary
+
+FIRST_CLEAN_PATH = ROOT_DIR / "preprocessing" / "1_first_clean.py"
+NOTEBOOK_PATH = ROOT_DIR / "preprocessing" / "Preprocessing.ipynb"
+KAGGLE_DICTIONARY_PATTERN = re.compile(r"""(['"])/kaggle/input/[^'"]*\.json\1""")
+
+
+def load_first_clean():
+    """Import preprocessing/1_first_clean.py (tên file bắt đầu bằng số nên không import trực tiếp được)"""
+    spec = importlib.util.spec_from_file_location("first_clean", FIRST_CLEAN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["first_clean"] = module
+    install_missing_stage_modules()
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_notebook_functions(dictionary_path):
+    """
+    Chạy các cell định nghĩa hàm trong Preprocessing.ipynb và trả về namespace.
+
+    Bỏ qua các cell đọc dữ liệu Kaggle / chạy pipeline; đường dẫn từ điển Kaggle
+    được thay bằng dictionary_path.
+    """
+    with open(NOTEBOOK_PATH, encoding='utf-8') as f:
+        notebook = json.load(f)
+
+    namespace = {}
+    for cell in notebook['cells']:
+        if cell['cell_type'] != 'code':
+            continue
+        source = ''.join(cell['source'])
+        if 'read_csv' in source or 'selected_df' in source or 'to_csv' in source:
+            continue
+        if not re.search(r'^(import|from|def|[A-Z_]+\s*=|with open)', source, re.MULTILINE):
+            continue
+        source = KAGGLE_DICTIONARY_PATTERN.sub(repr(str(dictionary_path)), source)
+        exec(compile(source, str(NOTEBOOK_PATH), 'exec'), namespace)
+    return namespace
+
+
+def measure(func, rows, memory=True, repeat=3):
+    """Đo thời gian func (lấy lần nhanh nhất trong repeat lần), rồi (nếu memory) chạy lại dưới tracemalloc để đo peak"""
+    seconds = None
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    stats = {
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+    }
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        stats['peak_mb'] = round(peak / 1024 / 1024, 2)
+    return result, stats
+
+
+def quiet(func, *args, **kwargs):
+    """Gọi func và bỏ output print (các bước của 1_first_clean in rất nhiều)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def function_benchmarks(first_clean, notebook, normalizer, df):
+    """(tên, hàm không tham số) cho từng hàm cleaning riêng lẻ"""
+    texts = df['comment_raw'].tolist()
+    lowered = [first_clean.unicodedata.normalize('NFC', t).lower() for t in texts]
+    column = df['comment_raw']
+
+    benchmarks = [
+        ('first_clean.minimal_clean', lambda: [first_clean.minimal_clean(t) for t in texts]),
+        ('first_clean.remove_emojis', lambda: [first_clean.remove_emojis(t) for t in texts]),
+        ('first_clean.remove_vn_emoticons', lambda: [first_clean.remove_vn_emoticons(t) for t in texts]),
+        ('first_clean.count_words', lambda: [first_clean.count_words(t) for t in texts]),
+        ('first_clean.count_words_series', lambda: first_clean.count_words_series(column)),
+        ('first_clean.is_special_pattern', lambda: [first_clean.is_special_pattern(t) for t in texts]),
+    ]
+    notebook_functions = [
+        ('normalize_unicode_lower', texts),
+        ('remove_emoji_emoticon', lowered),
+        ('remove_html_url_mention_hashtag', lowered),
+        ('reduce_elongated', lowered),
+        ('apply_lexical_normalization', lowered),
+        ('remove_punctuation', lowered),
+        ('strip_extra_spaces', lowered),
+    ]
+    for name, inputs in notebook_functions:
+        if name in notebook:
+            func = notebook[name]
+            benchmarks.append((f'notebook.{name}', lambda func=func, inputs=inputs: [func(t) for t in inputs]))
+    if normalizer.lexical_normalizer is not None:
+        lexical = normalizer.lexical_normalizer
+        benchmarks.append(('lexical_normalizer.normalize', lambda: [lexical.normalize(t) for t in lowered]))
+    # Bản tối ưu của bước 2 và 5 (so với notebook.* ở trên)
+    for name in ('remove_emoji_emoticon', 'remove_punctuation'):
+        func = getattr(text_normalization, name)
+        benchmarks.append((f'text_normalization.{name}', lambda func=func: [func(t) for t in lowered]))
+    benchmarks.append(('text_normalization.normalize_text', lambda: [normalizer.normalize(t) for t in texts]))
+    return benchmarks
+
+
+def first_clean_steps(first_clean, max_words, max_comments_per_post):
+    """Các bước của clean_single_file (trừ đọc/ghi Excel), mỗi bước nhận output bước trước"""
+    def filter_long(df):
+        return quiet(first_clean.filter_long_comments, df.copy(), max_words=max_words)[0]
+
+    def clean(df):
+        df = df.copy()
+        df['comment_raw'] = first_clean.COMMENT_CLEANER.clean_many(df['comment_raw'])
+        return df
+
+    def filter_short(df):
+        return quiet(first_clean.filter_short_comments, df)[0].reset_index(drop=True)
+
+    def balance(df):
+        return quiet(first_clean.balance_comments_advanced, df.copy(), max_comments_per_post=max_comments_per_post)[0]
+
+    return [
+        ('1_filter_long_comments', filter_long),
+        ('2_clean_comments', clean),
+        ('3_filter_short_comments', filter_short),
+        ('4_balance_comments', balance),
+    ]
+
+
+def notebook_steps(notebook):
+    """7 bước của notebook Preprocessing.ipynb trên cột comment_clean"""
+    def apply(name):
+        def step(df):
+            df = df.copy()
+            df['comment_clean'] = df['comment_clean'].apply(notebook[name])
+            return df
+        return step
+
+    def first(df):
+        df = df[['comment_raw']].copy()
+        df['comment_clean'] = df['comment_raw'].apply(notebook['normalize_unicode_lower'])
+        return df
+
+    def remove_noise(df):
+        df = df.copy()
+        df['comment_clean'] = df['comment_clean'].apply(notebook['remove_emoji_emoticon'])
+        df['comment_clean'] = df['comment_clean'].apply(notebook['remove_html_url_mention_hashtag'])
+        return df
+
+    return [
+        ('1_normalize_unicode_lower', first),
+        ('2_remove_emoji_links_html', remove_noise),
+        ('3_reduce_elongated', apply('reduce_elongated')),
+        ('4_lexical_normalization', apply('apply_lexical_normalization')),
+        ('5_remove_punctuation', apply('remove_punctuation')),
+        ('6_strip_extra_spaces', apply('strip_extra_spaces')),
+        ('7_deduplicate', lambda df: notebook['deduplicate_comments'](df, col='comment_clean')),
+    ]
+
+
+def normalization_module_steps(normalizer):
+    """Pipeline của utils/text_normalization: bước 1-6 gộp một lần duyệt, rồi dedup"""
+    def normalize(df):
+        df = df[['comment_raw']].copy()
+        df['comment_clean'] = normalizer.normalize_many(df['comment_raw'])
+        return df
+
+    return [
+        ('1-6_normalize_text', normalize),
+        ('7_deduplicate', lambda df: df.drop_duplicates(subset=['comment_clean']).reset_index(drop=True)),
+    ]
+
+
+def run_pipeline(name, steps, df, results, memory, repeat):
+    rows = len(df)
+    for step_name, step in steps:
+        df, stats = measure(lambda: step(df), rows, memory, repeat)
+        stats['rows_out'] = len(df)
+        results[f'step/{name}/{step_name}'] = stats
+        print(format_row(f'step/{name}/{step_name}', stats))
+        rows = len(df)
+
+
+def format_row(name, stats):
+    peak = f"{stats['peak_mb']:>9.1f} MB" if 'peak_mb' in stats else ''
+    rate = f"{stats['rows_per_sec']:>14,.0f} rows/s" if stats['rows_per_sec'] else f"{'-':>21}"
+    return f"  {name:<52} {rate} {stats['seconds']:>9.3f}s {peak}"
+
+
+def compare(results, baseline, tolerance):
+    """So sánh với baseline; trả về danh sách regression (chậm hơn / tốn bộ nhớ hơn quá tolerance)"""
+    regressions = []
+    print(f"\nSO SÁNH VỚI BASELINE ({baseline['meta'].get('created_at', '?')}, tolerance {tolerance:.0%}):")
+    for name, stats in results.items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        notes = []
+        if old.get('rows_per_sec') and stats.get('rows_per_sec'):
+            ratio = stats['rows_per_sec'] / old['rows_per_sec']
+            notes.append(f"throughput x{ratio:.2f}")
+            if ratio < 1 - tolerance:
+                regressions.append(f"{name}: throughput {old['rows_per_sec']:,.0f} → {stats['rows_per_sec']:,.0f} rows/s")
+        if old.get('peak_mb') and stats.get('peak_mb'):
+            ratio = stats['peak_mb'] / old['peak_mb']
+            notes.append(f"memory x{ratio:.2f}")
+            if ratio > 1 + tolerance and stats['peak_mb'] - old['peak_mb'] > 1:
+                regressions.append(f"{name}: peak memory {old['peak_mb']:.1f} → {stats['peak_mb']:.1f} MB")
+        print(f"  {name:<52} {', '.join(notes)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the cleaning and normalization functions')
+    parser.add_argument('--size', type=parse_size, default=SIZES['10k'], help='10k, 100k, 1m or a row count')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--input', help='Benchmark an existing corpus (CSV/JSONL/Parquet with comment_raw) instead of generating one')
+    parser.add_argument('--dictionary', help='Abbreviation dictionary JSON for lexical normalization (default: synthetic)')
+    parser.add_argument('--only', choices=['functions', 'steps'], help='Run only per-function or per-step benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per benchmark (best run is reported)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the text_normalization pipeline step')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc peak-memory pass')
+    parser.add_argument('--max-words', type=int, default=300)
+    parser.add_argument('--max-comments-per-post', type=int, default=1000)
+    parser.add_argument('--output', '-o', help='Write results JSON to this file')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against (default: benchmarks/baseline_<size>.json if present)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save results as benchmarks/baseline_<size>.json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown / memory growth before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 when a regression is found')
+    args = parser.parse_args()
+
+    if args.input:
+        input_path = Path(args.input)
+        if input_path.suffix.lower() == '.parquet':
+            df = pd.read_parquet(input_path)
+        elif input_path.suffix.lower() == '.jsonl':
+            df = pd.read_json(input_path, lines=True)
+        else:
+            df = pd.read_csv(input_path)
+        size_label = input_path.stem
+    else:
+        print(f"Đang sinh corpus {args.size:,} dòng (seed {args.seed})...")
+        df = generate_corpus(args.size, seed=args.seed)
+        size_label = next((label for label, rows in SIZES.items() if rows == args.size), str(args.size))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dictionary_path = args.dictionary
+        if not dictionary_path:
+            dictionary_path = Path(tmp_dir) / "abbreviation_dictionary.json"
+            dictionary_path.write_text(json.dumps(SYNTHETIC_ABBREVIATIONS, ensure_ascii=False), encoding='utf-8')
+        notebook = load_notebook_functions(dictionary_path)
+        normalizer = TextNormalizer(load_abbreviation_dictionary(dictionary_path), workers=args.workers)
+    first_clean = load_first_clean()
+
+    memory = not args.no_memory
+    results = {}
+    print(f"\nBENCHMARK {len(df):,} comments (memory: {'on' if memory else 'off'})")
+
+    if args.only in (None, 'functions'):
+        print("\nTHEO HÀM:")
+        for name, func in function_benchmarks(first_clean, notebook, normalizer, df):
+            _, stats = measure(func, len(df), memory, args.repeat)
+            results[f'function/{name}'] = stats
+            print(format_row(f'function/{name}', stats))
+
+    if args.only in (None, 'steps'):
+        print("\nTHEO BƯỚC PIPELINE:")
+        run_pipeline('first_clean', first_clean_steps(first_clean, args.max_words, args.max_comments_per_post),
+                     df, results, memory, args.repeat)
+        run_pipeline('notebook', notebook_steps(notebook), df, results, memory, args.repeat)
+        run_pipeline('text_normalization', normalization_module_steps(normalizer), df, results, memory, args.repeat)
+    normalizer.close()
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'rows': len(df),
+            'size': size_label,
+            'seed': args.seed,
+            'memory': memory,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\nĐã lưu kết quả: {args.output}")
+
+    baseline_path = Path(args.baseline) if args.baseline else BENCH_DIR / f"baseline_{size_label}.json"
+    regressions = []
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSION:")
+            for line in regressions:
+                print(f"  - {line}")
+        else:
+            print("\nKhông có regression so với baseline")
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+        print(f"\nĐã lưu baseline: {baseline_path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
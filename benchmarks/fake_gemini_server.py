@@ -0,0 +1,412 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Định dạng prompt của 2_summarize_and_prepare.py (format_post_entry) và 3_gemini_label.py (build_label_prompt)
+SUMMARY_ENTRY_REGEX = re.compile(r'Văn bản (id\d+):\n"(.*?)"(?=\n\nVăn bản id\d+:|\s*\n\s*Trả lời|\Z)', re.DOTALL)
+LABEL_COMMENTS_REGEX = re.compile(r'COMMENTS TO CLASSIFY:\n(\{.*?\n\})\n', re.DOTALL)
+GENERATE_PATH_REGEX = re.compile(r'^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$')
+
+LABELS = ("PHAN_DONG", "KHONG_PHAN_DONG", "KHONG_LIEN_QUAN")
+MALFORMATIONS = ("raw_newline", "missing_comma", "inner_quotes", "inner_quote_comma", "truncated")
+DAY_SECONDS = 24 * 60 * 60
+# Số ký tự mỗi chunk khi stream (~15 token)
+STREAM_CHUNK_CHARS = 60
+
+
+def count_tokens(text):
+    """Số token giả lập: 4 byte UTF-8 = 1 token"""
+    return max(1, math.ceil(len(text.encode('utf-8')) / 4))
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class FakeGeminiServer:
+    """
+    Server HTTP thay thế Gemini API (phần generateContent mà các script dùng) để benchmark offline.
+
+    Phục vụ đúng định dạng REST của google-generativeai (transport="rest"):
+    POST /v1beta/models/{model}:generateContent và :streamGenerateContent (mảng JSON,
+    hoặc SSE với ?alt=sse), GET /v1beta/models. Mô phỏng:
+    - độ trễ: thời gian tới token đầu theo phân phối log-normal + thời gian mỗi token output
+    - giới hạn RPM / RPD theo từng (key, model) với cửa sổ trượt → 429 RESOURCE_EXHAUSTED
+      kèm RetryInfo như API thật
+    - lỗi server ngẫu nhiên (503 quá tải), response bị chặn (finishReason SAFETY),
+      JSON lỗi định dạng và bị cắt cụt (finishReason MAX_TOKENS khi vượt maxOutputTokens)
+    Response được sinh từ prompt: kết quả tóm tắt cho từng "Văn bản idN", nhãn cho từng comment.
+    GET /stats trả về số liệu theo key; POST /reset xóa số liệu (không xóa cửa sổ quota).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, rpm=15, rpd=1500, latency_ms=800.0, latency_sigma=0.5,
+                 ms_per_token=2.0, error_rate=0.0, safety_rate=0.0, malformed_rate=0.0,
+                 output_tokens_per_post=120, seed=42):
+        self.rpm = rpm
+        self.rpd = rpd
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.ms_per_token = ms_per_token
+        self.error_rate = error_rate
+        self.safety_rate = safety_rate
+        self.malformed_rate = malformed_rate
+        self.output_tokens_per_post = output_tokens_per_post
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # (key, model) → thời điểm các request được nhận trong 60 giây / 24 giờ gần nhất
+        self._minute_windows = defaultdict(deque)
+        self._day_windows = defaultdict(deque)
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Chạy server trong thread nền; trả về chính server"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # ---- Số liệu ----
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = defaultdict(int)
+            self._key_stats = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, api_key, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+            self._key_stats[api_key][name] += value
+
+    def stats(self):
+        """Tổng số liệu và số liệu theo key (requests, ok, rate_limited, ...)"""
+        with self._lock:
+            totals = dict(self._stats)
+            per_key = {key: dict(values) for key, values in self._key_stats.items()}
+        return {'totals': totals, 'keys': per_key, 'limits': {'rpm': self.rpm, 'rpd': self.rpd}}
+
+    # ---- Mô phỏng ----
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _latency_seconds(self):
+        with self._lock:
+            return self.latency_ms / 1000 * self._rng.lognormvariate(0, self.latency_sigma)
+
+    def _admit(self, api_key, model):
+        """
+        Ghi nhận request vào cửa sổ quota của (key, model).
+
+        Returns:
+            tuple | None: (quota_id, số giây chờ) nếu vượt RPM/RPD, None nếu được nhận
+        """
+        now = time.monotonic()
+        with self._lock:
+            minute = self._minute_windows[(api_key, model)]
+            day = self._day_windows[(api_key, model)]
+            while minute and now - minute[0] >= 60:
+                minute.popleft()
+            while day and now - day[0] >= DAY_SECONDS:
+                day.popleft()
+            if len(day) >= self.rpd:
+                return "GenerateRequestsPerDayPerProjectPerModel-FreeTier", DAY_SECONDS - (now - day[0])
+            if len(minute) >= self.rpm:
+                return "GenerateRequestsPerMinutePerProjectPerModel-FreeTier", 60 - (now - minute[0])
+            minute.append(now)
+            day.append(now)
+        return None
+
+    def _response_text(self, prompt, json_mime):
+        """Sinh output cho prompt tóm tắt hoặc gán nhãn (text JSON)"""
+        entries = SUMMARY_ENTRY_REGEX.findall(prompt)
+        if entries:
+            results = [{'id': post_id, 'summary': self._summary(post)} for post_id, post in entries]
+            text = json.dumps({'results': results}, ensure_ascii=False, indent=2)
+            return text if json_mime else f"```json\n{text}\n```"
+        match = LABEL_COMMENTS_REGEX.search(prompt)
+        if match:
+            try:
+                comments = json.loads(match.group(1))
+            except json.JSONDecodeError:
+                comments = {}
+            labels = {comment_id: LABELS[_stable_hash(str(comment)) % len(LABELS)]
+                      for comment_id, comment in comments.items()}
+            return json.dumps(labels, ensure_ascii=False, indent=2)
+        return json.dumps({'text': 'OK'}) if json_mime else "OK"
+
+    def _summary(self, post):
+        words = post.split() or ["(trống)"]
+        seed = _stable_hash(post)
+        # Độ dài summary dao động quanh output_tokens_per_post (0.6x - 1.4x)
+        target_bytes = int(self.output_tokens_per_post * 4 * (0.6 + (seed % 80) / 100))
+        body_words, size = [], 0
+        while size < target_bytes:
+            word = words[len(body_words) % len(words)]
+            body_words.append(word)
+            size += len(word.encode('utf-8')) + 1
+        third = len(body_words) // 3
+        stance = "Có" if seed % 4 == 0 else "Không"
+        return (f"1. Nội dung sơ lược: {' '.join(body_words[:third])}\n"
+                f"2. Vấn đề: {' '.join(body_words[third:2 * third])}\n"
+                f"3. Phản động/tin giả: {stance}, {' '.join(body_words[2 * third:])}")
+
+    def _malform(self, text):
+        """Làm hỏng JSON theo một kiểu lỗi thường gặp; trả về (text, cắt cụt hay không)"""
+        with self._lock:
+            kind = self._rng.choice(MALFORMATIONS)
+            cut = self._rng.uniform(0.6, 0.95)
+        if kind == "raw_newline":
+            return text.replace("\\n", "\n"), False
+        if kind == "missing_comma":
+            return text.replace("},\n", "}\n", 1).replace('",\n', '"\n', 1), False
+        if kind in ("inner_quotes", "inner_quote_comma"):
+            target = '"summary": "' if '"summary": "' in text else ': "'
+            # Dấu nháy trong chuỗi, kể cả nháy ngay trước dấu phẩy (liệt kê từ khóa trong trích dẫn)
+            quoted = 'lời "trích dẫn" ' if kind == "inner_quotes" else 'dùng từ "bò đỏ", "vẹm" '
+            return text.replace(target, target + quoted, 1), False
+        return text[:int(len(text) * cut)], True
+
+    def generate(self, api_key, model, body):
+        """
+        Xử lý một request generateContent.
+
+        Returns:
+            tuple: (HTTP status, dict response hoặc lỗi, số giây trễ trước token đầu, số token output)
+        """
+        self._count(api_key, 'requests')
+        limited = self._admit(api_key, model)
+        if limited is not None:
+            quota_id, retry_seconds = limited
+            name = 'rate_limited_rpd' if 'PerDay' in quota_id else 'rate_limited_rpm'
+            self._count(api_key, 'rate_limited')
+            self._count(api_key, name)
+            return 429, _error_body(
+                429, "RESOURCE_EXHAUSTED",
+                f"You exceeded your current quota, please check your plan and billing details. "
+                f"Please retry in {retry_seconds:.1f}s.",
+                [
+                    {"@type": "type.googleapis.com/google.rpc.QuotaFailure",
+                     "violations": [{"quotaMetric": "generativelanguage.googleapis.com/generate_content_free_tier_requests",
+                                     "quotaId": quota_id,
+                                     "quotaDimensions": {"model": model, "location": "global"}}]},
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{math.ceil(retry_seconds)}s"},
+                ]
+            ), 0.0, 0
+        if self._random() < self.error_rate:
+            self._count(api_key, 'server_errors')
+            return 503, _error_body(503, "UNAVAILABLE", "The model is overloaded. Please try again later."), \
+                self._latency_seconds() / 4, 0
+
+        system = " ".join(part.get('text', '') for part in (body.get('systemInstruction') or {}).get('parts', []))
+        prompt = " ".join(part.get('text', '') for content in body.get('contents', [])
+                          for part in content.get('parts', []))
+        generation_config = body.get('generationConfig') or {}
+        prompt_tokens = count_tokens(system + prompt)
+        latency = self._latency_seconds()
+
+        if self._random() < self.safety_rate:
+            self._count(api_key, 'safety_blocked')
+            response = {
+                'candidates': [{'finishReason': 'SAFETY', 'index': 0, 'safetyRatings': [
+                    {'category': 'HARM_CATEGORY_HATE_SPEECH', 'probability': 'HIGH', 'blocked': True}]}],
+                'usageMetadata': {'promptTokenCount': prompt_tokens, 'totalTokenCount': prompt_tokens},
+            }
+            return 200, response, latency, 0
+
+        text = self._response_text(prompt, generation_config.get('responseMimeType') == 'application/json')
+        finish_reason = 'STOP'
+        if self._random() < self.malformed_rate:
+            self._count(api_key, 'malformed')
+            text, truncated = self._malform(text)
+            if truncated:
+                finish_reason = 'MAX_TOKENS'
+        max_output_tokens = generation_config.get('maxOutputTokens')
+        if max_output_tokens and count_tokens(text) > int(max_output_tokens):
+            text = text.encode('utf-8')[:int(max_output_tokens) * 4].decode('utf-8', 'ignore')
+            finish_reason = 'MAX_TOKENS'
+        if finish_reason == 'MAX_TOKENS':
+            self._count(api_key, 'truncated')
+        output_tokens = count_tokens(text)
+        self._count(api_key, 'ok')
+        self._count(api_key, 'prompt_tokens', prompt_tokens)
+        self._count(api_key, 'output_tokens', output_tokens)
+        response = {
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'},
+                            'finishReason': finish_reason, 'index': 0}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+                              'totalTokenCount': prompt_tokens + output_tokens},
+            'modelVersion': model,
+        }
+        return 200, response, latency, output_tokens
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _api_key(self, query):
+                return self.headers.get('x-goog-api-key') or (query.get('key') or [None])[0]
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/stats':
+                    self._send_json(200, server.stats())
+                elif re.match(r'^/v1(beta)?/models/?$', path):
+                    self._send_json(200, {'models': [
+                        {'name': f"models/{name}", 'supportedGenerationMethods': ['generateContent', 'countTokens']}
+                        for name in ("gemini-2.0-flash", "gemini-2.0-flash-lite", "gemini-2.5-flash")
+                    ]})
+                else:
+                    self._send_json(404, _error_body(404, "NOT_FOUND", f"Unknown path {path}"))
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw_body = self.rfile.read(length) if length else b""
+                if parsed.path == '/reset':
+                    server.reset_stats()
+                    self._send_json(200, {})
+                    return
+                match = GENERATE_PATH_REGEX.match(parsed.path)
+                if not match:
+                    self._send_json(404, _error_body(404, "NOT_FOUND", f"Unknown path {parsed.path}"))
+                    return
+                api_key = self._api_key(query)
+                if not api_key:
+                    self._send_json(403, _error_body(403, "PERMISSION_DENIED", "Method doesn't allow unregistered callers."))
+                    return
+                try:
+                    body = json.loads(raw_body or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, _error_body(400, "INVALID_ARGUMENT", "Invalid JSON payload received."))
+                    return
+
+                model, method = match.groups()
+                status, payload, latency, output_tokens = server.generate(api_key, model, body)
+                time.sleep(latency)
+                if status != 200 or method == 'generateContent':
+                    time.sleep(output_tokens * server.ms_per_token / 1000)
+                    self._send_json(status, payload)
+                    return
+                self._stream(payload, (query.get('alt') or [''])[0] == 'sse')
+
+            def _stream(self, payload, sse):
+                """Gửi response thành nhiều chunk theo tốc độ sinh token (mảng JSON hoặc SSE)"""
+                candidate = payload['candidates'][0]
+                parts = candidate.get('content', {}).get('parts') or [{'text': ''}]
+                text = parts[0]['text']
+                pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or ['']
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream' if sse else 'application/json; charset=UTF-8')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                if not sse:
+                    self._write_chunk(b"[")
+                for index, piece in enumerate(pieces):
+                    last = index == len(pieces) - 1
+                    chunk_candidate = {'index': 0}
+                    if 'content' in candidate:
+                        chunk_candidate['content'] = {'parts': [{'text': piece}], 'role': 'model'}
+                    if last:
+                        chunk_candidate['finishReason'] = candidate['finishReason']
+                        if 'safetyRatings' in candidate:
+                            chunk_candidate['safetyRatings'] = candidate['safetyRatings']
+                    chunk = {'candidates': [chunk_candidate]}
+                    if last:
+                        chunk['usageMetadata'] = payload['usageMetadata']
+                    time.sleep(count_tokens(piece) * server.ms_per_token / 1000)
+                    data = json.dumps(chunk, ensure_ascii=False)
+                    if sse:
+                        self._write_chunk(f"data: {data}\r\n\r\n".encode('utf-8'))
+                    else:
+                        self._write_chunk((data + ("]" if last else ",\r\n")).encode('utf-8'))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _error_body(code, status, message, details=None):
+    error = {'code': code, 'message': message, 'status': status}
+    if details:
+        error['details'] = details
+    return {'error': error}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Gemini generateContent API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rpm', type=int, default=15, help='Requests per minute per (API key, model)')
+    parser.add_argument('--rpd', type=int, default=1500, help='Requests per day per (API key, model)')
+    parser.add_argument('--latency-ms', type=float, default=800.0, help='Median time to first token')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Log-normal sigma of the latency')
+    parser.add_argument('--ms-per-token', type=float, default=2.0, help='Generation time per output token')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 503')
+    parser.add_argument('--safety-rate', type=float, default=0.0, help='Share of responses blocked (finishReason SAFETY)')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of responses with malformed or truncated JSON')
+    parser.add_argument('--output-tokens-per-post', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(args.host, args.port, args.rpm, args.rpd, args.latency_ms, args.latency_sigma,
+                              args.ms_per_token, args.error_rate, args.safety_rate, args.malformed_rate,
+                              args.output_tokens_per_post, args.seed)
+    print(f"Fake Gemini API: {server.url}  (export GEMINI_API_ENDPOINT={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import random
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+SAMPLE_DATASET = BENCH_DIR.parent / "dataset" / "sample_dataset.csv"
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Từ điển teencode giả lập, cùng định dạng với abbreviation_dictionary.json của notebook
+SYNTHETIC_ABBREVIATIONS = {
+    "ko": "không", "k": "không", "hok": "không", "dc": "được", "đc": "được",
+    "vs": "với", "j": "gì", "bít": "biết", "ns": "nói", "mn": "mọi người",
+    "cx": "cũng", "ng": "người", "trc": "trước", "z": "vậy", "v": "vậy",
+    "tl": "trả lời", "bn": "bao nhiêu", "ae": "anh em", "nt": "nhắn tin",
+    "cmt": "bình luận", "stt": "trạng thái", "vn": "việt nam", "tq": "trung quốc",
+    "cs": "cộng sản", "dcs": "đảng cộng sản", "ad": "quản trị viên",
+    "v+": "vẹm", "3/": "ba que", "=))": "cười", ":))": "cười", "<3": "yêu",
+}
+
+EMOJIS = ["😀", "😂", "🤣", "😡", "👍", "👎", "🙏", "🔥", "💩", "🇻🇳", "❤️", "😅", "🤡", "✌️", "😭"]
+EMOTICONS = [":))", ":)))", "=))", ":((", ":v", ":V", ":>", ":<", "=(", "<3", ":d", ":p"]
+UI_INDICATORS = ["Xem thêm", "See more", "Đã chỉnh sửa", "See Translation", "Xem bản dịch", "Ẩn bớt"]
+DOMAINS = ["facebook.com", "youtube.com", "tiktok.com", "vnexpress.net", "baomoi.vn", "reddit.com"]
+PLATFORMS = ["facebook", "youtube", "tiktok", "reddit", "threads"]
+
+_FALLBACK_WORDS = (
+    "việt nam đất nước nhân dân đảng cộng sản chính phủ tự do dân chủ lịch sử "
+    "chiến tranh hòa bình người dân bài viết thông tin sự thật tuyên truyền phản động "
+    "ba que bò đỏ nói xấu bán nước yêu nước biển đông trung quốc mỹ kinh tế"
+).split()
+
+
+def load_vocabulary(sample_path=SAMPLE_DATASET):
+    """Từ vựng tiếng Việt có dấu lấy từ sample_dataset.csv (fallback: danh sách cố định)"""
+    try:
+        df = pd.read_csv(sample_path)
+    except (OSError, ValueError):
+        return list(_FALLBACK_WORDS)
+    text = ' '.join(df[col].dropna().astype(str).str.cat(sep=' ') for col in ('comment_clean', 'summary') if col in df.columns)
+    words = [w for w in re.findall(r'\w+', text.lower()) if not w.isdigit()]
+    return words or list(_FALLBACK_WORDS)
+
+
+def _elongate(word, rng):
+    letters = [i for i, ch in enumerate(word) if ch.isalpha()]
+    if not letters:
+        return word
+    i = letters[-1]
+    return word[:i + 1] + word[i] * rng.randint(2, 6) + word[i + 1:]
+
+
+def generate_comment(rng, vocabulary, abbreviations, abbreviation_by_word):
+    """Sinh một comment kiểu mạng xã hội: dấu, emoji, teencode, URL, kéo dài ký tự, ..."""
+    roll = rng.random()
+    if roll < 0.12:
+        n_words = rng.randint(1, 3)
+    elif roll < 0.995:
+        n_words = int(rng.lognormvariate(2.7, 0.8)) + 1
+    else:
+        n_words = rng.randint(300, 600)
+
+    abbreviation_keys = list(abbreviations)
+    tokens = []
+    for word in rng.choices(vocabulary, k=n_words):
+        r = rng.random()
+        if r < 0.08 and word in abbreviation_by_word:
+            word = abbreviation_by_word[word]
+        elif r < 0.12:
+            word = rng.choice(abbreviation_keys)
+        elif r < 0.15:
+            word = _elongate(word, rng)
+        elif r < 0.17:
+            word = word.capitalize()
+        tokens.append(word)
+
+    extras = rng.random()
+    if extras < 0.20:
+        tokens.insert(rng.randint(0, len(tokens)), rng.choice(EMOJIS) * rng.randint(1, 3))
+    if rng.random() < 0.15:
+        tokens.append(rng.choice(EMOTICONS))
+    if rng.random() < 0.05:
+        tokens.append(f"https://www.{rng.choice(DOMAINS)}/p/{rng.randint(10**6, 10**9)}")
+    if rng.random() < 0.03:
+        tokens.append(rng.choice(DOMAINS))
+    if rng.random() < 0.06:
+        tokens.insert(0, f"@user_{rng.randint(1, 99999)}")
+    if rng.random() < 0.03:
+        tokens.append(f"#{rng.choice(vocabulary)}")
+    if rng.random() < 0.02:
+        tokens.insert(rng.randint(0, len(tokens)), "<br>")
+    if rng.random() < 0.04:
+        tokens.append(rng.choice(UI_INDICATORS))
+    if rng.random() < 0.10:
+        tokens.append(rng.choice(['...', '!!!', '??', ',', '.']))
+    return ' '.join(tokens)
+
+
+def generate_corpus(n_rows, seed=42, sample_path=SAMPLE_DATASET, abbreviations=None):
+    """
+    Sinh DataFrame gồm n_rows comment với các cột giống merged_raw
+    (post_id, post_raw, comment_id, comment_raw, created_date, platform).
+
+    Số comment mỗi post theo phân phối đuôi dài để bước cân bằng có post lớn để xử lý.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    vocabulary = load_vocabulary(sample_path)
+    abbreviations = abbreviations or SYNTHETIC_ABBREVIATIONS
+
+    abbreviation_by_word = {std: slang for slang, std in abbreviations.items() if ' ' not in std}
+    comments = [generate_comment(rng, vocabulary, abbreviations, abbreviation_by_word) for _ in range(n_rows)]
+
+    # Kích thước post theo log-normal: đa số vài chục comment, một số post hàng nghìn
+    post_sizes = np.maximum(1, np_rng.lognormal(4.0, 1.3, n_rows // 20 + 1).astype(int))
+    post_ids = np.repeat(np.arange(len(post_sizes)), post_sizes)[:n_rows]
+    if len(post_ids) < n_rows:
+        post_ids = np.concatenate([post_ids, np.full(n_rows - len(post_ids), len(post_sizes))])
+    post_texts = {pid: ' '.join(rng.choices(vocabulary, k=rng.randint(20, 120))) for pid in np.unique(post_ids)}
+
+    start = np.datetime64('2024-01-01T00:00:00')
+    return pd.DataFrame({
+        'post_id': [f"post_{pid}" for pid in post_ids],
+        'post_raw': [post_texts[pid] for pid in post_ids],
+        'comment_id': [f"c{seed}_{i}" for i in range(n_rows)],
+        'comment_raw': comments,
+        'created_date': (start + np_rng.integers(0, 365 * 24 * 3600, n_rows).astype('timedelta64[s]')).astype(str),
+        'platform': np_rng.choice(PLATFORMS, n_rows),
+    })
+
+
+def parse_size(value):
+    """'10k' / '100k' / '1m' hoặc số dòng"""
+    key = str(value).lower()
+    if key in SIZES:
+        return SIZES[key]
+    try:
+        return int(key.replace('_', ''))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size '{value}' (use {', '.join(SIZES)} or a row count)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Vietnamese comment corpus for benchmarks')
+    parser.add_argument('--size', type=parse_size, default=SIZES['10k'], help='10k, 100k, 1m or a row count')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', '-o', help='Output file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--dictionary-output', help='Also write the synthetic abbreviation dictionary (JSON)')
+    args = parser.parse_args()
+
+    df = generate_corpus(args.size, seed=args.seed)
+    output = Path(args.output) if args.output else BENCH_DIR / "data" / f"corpus_{args.size}.csv"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    suffix = output.suffix.lower()
+    if suffix == '.parquet':
+        df.to_parquet(output, index=False)
+    elif suffix == '.jsonl':
+        df.to_json(output, orient='records', lines=True, force_ascii=False)
+    elif suffix == '.csv':
+        df.to_csv(output, index=False)
+    else:
+        print(f"Lỗi: định dạng {suffix} không được hỗ trợ")
+        sys.exit(1)
+    print(f"Đã sinh {len(df):,} comments ({df['post_id'].nunique():,} posts): {output}")
+
+    if args.dictionary_output:
+        with open(args.dictionary_output, 'w', encoding='utf-8') as f:
+            json.dump(SYNTHETIC_ABBREVIATIONS, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi từ điển teencode: {args.dictionary_output}")
+
+
+if __name__ == "__main__":
+    main()
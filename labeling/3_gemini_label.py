@@ -19,6 +19,14 @@ sys.path.insert(0, str(parent_dir))
 
 # Thêm thư mục cha vào path để import config
 from utils.file_utils import save_excel_file
+from utils.genai_client import configure_genai
+from utils.near_duplicates import assign_clusters, broadcast_labels, first_in_cluster, CLUSTER_COLUMN
+from utils.token_estimator import TokenEstimator, TOKEN_ESTIMATOR_FILENAME, naive_estimate
+from utils.json_repair import parse_json_response
+from utils.quota_coordinator import QuotaCoordinator, QUOTA_DB_ENV
+from utils.api_resilience import (
+    CircuitBreaker, classify_error, backoff_delay, DAILY_QUOTA_COOLDOWN, QUOTA_EXHAUSTED, RATE_LIMITED, SAFETY_BLOCKED
+)
 import config
 
 def parse_args():
@@ -30,16 +38,40 @@ def parse_args():
                         help='Model to use (if not specified, will prompt for selection)')
     parser.add_argument('--auto', '-a', action='store_true',
                         help='Run in full automation mode (no prompts)')
+    parser.add_argument('--broadcast-near-duplicates', action='store_true',
+                        help='Label one comment per near-duplicate cluster and post (cluster_id from 1_first_clean.py '
+                             '--near-duplicates, computed here if missing) and copy its label to the cluster')
+    parser.add_argument('--token-estimator', type=Path,
+                        help='Token estimator samples path (default: token_estimator.sqlite in the version output folder)')
+    parser.add_argument('--quota-db', type=Path,
+                        help=f'API quota ledger shared by every process using the same keys '
+                             f'(default: ${QUOTA_DB_ENV} or ~/.cache/gemini_quota/api_quota.sqlite)')
     return parser.parse_args()
 
 # ---- Rate Limit Management ----
+RATE_LIMIT_COOLDOWN = 10  # Seconds a key is paused after a 429 without a retry hint
+
 class RateLimitManager:
-    """Manages API key rotation and rate limits for Gemini API"""
+    """
+    Manages API key rotation and rate limits for Gemini API.
+
+    Requests are reserved in the quota ledger shared with every other process using
+    the same keys (QuotaCoordinator, sliding 60 s / 24 h windows), so running this
+    step alongside the summarization step does not overrun a key's limits.
+    Each key also has a circuit breaker that takes it out of rotation after repeated failures.
+    """
     
-    def __init__(self, api_keys, model_name="gemini-1.5-flash"):
+    def __init__(self, api_keys, model_name="gemini-1.5-flash", quota_path=None, quota=None):
         self.api_keys = api_keys
         self.key_index = 0
         self.model_name = model_name
+        self.quota_path = quota_path
+        self._quota = quota
+        # Ledger reservation of the request in flight on each key
+        self.reservations = {}
+        # Seconds until a key frees up, set when get_available_key finds none (None: all at daily limit)
+        self.next_wait = None
+        self.breakers = {key: CircuitBreaker() for key in api_keys}
         
         # Current rate limits based on Google AI Studio (Free Tier)
         self.limits = {
@@ -56,24 +88,25 @@ class RateLimitManager:
             "gemini-2.0-flash-lite": {"rpm": 30, "rpd": 200, "tpm": 1000000},
         }
         
-        # Default to gemini-2.5-flash limits if model not found
-        self.current_limits = self.limits.get(model_name, self.limits["gemini-2.5-flash"])
-        
-        # Track usage per key
-        self.usage = {key: {
-            "rpm_count": 0,
-            "rpd_count": 0,
-            "last_minute": datetime.now().minute,
-            "last_day": datetime.now().day
-        } for key in api_keys}
-        
         # Set initial key
         self.set_current_key()
+    
+    @property
+    def current_limits(self):
+        """Limits of the current model (default to gemini-2.5-flash limits if model not found)"""
+        return self.limits.get(self.model_name, self.limits["gemini-2.5-flash"])
+    
+    @property
+    def quota(self):
+        """Quota ledger, opened on first use"""
+        if self._quota is None:
+            self._quota = QuotaCoordinator(self.quota_path)
+        return self._quota
         
     def set_current_key(self):
         """Configure the current API key"""
         current_key = self.api_keys[self.key_index]
-        genai.configure(api_key=current_key)
+        configure_genai(current_key)
         return current_key
     
     def rotate_key(self):
@@ -83,50 +116,50 @@ class RateLimitManager:
         print(f"  → Rotating to API key: ...{current_key[-4:]}")
         return current_key
     
-    def reset_counters_if_needed(self, key):
-        """Reset counters if minute/day has changed"""
-        now = datetime.now()
-        key_usage = self.usage[key]
-        
-        # Reset minute counter if minute changed
-        if now.minute != key_usage["last_minute"]:
-            key_usage["rpm_count"] = 0
-            key_usage["last_minute"] = now.minute
-            
-        # Reset day counter if day changed
-        if now.day != key_usage["last_day"]:
-            key_usage["rpd_count"] = 0
-            key_usage["last_day"] = now.day
-    
-    def check_limits(self, key):
-        """Check if current key exceeds any limits"""
-        self.reset_counters_if_needed(key)
-        key_usage = self.usage[key]
-        
-        if key_usage["rpm_count"] >= self.current_limits["rpm"]:
-            return False, "RPM limit exceeded"
-        
-        if key_usage["rpd_count"] >= self.current_limits["rpd"]:
-            return False, "RPD limit exceeded"
-            
-        return True, "OK"
-    
-    def record_usage(self, key):
-        """Record a request against the current key"""
-        key_usage = self.usage[key]
-        key_usage["rpm_count"] += 1
-        key_usage["rpd_count"] += 1
-    
-    def get_available_key(self):
-        """Find an available key that hasn't exceeded limits"""
+    def record_usage(self, key, tokens=None):
+        """Record a finished request against the key (tokens: actual total tokens if known)"""
+        self.quota.commit(self.reservations.pop(key, None), tokens)
+    
+    def report_result(self, key, error=None):
+        """
+        Update the key's health after a request (error: ApiError, None on success).
+        A 429 pauses the key for every process sharing the ledger, for the server's retry
+        hint when given, and moves on to the next key; other failures count toward the breaker.
+        """
+        if error is None or error.kind == SAFETY_BLOCKED:
+            self.breakers[key].record_success()
+            return
+        if error.kind == QUOTA_EXHAUSTED:
+            seconds = error.retry_after if error.retry_after is not None else DAILY_QUOTA_COOLDOWN
+            self.quota.block(key, self.model_name, seconds, reason="rpd")
+            self.rotate_key()
+            return
+        self.breakers[key].record_failure()
+        if error.kind == RATE_LIMITED:
+            seconds = error.retry_after if error.retry_after is not None else RATE_LIMIT_COOLDOWN
+            self.quota.block(key, self.model_name, seconds, reason="429")
+            self.rotate_key()
+    
+    def get_available_key(self, tokens=0):
+        """Find a key with quota left and reserve one request on it"""
         start_index = self.key_index
+        self.next_wait = None
         
         while True:
             current_key = self.api_keys[self.key_index]
-            available, reason = self.check_limits(current_key)
+            breaker_wait = self.breakers[current_key].wait_time()
+            if breaker_wait > 0:
+                reservation_id, wait, reason = None, breaker_wait, "breaker"
+            else:
+                reservation_id, wait, reason = self.quota.reserve(current_key, self.model_name,
+                                                                  self.current_limits, tokens)
             
-            if available:
+            if reservation_id is not None:
+                self.reservations[current_key] = reservation_id
                 return current_key
+            # Daily quota gone (counted here or blocked by any process): not worth waiting for
+            if reason != "rpd":
+                self.next_wait = wait if self.next_wait is None else min(self.next_wait, wait)
                 
             # If not available, try next key
             self.key_index = (self.key_index + 1) % len(self.api_keys)
@@ -134,30 +167,22 @@ class RateLimitManager:
             # If we've checked all keys and come back to start, none are available
             if self.key_index == start_index:
                 return None
-                
-        return None
     
-    def wait_for_available_key(self):
-        """Wait until an API key becomes available"""
-        key = self.get_available_key()
-        
-        if key:
-            # Key available now
-            self.set_current_key()
-            return key
-            
-        # All keys at rate limit, wait for next minute
-        wait_seconds = 65 - datetime.now().second
-        print(f"  ⏱️ All keys at rate limit. Waiting {wait_seconds}s for reset...")
-        time.sleep(wait_seconds)
-        
-        # Reset minute counters after waiting
-        for key in self.api_keys:
-            self.usage[key]["rpm_count"] = 0
-            self.usage[key]["last_minute"] = datetime.now().minute
+    def wait_for_available_key(self, tokens=0):
+        """Wait until an API key becomes available; None when every key is at its daily limit"""
+        while True:
+            key = self.get_available_key(tokens)
             
-        # Try again
-        return self.get_available_key()
+            if key:
+                # Key available now
+                self.set_current_key()
+                return key
+            if self.next_wait is None:
+                return None
+                
+            # All keys at rate limit, wait until the first one frees up
+            print(f"  ⏱️ All keys at rate limit. Waiting {self.next_wait:.1f}s...")
+            time.sleep(self.next_wait)
 
 # ---- API Keys ----
 # Import API keys from centralized config
@@ -379,6 +404,24 @@ def compare_model_results(version, file1_name, file2_name, output_comparison=Tru
     }
 
 # ---- Main Processing Functions ----
+def build_label_prompt(comments_data, summary_short):
+    """Create the optimized labeling prompt for a batch of {id: comment} entries"""
+    return f"""
+ARTICLE SUMMARY: {summary_short}
+
+COMMENTS TO CLASSIFY:
+{json.dumps(comments_data, ensure_ascii=False, indent=2)}
+
+Classify each comment and respond with JSON format:
+{{
+  "comment_id": "LABEL",
+  "comment_id": "LABEL",
+  ...
+}}
+
+Valid labels: PHAN_DONG, KHONG_PHAN_DONG, KHONG_LIEN_QUAN
+"""
+
 def label_comments_batch(batch_df, summary="", max_retry=3):
     """Label a batch of comments using JSON response format"""
     
@@ -396,26 +439,13 @@ def label_comments_batch(batch_df, summary="", max_retry=3):
     summary_short = compress_text(summary, 200) if summary else "Không có tóm tắt"
     
     # Create optimized prompt
-    prompt = f"""
-ARTICLE SUMMARY: {summary_short}
-
-COMMENTS TO CLASSIFY:
-{json.dumps(comments_data, ensure_ascii=False, indent=2)}
-
-Classify each comment and respond with JSON format:
-{{
-  "comment_id": "LABEL",
-  "comment_id": "LABEL",
-  ...
-}}
-
-Valid labels: PHAN_DONG, KHONG_PHAN_DONG, KHONG_LIEN_QUAN
-"""
+    prompt = build_label_prompt(comments_data, summary_short)
     
+    current_key = None
     for attempt in range(max_retry):
         try:
             # Get available API key respecting rate limits
-            current_key = rate_manager.wait_for_available_key()
+            current_key = rate_manager.wait_for_available_key(estimate_tokens(SYSTEM_INSTRUCTION + "\n" + prompt))
             if not current_key:
                 print("  ❌ No API keys available. All at daily limit.")
                 return {}
@@ -436,26 +466,36 @@ Valid labels: PHAN_DONG, KHONG_PHAN_DONG, KHONG_LIEN_QUAN
             )
             
             # Record usage
-            rate_manager.record_usage(current_key)
+            usage = getattr(response, 'usage_metadata', None)
+            rate_manager.record_usage(current_key, getattr(usage, 'total_token_count', None))
+            rate_manager.report_result(current_key)
             
-            # Parse JSON response
-            try:
-                labels_dict = json.loads(response.text)
-                print(f"  → Labeled {len(labels_dict)} comments")
-                return labels_dict
-            except json.JSONDecodeError as e:
-                print(f"  ⚠️ JSON parse error: {e}")
+            # Feed the token estimator with the real prompt size (system instruction included)
+            if token_estimator is not None and usage is not None:
+                token_estimator.record(SYSTEM_INSTRUCTION + "\n" + prompt, getattr(usage, 'prompt_token_count', 0))
+            
+            # Parse JSON response (lenient: truncated or slightly malformed output keeps its valid labels)
+            labels_dict = parse_json_response(response.text)
+            if not isinstance(labels_dict, dict):
+                print("  ⚠️ JSON parse error: no JSON object in response")
                 return {}
+            print(f"  → Labeled {len(labels_dict)} comments")
+            return labels_dict
                 
         except Exception as e:
-            print(f"  ❌ Error labeling comments (attempt {attempt+1}): {e}")
+            error = classify_error(e)
+            print(f"  ❌ Error labeling comments (attempt {attempt+1}, {error.kind}): {e}")
+            if current_key is not None:
+                rate_manager.report_result(current_key, error)
             
-            # Check if it's a quota or rate limit error
-            error_str = str(e).lower()
-            if "429" in error_str or "quota" in error_str or "rate" in error_str:
-                rate_manager.rotate_key()
-                
-            time.sleep(2)
+            if error.kind == SAFETY_BLOCKED:
+                print("  🚫 Content blocked by safety filter")
+                return {}
+            # Rate-limited keys are paused in the ledger; the next attempt waits for or switches keys
+            if error.kind not in (RATE_LIMITED, QUOTA_EXHAUSTED) and attempt < max_retry - 1:
+                delay = backoff_delay(attempt, error.retry_after)
+                print(f"  ⏳ Retrying in {delay:.1f}s...")
+                time.sleep(delay)
     
     return {}
 
@@ -568,7 +608,29 @@ def post_process_dai_mentions(labels, batch_df):
     
     return labels
 
-def run_optimized_labeling(df, version, input_file, output_file, model_name):
+def near_duplicate_context(df):
+    """Column a comment's label depends on besides its text: clusters are split by it"""
+    if "summary" in df.columns:
+        return "summary"
+    if "post_id" in df.columns:
+        return "post_id"
+    return None
+
+def prepare_near_duplicate_clusters(df):
+    """
+    Ensure cluster_id exists and return (df, mask of the first comment of each cluster).
+    Labels depend on the post's summary, so a cluster spanning several posts is labeled once per post.
+    """
+    if CLUSTER_COLUMN not in df.columns:
+        print("No cluster_id column, computing near-duplicate clusters (MinHash/LSH)...")
+        df = assign_clusters(df, 'comment_raw')
+    # First remaining comment of each cluster and post (the original representative may have been balanced out)
+    is_first = first_in_cluster(df, near_duplicate_context(df))
+    print(f"Near-duplicate clusters: {is_first.sum()} comments to label for {len(df)} rows "
+          f"({len(df) - is_first.sum()} labels broadcast)")
+    return df, is_first
+
+def run_optimized_labeling(df, version, input_file, output_file, model_name, broadcast_near_duplicates=False):
     """Optimized labeling pipeline with JSON responses"""
     # Update rate manager model
     rate_manager.model_name = model_name
@@ -594,6 +656,12 @@ def run_optimized_labeling(df, version, input_file, output_file, model_name):
     if "label" not in df.columns:
         df["label"] = ""
     
+    # Label only one comment per near-duplicate cluster, broadcast afterwards
+    full_df = None
+    if broadcast_near_duplicates:
+        full_df, is_first = prepare_near_duplicate_clusters(df)
+        df = full_df[is_first].copy()
+    
     # Check if summary column exists
     has_summary = "summary" in df.columns
     print(f"Summary column {'found' if has_summary else 'not found'} in input file")
@@ -667,6 +735,12 @@ def run_optimized_labeling(df, version, input_file, output_file, model_name):
                 df.to_excel(temp_output, index=False)
                 print(f"  💾 Saved progress ({batch_idx+1}/{total_batches} batches)")
     
+    if full_df is not None:
+        full_df.loc[df.index, "label"] = df["label"]
+        df = broadcast_labels(full_df, "label", labeled_mask=is_first,
+                              context_column=near_duplicate_context(full_df))
+        print(f"  → Broadcast cluster labels to {(~is_first).sum()} near-duplicate comments")
+    
     # Final save
     output_path.parent.mkdir(parents=True, exist_ok=True)
     df.to_excel(output_path, index=False)
@@ -736,7 +810,7 @@ def demo_optimized_labeling(df, num_items=20):
 def list_available_models():
     """List all available Gemini models"""
     try:
-        genai.configure(api_key=API_KEYS[0])
+        configure_genai(API_KEYS[0])
         models = list(genai.list_models())
         
         print("\n📋 Available Gemini models:")
@@ -751,11 +825,41 @@ def list_available_models():
     except Exception as e:
         print(f"❌ Failed to list models: {e}")
         return []
-def estimate_tokens(text):
-    """Estimate tokens (approx 4 chars = 1 token for Vietnamese)"""
-    if not isinstance(text, str):
-        return 0
-    return max(1, len(text) // 4)
+# Token estimator learned from usage_metadata, created in main() once the model is known
+token_estimator = None
+
+def estimate_tokens(text, fragment=False):
+    """
+    Estimate tokens with the model's calibrated estimator (4 chars = 1 token until enough samples).
+    fragment=True for part of a prompt (e.g. one comment entry), without the per-request overhead.
+    """
+    if token_estimator is not None:
+        return token_estimator.estimate(text, fragment)
+    return naive_estimate(text)
+
+def estimate_batch_tokens(df, sample_size=1000):
+    """
+    Estimate prompt tokens per labeling request from the data itself.
+    
+    Returns:
+        tuple: (average tokens per comment entry, fixed tokens per request)
+    """
+    comments = df["comment_raw"].dropna().astype(str)
+    comments = comments[comments.str.strip() != ""]
+    if len(comments) > sample_size:
+        comments = comments.sample(sample_size, random_state=42)
+    
+    entry_tokens = [
+        estimate_tokens(f'  "{idx}": {json.dumps(compress_text(text.strip(), 300), ensure_ascii=False)},', fragment=True)
+        for idx, text in comments.items()
+    ]
+    avg_tokens_per_comment = sum(entry_tokens) / len(entry_tokens) if entry_tokens else 35
+    
+    summary_short = "Không có tóm tắt"
+    if "summary" in df.columns and df["summary"].notna().any():
+        summary_short = compress_text(str(df["summary"].dropna().iloc[0]), 200)
+    base_tokens = estimate_tokens(SYSTEM_INSTRUCTION + "\n" + build_label_prompt({}, summary_short))
+    return avg_tokens_per_comment, base_tokens
 
 def get_model_rate_limits(model_name):
     """Get rate limits for a specific model"""
@@ -849,15 +953,15 @@ def enhanced_estimate_processing_time(df, model_name, batch_size=50):
     total_tpm = limits.get("tpm", 1000000) * num_keys
     total_rpd = limits.get("rpd", 100) * num_keys
     
-    # Auto-adjust batch size if needed
-    avg_tokens_per_comment = 35  # Conservative estimate
-    base_tokens_per_batch = (avg_tokens_per_comment * batch_size) + 500
+    # Auto-adjust batch size if needed (token sizes from the calibrated estimator)
+    avg_tokens_per_comment, base_tokens = estimate_batch_tokens(df)
+    base_tokens_per_batch = int(avg_tokens_per_comment * batch_size + base_tokens)
     
     # If TPM is tight, reduce effective batch size
     max_batches_per_minute = total_tpm // base_tokens_per_batch
     if max_batches_per_minute < total_rpm:
         # Reduce batch size to fit TPM
-        adjusted_batch_size = max(10, (total_tpm // total_rpm) // avg_tokens_per_comment)
+        adjusted_batch_size = max(10, int(((total_tpm // total_rpm) - base_tokens) // avg_tokens_per_comment))
         print(f"  → Auto-adjusting batch size from {batch_size} to {adjusted_batch_size} for TPM compliance")
         batch_size = adjusted_batch_size
         # Recalculate batches with new batch size
@@ -884,6 +988,7 @@ def enhanced_estimate_processing_time(df, model_name, batch_size=50):
     return {
         'total_comments': total_comments,
         'estimated_batches': estimated_batches,
+        'tokens_per_batch': base_tokens_per_batch,
         'adjusted_batch_size': batch_size,
         'total_rpm_capacity': total_rpm,
         'total_tpm_capacity': total_tpm,
@@ -961,8 +1066,10 @@ def choose_model_with_comparison(df):
         except ValueError:
             print("Please enter a number!")
 
-def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xlsx", model_name=None):
+def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xlsx", model_name=None,
+         broadcast_near_duplicates=False, token_estimator_path=None, quota_db_path=None):
     """Main function to run the optimized labeling pipeline"""
+    global token_estimator
     print("OPTIMIZED GEMINI LABELING PIPELINE")
     print("-----------------------------------")
     
@@ -970,9 +1077,17 @@ def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xls
     if not model_name:
         model_name = choose_model_with_comparison(pd.read_excel(config.get_path(version, "output", filename=input_file)))
     
-    # Set model for rate manager
+    # Set model and quota ledger for rate manager
     rate_manager.model_name = model_name
+    rate_manager.quota_path = quota_db_path
     print(f"Using model: {model_name}")
+    print(f"Quota ledger: {rate_manager.quota.path}")
+    
+    # Token estimator for this model (shared with the summarization step by default)
+    if token_estimator_path is None:
+        token_estimator_path = config.get_path(version, "output", filename=TOKEN_ESTIMATOR_FILENAME)
+    token_estimator = TokenEstimator(token_estimator_path, model_name)
+    print(token_estimator.report())
     
     # Mode selection
     print("Choose mode:")
@@ -1082,7 +1197,11 @@ def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xls
     
     elif mode == "2":
         # Full pipeline - Calculate estimates
-        estimates = enhanced_estimate_processing_time(df, model_name)
+        if broadcast_near_duplicates:
+            df, is_first = prepare_near_duplicate_clusters(df)
+            estimates = enhanced_estimate_processing_time(df[is_first], model_name)
+        else:
+            estimates = enhanced_estimate_processing_time(df, model_name)
         
         # Calculate unique summaries if available
         unique_summaries = 'N/A'
@@ -1095,6 +1214,7 @@ def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xls
         print(f"  - Unique summaries: {unique_summaries}")
         print(f"  - Estimated batches: {estimates['estimated_batches']}")
         print(f"  - Adjusted batch size: {estimates['adjusted_batch_size']}")
+        print(f"  - Estimated tokens per batch: {estimates['tokens_per_batch']:,}")
         print(f"  - API keys: {len(API_KEYS)}")
         print(f"  - Model: {model_name}")
         print(f"  - Total capacity: {estimates['total_rpm_capacity']} RPM, {estimates['total_tpm_capacity']:,} TPM, {estimates['total_rpd_capacity']} RPD")
@@ -1108,8 +1228,10 @@ def main(version, input_file="pre_labeled.xlsx", output_file="gemini_labeled.xls
         
         proceed = input("\nProceed with full labeling? (y/n): ").strip().lower()
         if proceed == "y":
-            labeled_df = run_optimized_labeling(df, version, input_file, output_file, model_name)
+            labeled_df = run_optimized_labeling(df, version, input_file, output_file, model_name,
+                                                broadcast_near_duplicates=broadcast_near_duplicates)
             print("\n✅ Labeling completed successfully!")
+            print(token_estimator.report())
         else:
             print("Full labeling cancelled.")
     
@@ -1175,7 +1297,9 @@ if __name__ == "__main__":
     args = parse_args()
     if args.version:
         main(args.version, args.input or "pre_labeled.xlsx", 
-             args.output or "gemini_labeled.xlsx", args.model)
+             args.output or "gemini_labeled.xlsx", args.model,
+             broadcast_near_duplicates=args.broadcast_near_duplicates,
+             token_estimator_path=args.token_estimator, quota_db_path=args.quota_db)
     else:
         # Interactive mode
         version = input("Enter version (e.g., v1, v2): ").strip()
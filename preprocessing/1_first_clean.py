@@ -1,9 +1,13 @@
 import pandas as pd
+import numpy as np
 import os
 import re
 import argparse
 import unicodedata
 import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
@@ -14,8 +18,49 @@ sys.path.insert(0, str(parent_dir))
 
 # Thêm thư mục cha vào path để import config
 from utils.file_utils import save_excel_file
+from utils.text_cleaning import CommentCleaner
+from utils.chunked_io import iter_chunks, ChunkWriter, STREAM_SUFFIXES
+from utils.keyword_automaton import KeywordAutomaton
+from utils.removal_ledger import RemovalLedger, LEDGER_FILENAME, export_excel
+from utils.clean_cache import CleanCache, CACHE_FILENAME
+from utils.dedup_index import DedupIndex, CLEAN_NAMESPACE, source_key
+from utils.near_duplicates import NearDuplicateDetector, assign_clusters, keep_representatives, NEAR_DUPLICATE_REASON
 import config
 
+# Engine cleaning dùng chung, compile tất cả pattern một lần
+COMMENT_CLEANER = CommentCleaner()
+
+# DANH SÁCH TỪ KHÓA NHẠY CẢM (ưu tiên giữ lại khi cân bằng comments)
+PRESERVE_KEYWORDS = [
+    "phản động", "phản quốc", "phản bội", "đảng cướp", 
+    "ba que", "việt cộng", "bò đỏ", "tàu cộng", "đồ đĩ",
+    "cộng sản", "cộng phỉ", "xứ vẹm", "barwhere",
+    "độc tài", "đàn áp", "nhân quyền",
+    "xhcn", "dcs", "dcsvn", "vnch", "Hồ Tặc", "hochochet", "redbull",
+    "vndcch", "cs", "csvn", "vn", "bọn chệt", "tàu khựa", "v+", "+san"
+]
+
+# Các pattern đặc biệt giữ lại comment ngắn dù ít từ
+SPECIAL_PATTERNS = [
+    # Các ký hiệu đặc biệt
+    "///", "3/", "3///", "3//", "3|||", "\\\\","\\|/",
+    
+    # Các từ viết tắt chính trị quan trọng
+    "cs", "csvn", "dcsvn", "xhcn", "dcs", "vc", "vnch", "vndcch", 
+    "redbull", "bò đỏ", "ba que", "ba sọc", "việt cộng", "vn cộng",
+    "phản động", "đảng trị", "barwhere", "cộng sản", "cộng phỉ", 
+    "tàu cộng", "tàu khựa", "bọn chệt"
+]
+
+# Một automaton Aho–Corasick dùng chung cho cân bằng comments và giữ lại comment ngắn
+KEYWORD_MATCHER = KeywordAutomaton(PRESERVE_KEYWORDS + SPECIAL_PATTERNS)
+PRESERVE_KEYWORD_SET = frozenset(k.lower() for k in PRESERVE_KEYWORDS)
+SPECIAL_PATTERN_SET = frozenset(k.lower() for k in SPECIAL_PATTERNS)
+
+# Một "từ có nghĩa" là token (tách theo khoảng trắng) chứa ít nhất một chữ cái hoặc số,
+# giống count_words nhưng đếm được cho cả cột bằng Series.str.count
+MEANINGFUL_WORD_PATTERN = r'\S*?[a-zA-ZÀ-ỹ0-9]\S*'
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Clean data for social media analysis')
@@ -30,10 +75,38 @@ def parse_args():
                         help='Output file name (without directory)')
     parser.add_argument('--target', '-t', choices=['output', 'merge', 'platform_split', 'pre_summarize'],
                         default='output', help='Target directory to save results')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of worker processes for cleaning and short-comment filtering')
+    
+    # Chế độ streaming cho file lớn (CSV/JSONL/Parquet)
+    parser.add_argument('--stream', action='store_true',
+                        help='Process CSV/JSONL/Parquet input in fixed-size chunks with bounded memory')
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help='Rows per chunk in streaming mode')
+    parser.add_argument('--max-words', type=int, default=300,
+                        help='Streaming mode: drop comments longer than this many words (0 = skip)')
+    parser.add_argument('--max-comments-per-post', type=int, default=0,
+                        help='Streaming mode: balance posts above this many comments (0 = skip)')
+    parser.add_argument('--no-clean-cache', action='store_true',
+                        help='Clean every row again instead of reusing the content-hash clean cache')
+    parser.add_argument('--export-removed-excel', action='store_true',
+                        help='Also export this run\'s removed records from the removal ledger to Excel')
+    parser.add_argument('--max-priority-comments', type=int, default=0,
+                        help='Streaming mode: keep at most this many keyword comments per balanced post (0 = keep all)')
+    parser.add_argument('--dedup-index',
+                        help='Global dedup index (SQLite) shared across versions/platforms; drops comments already kept by earlier runs')
+    parser.add_argument('--near-duplicates', choices=['annotate', 'representative'],
+                        help='MinHash/LSH near-duplicate clusters: add cluster_id columns (annotate, label once and '
+                             'broadcast in 3_gemini_label.py) or keep one comment per cluster (representative)')
+    parser.add_argument('--near-duplicate-threshold', type=float, default=0.8,
+                        help='Estimated Jaccard similarity of character shingles to join a cluster')
     
     return parser.parse_args()
 
-def clean_data(version, source='output', input_filename=None, target='output', output_filename=None):
+def clean_data(version, source='output', input_filename=None, target='output', output_filename=None, workers=1,
+               stream=False, chunk_size=50000, max_words=300, max_comments_per_post=0, max_priority_comments=0,
+               export_removed_excel=False, use_cache=True, dedup_index=None, near_duplicates=None,
+               near_duplicate_threshold=0.8):
     """Đọc file từ nguồn được chỉ định và thực hiện cleaning"""
     
     # Lấy đường dẫn cho version
@@ -68,7 +141,11 @@ def clean_data(version, source='output', input_filename=None, target='output', o
                     results = []
                     for file in excel_files:
                         print(f"\n----- Đang xử lý {file.name} -----")
-                        result = clean_single_file(file, version, target, None)
+                        result = clean_single_file(file, version, target, None, workers=workers,
+                                                   export_removed_excel=export_removed_excel,
+                                                   use_cache=use_cache, dedup_index=dedup_index,
+                                                   near_duplicates=near_duplicates,
+                                                   near_duplicate_threshold=near_duplicate_threshold)
                         if result is not None:
                             results.append(result)
                     return results
@@ -93,26 +170,36 @@ def clean_data(version, source='output', input_filename=None, target='output', o
     target_dir.mkdir(parents=True, exist_ok=True)
     
     # Xác định tên file output
+    # Streaming giữ nguyên định dạng input vì Excel không ghi nối tiếp được
+    output_suffix = input_file.suffix if stream else ".xlsx"
     if not output_filename:
         base_name = input_file.stem
         if "_cleaned" not in base_name:
             base_name += "_cleaned"
-        output_file = target_dir / f"{base_name}.xlsx"
+        output_file = target_dir / f"{base_name}{output_suffix}"
     else:
         output_file = target_dir / output_filename
     
     # Xử lý file
-    return clean_single_file(input_file, version, target, output_file)
+    if stream:
+        return clean_stream(input_file, output_file, chunk_size=chunk_size, max_words=max_words,
+                            max_comments_per_post=max_comments_per_post,
+                            max_priority_comments=max_priority_comments, workers=workers,
+                            export_removed_excel=export_removed_excel, dedup_index=dedup_index,
+                            near_duplicates=near_duplicates, near_duplicate_threshold=near_duplicate_threshold)
+    return clean_single_file(input_file, version, target, output_file, workers=workers,
+                             export_removed_excel=export_removed_excel, use_cache=use_cache,
+                             dedup_index=dedup_index, near_duplicates=near_duplicates,
+                             near_duplicate_threshold=near_duplicate_threshold)
     
-def filter_long_comments(df, max_words=300, save_filtered=True, output_dir=None):
+def filter_long_comments(df, max_words=300, ledger=None):
     """
     Lọc bỏ các comment quá dài và thống kê
     
     Args:
         df: DataFrame chứa dữ liệu
         max_words: Số từ tối đa cho phép (default: 300)
-        save_filtered: Có lưu file backup các comment dài không
-        output_dir: Thư mục để lưu backup file
+        ledger: RemovalLedger để ghi lại các comment dài bị loại (None = không ghi)
     
     Returns:
         tuple: (filtered_df, removed_df)
@@ -127,7 +214,7 @@ def filter_long_comments(df, max_words=300, save_filtered=True, output_dir=None)
     
     # Tính số từ cho comment_raw
     print("Đang tính số từ cho tất cả comments...")
-    df['word_count_temp'] = df['comment_raw'].apply(count_words)
+    df['word_count_temp'] = count_words_series(df['comment_raw'])
     
     # Thống kê trước khi lọc
     total_comments = len(df)
@@ -155,16 +242,11 @@ def filter_long_comments(df, max_words=300, save_filtered=True, output_dir=None)
             comment_preview = str(row['comment_raw'])[:150] + "..." if len(str(row['comment_raw'])) > 150 else str(row['comment_raw'])
             print(f"  {i+1}. {word_count} từ: {comment_preview}")
         
-        # Lưu các comment dài để kiểm tra
-        if save_filtered and output_dir:
-            try:
-                long_comments_file = output_dir / f"long_comments_removed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                # Thêm cột lý do xóa
-                long_comments['removal_reason'] = f'Comment longer than {max_words} words'
-                long_comments[['comment_raw', 'word_count_temp', 'removal_reason']].to_excel(long_comments_file, index=False)
-                print(f"  - Đã lưu {long_count} comments dài vào: {long_comments_file}")
-            except Exception as e:
-                print(f"  - Không thể lưu file backup: {e}")
+        # Ghi các comment dài vào removal ledger để kiểm tra
+        long_comments['removal_reason'] = f'Comment longer than {max_words} words'
+        if ledger is not None:
+            ledger.record(long_comments, stage='long_comments')
+            print(f"  - Đã ghi {long_count} comments dài vào ledger: {ledger.path}")
     
     # Lọc bỏ comments dài
     filtered_df = df[~long_comments_mask].copy()
@@ -177,12 +259,20 @@ def filter_long_comments(df, max_words=300, save_filtered=True, output_dir=None)
     
     return filtered_df, long_comments
 
-def balance_comments_advanced(df, max_comments_per_post=1000):
+def balance_comments_advanced(df, max_comments_per_post=1000, max_priority_comments=None, random_state=42):
     """
-    Cân bằng số lượng comment cho mỗi bài post với logic mới:
-    1. Tìm comments có từ khóa nhạy cảm
-    2. Cho phép user chọn số lượng random từ comments có từ khóa
-    3. Random sampling các comment còn lại để đạt max_comments_per_post
+    Cân bằng số lượng comment cho mỗi bài post:
+    1. Tìm comments có từ khóa nhạy cảm (ưu tiên giữ lại)
+    2. Nếu max_priority_comments được đặt, chỉ giữ tối đa chừng đó comments có từ khóa mỗi post
+       (None = giữ tất cả comments có từ khóa)
+    3. Random các comment còn lại để đạt max_comments_per_post
+    
+    Mỗi comment nhận một khóa ngẫu nhiên (seed random_state) và được xếp hạng trong
+    (post, có/không từ khóa); top-K mỗi post được chọn bằng một mask cho toàn bộ
+    DataFrame thay vì lặp và concat theo từng post. Cùng seed cho cùng kết quả.
+    
+    Returns:
+        tuple: (balanced_df, removed_df) - removed_df có cột post_id_removed, None nếu không xóa gì
     """
     print(f"Đang cân bằng số lượng comment (chỉ xử lý posts có > {max_comments_per_post} comments)...")
     
@@ -192,28 +282,14 @@ def balance_comments_advanced(df, max_comments_per_post=1000):
         print("Không tìm thấy cột cần thiết để cân bằng comment")
         return df, None
     
-    # DANH SÁCH TỪ KHÓA NHẠY CẢM
-    preserve_keywords = [
-        "phản động", "phản quốc", "phản bội", "đảng cướp", 
-        "ba que", "việt cộng", "bò đỏ", "tàu cộng", "đồ đĩ",
-        "cộng sản", "cộng phỉ", "xứ vẹm", "barwhere",
-        "độc tài", "đàn áp", "nhân quyền",
-        "xhcn", "dcs", "dcsvn", "vnch", "Hồ Tặc", "hochochet", "redbull",
-        "vndcch", "cs", "csvn", "vn", "bọn chệt", "tàu khựa", "v+", "+san"
-    ]
-    
-    # Tạo pattern để tìm từ khóa nhạy cảm
-    pattern = '|'.join([re.escape(keyword) for keyword in preserve_keywords])
-    
-    # Thêm cột đánh dấu comment có từ khóa nhạy cảm
-    df['has_preserve_keywords'] = df['comment_raw'].astype(str).str.contains(
-        pattern, na=False, regex=True, case=False
-    )
+    # Thêm cột đánh dấu comment có từ khóa nhạy cảm (PRESERVE_KEYWORDS)
+    df['has_preserve_keywords'] = df['comment_raw'].astype(str).map(has_preserve_keywords).astype(bool)
     
     # Thống kê trước khi cân bằng
-    post_counts = df['post_id'].value_counts()
+    post_sizes = df.groupby('post_id', sort=False)['post_id'].transform('size')
+    over_mask = (post_sizes > max_comments_per_post).to_numpy()
     total_comments = len(df)
-    posts_over_limit = sum(post_counts > max_comments_per_post)
+    posts_over_limit = df.loc[over_mask, 'post_id'].nunique()
     total_preserve_keywords = df['has_preserve_keywords'].sum()
     
     print(f"Tổng số comment ban đầu: {total_comments}")
@@ -225,114 +301,46 @@ def balance_comments_advanced(df, max_comments_per_post=1000):
         df = df.drop('has_preserve_keywords', axis=1)
         return df, None
     
-    # HỎI USER VỀ CHIẾN LƯỢC LẤY COMMENTS CÓ TỪ KHÓA
-    print(f"\nCHIẾN LƯỢC LẤY COMMENTS CÓ TỪ KHÓA NHẠY CẢM:")
-    print(f"  1. Lấy tất cả comments có từ khóa (như trước)")
-    print(f"  2. Chỉ lấy một số lượng random từ comments có từ khóa")
+    if max_priority_comments:
+        print(f"Chiến lược: chỉ giữ tối đa {max_priority_comments} comments có từ khóa mỗi post (random)")
+    else:
+        print("Chiến lược: giữ tất cả comments có từ khóa")
     
-    strategy_choice = input("Chọn chiến lược (1 hoặc 2): ").strip()
+    # Xếp hạng ngẫu nhiên trong từng (post, nhóm từ khóa) chỉ cho các post vượt giới hạn
+    rng = np.random.default_rng(random_state)
+    ranked = pd.DataFrame({
+        'post_id': df['post_id'].to_numpy()[over_mask],
+        'priority': df['has_preserve_keywords'].to_numpy()[over_mask],
+        'key': rng.random(int(over_mask.sum())),
+    })
+    ranked['rank'] = ranked.sort_values('key').groupby(['post_id', 'priority'], sort=False).cumcount()
     
-    max_priority_comments = None
-    if strategy_choice == "2":
-        max_priority_input = input("Nhập số lượng tối đa comments có từ khóa muốn giữ mỗi post (VD: 50): ").strip()
-        try:
-            max_priority_comments = int(max_priority_input)
-            max_priority_comments = max(1, max_priority_comments)  # Tối thiểu 1
-            print(f"Sẽ chỉ lấy tối đa {max_priority_comments} comments có từ khóa mỗi post")
-        except ValueError:
-            print("Giá trị không hợp lệ, sử dụng chiến lược 1 (lấy tất cả)")
-            strategy_choice = "1"
-    
-    # Xử lý từng post riêng biệt
-    balanced_dfs = []
-    removed_comments_df = []
-    total_removed = 0
-    posts_processed = 0
-    posts_unchanged = 0
-    
-    for post_id, post_df in df.groupby('post_id'):
-        comment_count = len(post_df)
-        
-        # CHỈ XỬ LÝ CÁC POST CÓ > max_comments_per_post COMMENTS
-        if comment_count <= max_comments_per_post:
-            balanced_dfs.append(post_df)
-            posts_unchanged += 1
-            continue
-        
-        posts_processed += 1
-        
-        # Phân loại comments
-        priority_comments = post_df[post_df['has_preserve_keywords']].copy()
-        normal_comments = post_df[~post_df['has_preserve_keywords']].copy()
-        
-        priority_count = len(priority_comments)
-        normal_count = len(normal_comments)
-        
-        print(f"  Post {post_id}: {comment_count} comments ({priority_count} có từ khóa + {normal_count} thường) → cần giảm xuống {max_comments_per_post}")
-        
-        # Xác định số lượng priority comments sẽ giữ
-        if strategy_choice == "2" and max_priority_comments and priority_count > max_priority_comments:
-            # Random select từ priority comments
-            selected_priority = priority_comments.sample(max_priority_comments, random_state=42)
-            removed_priority = priority_comments.drop(selected_priority.index)
-            priority_count_keep = max_priority_comments
-            print(f"    → Chỉ giữ {max_priority_comments}/{priority_count} comments có từ khóa (random)")
-        else:
-            # Giữ tất cả priority comments
-            selected_priority = priority_comments.copy()
-            removed_priority = pd.DataFrame()
-            priority_count_keep = priority_count
-            print(f"    → Giữ tất cả {priority_count} comments có từ khóa")
-        
-        # Tính toán remaining slots cho normal comments
-        remaining_slots = max_comments_per_post - priority_count_keep
-        
-        if remaining_slots <= 0:
-            # Không còn chỗ cho normal comments
-            kept_comments = selected_priority
-            removed_normal = normal_comments
-            print(f"    → Không còn chỗ cho comments thường, loại bỏ tất cả {normal_count} comments thường")
-        elif remaining_slots >= normal_count:
-            # Đủ chỗ cho tất cả normal comments
-            kept_comments = pd.concat([selected_priority, normal_comments])
-            removed_normal = pd.DataFrame()
-            print(f"    → Đủ chỗ cho tất cả {normal_count} comments thường")
-        else:
-            # Phải random normal comments
-            kept_normal = normal_comments.sample(remaining_slots, random_state=42)
-            kept_comments = pd.concat([selected_priority, kept_normal])
-            removed_normal = normal_comments.drop(kept_normal.index)
-            print(f"    → Giữ {remaining_slots}/{normal_count} comments thường (random)")
-        
-        # Combine removed comments
-        removed_comments = pd.concat([removed_priority, removed_normal]) if len(removed_priority) > 0 or len(removed_normal) > 0 else pd.DataFrame()
-        
-        # Thêm lý do xóa cho removed comments
-        if len(removed_comments) > 0:
-            removed_comments = removed_comments.copy()
-            removed_comments['post_id_removed'] = post_id
-            removed_comments_df.append(removed_comments)
-        
-        balanced_dfs.append(kept_comments)
-        total_removed += len(removed_comments)
-        
-        print(f"    → Kết quả: Giữ {len(kept_comments)}, loại bỏ {len(removed_comments)} comments")
+    keep_priority = ranked['priority']
+    if max_priority_comments:
+        keep_priority = keep_priority & (ranked['rank'] < max_priority_comments)
+    
+    # Số slot còn lại cho comments thường sau khi đã giữ comments có từ khóa
+    kept_priority_counts = keep_priority.groupby(ranked['post_id'], sort=False).transform('sum')
+    remaining_slots = (max_comments_per_post - kept_priority_counts).clip(lower=0)
+    keep_normal = ~ranked['priority'] & (ranked['rank'] < remaining_slots)
     
-    # Kết hợp tất cả lại
-    balanced_df = pd.concat(balanced_dfs, ignore_index=True)
-    balanced_df = balanced_df.drop('has_preserve_keywords', axis=1)
+    keep_mask = np.ones(len(df), dtype=bool)
+    keep_mask[over_mask] = (keep_priority | keep_normal).to_numpy()
+    
+    balanced_df = df[keep_mask].drop('has_preserve_keywords', axis=1).reset_index(drop=True)
     
-    # Tạo DataFrame cho removed comments
     removed_df_combined = None
-    if removed_comments_df:
-        removed_df_combined = pd.concat(removed_comments_df, ignore_index=True)
-        removed_df_combined = removed_df_combined.drop('has_preserve_keywords', axis=1)
+    total_removed = int((~keep_mask).sum())
+    if total_removed > 0:
+        removed_df_combined = df[~keep_mask].drop('has_preserve_keywords', axis=1).reset_index(drop=True)
+        removed_df_combined['post_id_removed'] = removed_df_combined['post_id']
     
     # Thống kê sau khi cân bằng
     final_post_counts = balanced_df['post_id'].value_counts()
     print(f"\nKết quả cân bằng:")
-    print(f"  - Số posts được xử lý: {posts_processed}")
-    print(f"  - Số posts giữ nguyên (≤{max_comments_per_post} comments): {posts_unchanged}")
+    print(f"  - Số posts được xử lý: {posts_over_limit}")
+    print(f"  - Số posts giữ nguyên (≤{max_comments_per_post} comments): {df['post_id'].nunique() - posts_over_limit}")
+    print(f"  - Comments có từ khóa bị loại: {int((ranked['priority'] & ~keep_priority).sum())}")
     print(f"  - Đã loại bỏ {total_removed} comments ({total_removed/total_comments*100:.1f}%)")
     print(f"  - Dataset mới: {len(balanced_df)} comments")
     print(f"  - Trung bình comments/post: {final_post_counts.mean():.1f}")
@@ -341,7 +349,392 @@ def balance_comments_advanced(df, max_comments_per_post=1000):
     
     return balanced_df, removed_df_combined
 
-def clean_single_file(input_file, version, target, output_file=None):
+def ask_max_priority_comments():
+    """Hỏi user chiến lược lấy comments có từ khóa nhạy cảm (None = lấy tất cả)"""
+    print(f"\nCHIẾN LƯỢC LẤY COMMENTS CÓ TỪ KHÓA NHẠY CẢM:")
+    print(f"  1. Lấy tất cả comments có từ khóa (như trước)")
+    print(f"  2. Chỉ lấy một số lượng random từ comments có từ khóa")
+    
+    strategy_choice = input("Chọn chiến lược (1 hoặc 2): ").strip()
+    if strategy_choice != "2":
+        return None
+    
+    max_priority_input = input("Nhập số lượng tối đa comments có từ khóa muốn giữ mỗi post (VD: 50): ").strip()
+    try:
+        max_priority_comments = max(1, int(max_priority_input))  # Tối thiểu 1
+        print(f"Sẽ chỉ lấy tối đa {max_priority_comments} comments có từ khóa mỗi post")
+        return max_priority_comments
+    except ValueError:
+        print("Giá trị không hợp lệ, sử dụng chiến lược 1 (lấy tất cả)")
+        return None
+
+def filter_short_comments(df, word_counts=None):
+    """
+    Lọc các comment có số từ <= 3 (trừ các special pattern)
+    
+    Số từ được tính một lần cho cả cột (hoặc truyền sẵn qua word_counts) rồi dùng lại
+    cho mask giữ/xóa và lý do xóa; chỉ các comment ngắn mới được quét special pattern.
+    
+    Returns:
+        tuple: (kept_df, removed_df) - removed_df có cột removal_reason
+    """
+    if len(df) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+    
+    comments = df['comment_raw'] if 'comment_raw' in df.columns else pd.Series('', index=df.index)
+    if word_counts is None:
+        word_counts = count_words_series(comments)
+    is_text = is_text_series(comments)
+    
+    # Comment ngắn vẫn được giữ nếu chứa special pattern
+    keep_mask = is_text & (word_counts > 3)
+    short_mask = is_text & ~keep_mask
+    if short_mask.any():
+        keep_mask[short_mask] = comments[short_mask].map(is_special_pattern).astype(bool)
+    
+    # Tạo DataFrame chứa các record bị xóa để backup, kèm lý do xóa
+    short_removed_df = df[~keep_mask].copy() if not keep_mask.all() else pd.DataFrame()
+    if len(short_removed_df) > 0:
+        short_removed_df['removal_reason'] = get_removal_reasons(
+            word_counts[~keep_mask], is_text[~keep_mask]
+        )
+    
+    kept_df = df[keep_mask] if keep_mask.any() else pd.DataFrame()
+    
+    return kept_df, short_removed_df
+
+def clean_and_filter_chunk(chunk):
+    """Worker: cleaning comment_raw rồi lọc comment ngắn cho một chunk"""
+    chunk = chunk.copy()
+    chunk['comment_raw'] = COMMENT_CLEANER.clean_many(chunk['comment_raw'])
+    return filter_short_comments(chunk)
+
+def parallel_clean_and_filter(df, workers, chunk_size=None, executor=None, verbose=True):
+    """
+    Chia DataFrame thành các chunk, cleaning + lọc comment ngắn trong process pool
+    
+    Kết quả được ghép lại theo đúng thứ tự ban đầu nên giống hệt đường chạy tuần tự.
+    Có thể truyền executor có sẵn để dùng lại pool giữa nhiều lần gọi.
+    
+    Returns:
+        tuple: (kept_df, removed_df)
+    """
+    if chunk_size is None:
+        # Vài chunk cho mỗi worker để cân bằng tải giữa các process
+        chunk_size = max(1, -(-len(df) // (workers * 4)))
+    chunks = [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+    
+    if verbose:
+        print(f"  - Chia {len(df):,} dòng thành {len(chunks)} chunk cho {workers} workers...")
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as own_executor:
+            # executor.map trả kết quả theo thứ tự chunk
+            results = list(own_executor.map(clean_and_filter_chunk, chunks))
+    else:
+        results = list(executor.map(clean_and_filter_chunk, chunks))
+    
+    kept_parts = [kept for kept, _ in results if len(kept) > 0]
+    removed_parts = [removed for _, removed in results if len(removed) > 0]
+    kept_df = pd.concat(kept_parts) if kept_parts else pd.DataFrame()
+    removed_df = pd.concat(removed_parts) if removed_parts else pd.DataFrame()
+    return kept_df, removed_df
+
+def clean_texts_chunk(texts):
+    """Worker: cleaning một list comment"""
+    return COMMENT_CLEANER.clean_many(texts)
+
+def clean_with_cache(comments, cache, workers=1):
+    """
+    Cleaning cột comment qua CleanCache: chỉ các comment chưa có trong cache
+    (theo hash nội dung + CLEANER_VERSION) mới được cleaning và đếm từ.
+    
+    Returns:
+        tuple: (cleaned Series, word_counts Series) cùng index với comments
+    """
+    is_text = is_text_series(comments)
+    texts = comments[is_text]
+    unique_texts = list(pd.unique(texts.to_numpy()))
+    keys = cache.keys_for(unique_texts)
+    found = cache.get_many(keys)
+    
+    miss_keys = [key for key in keys if key not in found]
+    miss_texts = [text for text, key in zip(unique_texts, keys) if key not in found]
+    if miss_texts:
+        if workers and workers > 1 and len(miss_texts) > workers:
+            chunk_size = -(-len(miss_texts) // (workers * 4))
+            chunks = [miss_texts[start:start + chunk_size] for start in range(0, len(miss_texts), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                cleaned_misses = [text for part in executor.map(clean_texts_chunk, chunks) for text in part]
+        else:
+            cleaned_misses = COMMENT_CLEANER.clean_many(miss_texts)
+        miss_counts = count_words_series(pd.Series(cleaned_misses, dtype=object)).tolist()
+        cache.put_many(zip(miss_keys, cleaned_misses, miss_counts))
+        found.update(zip(miss_keys, zip(cleaned_misses, miss_counts)))
+    
+    cleaned_by_text = {text: found[key][0] for text, key in zip(unique_texts, keys)}
+    counts_by_text = {text: found[key][1] for text, key in zip(unique_texts, keys)}
+    
+    # Giá trị không phải chuỗi được minimal_clean trả về "" (0 từ)
+    cleaned = pd.Series("", index=comments.index, dtype=object)
+    word_counts = pd.Series(0, index=comments.index, dtype='int64')
+    cleaned[is_text] = texts.map(cleaned_by_text)
+    word_counts[is_text] = texts.map(counts_by_text).astype('int64')
+    return cleaned, word_counts
+
+def apply_near_duplicates(df, mode, threshold=0.8):
+    """
+    Gom comment gần trùng thành cluster (MinHash/LSH trên comment_raw đã clean)
+    
+    Args:
+        mode: 'annotate' (chỉ thêm cột cluster) hoặc 'representative' (giữ một comment mỗi cluster)
+        
+    Returns:
+        tuple: (df, removed_df)
+    """
+    start_time = time.perf_counter()
+    df = assign_clusters(df, 'comment_raw', NearDuplicateDetector(threshold=threshold))
+    elapsed = time.perf_counter() - start_time
+    
+    n_clusters = df['cluster_id'].nunique()
+    print(f"  - {len(df):,} comments → {n_clusters:,} clusters "
+          f"({(df['cluster_size'] > 1).sum():,} comments thuộc cluster > 1)")
+    if elapsed > 0:
+        print(f"  - Throughput: {len(df)/elapsed:,.0f} rows/sec")
+    
+    if mode == 'representative':
+        df, removed_df = keep_representatives(df)
+        print(f"  - Giữ một comment mỗi cluster, loại {len(removed_df):,} comments")
+        return df.reset_index(drop=True), removed_df
+    return df, pd.DataFrame()
+
+def near_duplicates_stream(output_file, ledger, mode, threshold=0.8, chunk_size=50000, dedup_index=None):
+    """
+    Pass gom cluster gần trùng cho chế độ streaming
+    
+    Cluster được tính trên toàn bộ output nên pass này KHÔNG bị giới hạn bởi chunk_size:
+    cột comment_raw của mọi dòng, MinHash signature của mỗi text duy nhất (256 byte)
+    và các cột cluster (khoảng 30 byte mỗi dòng) cùng nằm trong bộ nhớ, tức tuyến
+    tính theo số comment. Chia theo chunk thì comment gần trùng nằm ở hai chunk khác
+    nhau sẽ không được gộp. Output được ghi lại theo từng chunk với các cột cluster
+    (và bỏ comment không đại diện nếu cần).
+    """
+    texts = [chunk['comment_raw'] for chunk in iter_chunks(output_file, chunk_size)]
+    texts = pd.concat(texts, ignore_index=True) if texts else pd.Series(dtype=object)
+    clustered = assign_clusters(texts.to_frame('comment_raw'), 'comment_raw', NearDuplicateDetector(threshold=threshold))
+    cluster_columns = clustered.drop(columns=['comment_raw'])
+    del texts, clustered
+    print(f"  - {len(cluster_columns):,} comments → {cluster_columns['cluster_id'].nunique():,} clusters")
+    
+    clustered_file = output_file.with_name(f"{output_file.stem}.clustering{output_file.suffix}")
+    removed_count = 0
+    position = 0
+    with ChunkWriter(clustered_file) as writer:
+        for chunk in iter_chunks(output_file, chunk_size):
+            columns = cluster_columns.iloc[position:position + len(chunk)]
+            position += len(chunk)
+            for column in columns.columns:
+                chunk[column] = columns[column].to_numpy()
+            if mode == 'representative':
+                chunk, removed_df = keep_representatives(chunk)
+                if len(removed_df) > 0:
+                    ledger.record(removed_df, stage='near_duplicates')
+                    if dedup_index is not None:
+                        dedup_index.remove(removed_df, 'comment_raw')
+                    removed_count += len(removed_df)
+            writer.write(chunk)
+    
+    os.replace(clustered_file, output_file)
+    return removed_count
+
+def balance_stream(output_file, ledger, max_comments_per_post, chunk_size=50000, max_priority_comments=None,
+                   dedup_index=None):
+    """
+    Pass thứ hai của chế độ streaming: cân bằng comments trên output đã lọc
+    
+    Chỉ giữ trong bộ nhớ các dòng thuộc post vượt giới hạn; các post khác được
+    ghi thẳng ra file mới theo từng chunk.
+    """
+    # Pass A: đếm comments mỗi post, chỉ đọc từng chunk
+    post_counts = Counter()
+    for chunk in iter_chunks(output_file, chunk_size):
+        if 'post_id' not in chunk.columns:
+            print("Không tìm thấy cột post_id, bỏ qua bước cân bằng comments")
+            return 0
+        post_counts.update(chunk['post_id'].value_counts().to_dict())
+    
+    over_limit = {post_id for post_id, count in post_counts.items() if count > max_comments_per_post}
+    print(f"Số bài post có > {max_comments_per_post} comment: {len(over_limit)}")
+    if not over_limit:
+        return 0
+    
+    # Pass B: ghi thẳng post bình thường, gom post vượt giới hạn để cân bằng
+    balanced_file = output_file.with_name(f"{output_file.stem}.balancing{output_file.suffix}")
+    held_chunks = []
+    with ChunkWriter(balanced_file) as balanced_writer:
+        for chunk in iter_chunks(output_file, chunk_size):
+            over_mask = chunk['post_id'].isin(over_limit)
+            balanced_writer.write(chunk[~over_mask])
+            if over_mask.any():
+                held_chunks.append(chunk[over_mask])
+        
+        held_df = pd.concat(held_chunks, ignore_index=True)
+        del held_chunks
+        balanced_df, balance_removed_df = balance_comments_advanced(
+            held_df, max_comments_per_post=max_comments_per_post, max_priority_comments=max_priority_comments
+        )
+        balanced_writer.write(balanced_df)
+    
+    removed_count = 0
+    if balance_removed_df is not None and len(balance_removed_df) > 0:
+        balance_removed_df['removal_reason'] = f'Balanced - exceeded max {max_comments_per_post} comments per post'
+        ledger.record(balance_removed_df, stage='balancing')
+        if dedup_index is not None:
+            # Các comment này đã được thêm vào index ở pass đầu
+            dedup_index.remove(balance_removed_df, 'comment_raw')
+        removed_count = len(balance_removed_df)
+    
+    os.replace(balanced_file, output_file)
+    return removed_count
+
+def clean_stream(input_file, output_file, chunk_size=50000, max_words=300, max_comments_per_post=0, workers=1,
+                 max_priority_comments=0, export_removed_excel=False, dedup_index=None, near_duplicates=None,
+                 near_duplicate_threshold=0.8):
+    """
+    Chế độ streaming cho file lớn (CSV/JSONL/Parquet)
+    
+    Mỗi chunk được lọc comment dài, cleaning và lọc comment ngắn rồi ghi nối tiếp
+    ra output và removal ledger, nên bộ nhớ chỉ phụ thuộc chunk_size.
+    Cân bằng comments mỗi post (nếu bật) là pass thứ hai trên output đã lọc.
+    Với dedup_index, comment đã giữ được thêm vào index ngay sau mỗi chunk (để bắt
+    trùng giữa các chunk) và được gỡ lại nếu bị loại khi cân bằng.
+    Gom cluster gần trùng (nếu bật) là một pass riêng trước khi cân bằng; pass này
+    giữ cột comment_raw của toàn bộ output trong bộ nhớ (xem near_duplicates_stream).
+    """
+    print(f"Input file: {input_file}")
+    print(f"Output file: {output_file}")
+    print(f"Streaming: chunk {chunk_size:,} dòng, {workers} worker(s)")
+    
+    if not input_file.exists():
+        print(f"Lỗi: Không tìm thấy file input: {input_file}")
+        return None
+    if input_file.suffix.lower() not in STREAM_SUFFIXES or output_file.suffix.lower() not in STREAM_SUFFIXES:
+        print(f"Lỗi: Chế độ streaming chỉ hỗ trợ {', '.join(STREAM_SUFFIXES)}")
+        return None
+    
+    ledger = RemovalLedger(output_file.parent / LEDGER_FILENAME, source_file=input_file.name)
+    total_rows = 0
+    kept_rows = 0
+    reason_counts = Counter()
+    start_time = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    index = DedupIndex(dedup_index, CLEAN_NAMESPACE) if dedup_index else None
+    index_source = source_key(input_file)
+    if index is not None:
+        released = index.remove_source(index_source)
+        if released:
+            print(f"Dedup index: gỡ {released:,} comment của lần chạy trước trên file này")
+    
+    try:
+        with ChunkWriter(output_file) as kept_writer:
+            for chunk_idx, chunk in enumerate(iter_chunks(input_file, chunk_size)):
+                if 'comment_raw' not in chunk.columns:
+                    print("  - Không tìm thấy cột comment_raw")
+                    return None
+                total_rows += len(chunk)
+                
+                # BƯỚC 1: lọc comment dài
+                if max_words:
+                    long_mask = count_words_series(chunk['comment_raw']) > max_words
+                    if long_mask.any():
+                        long_removed_df = chunk[long_mask].copy()
+                        long_removed_df['removal_reason'] = f'Comment longer than {max_words} words'
+                        ledger.record(long_removed_df, stage='long_comments')
+                        reason_counts[long_removed_df['removal_reason'].iloc[0]] += len(long_removed_df)
+                        chunk = chunk[~long_mask]
+                
+                # BƯỚC 2 + 3: cleaning và lọc comment ngắn
+                if executor is not None:
+                    kept_df, short_removed_df = parallel_clean_and_filter(chunk, workers, executor=executor, verbose=False)
+                else:
+                    chunk = chunk.copy()
+                    chunk['comment_raw'] = COMMENT_CLEANER.clean_many(chunk['comment_raw'])
+                    kept_df, short_removed_df = filter_short_comments(chunk)
+                
+                if len(short_removed_df) > 0:
+                    ledger.record(short_removed_df, stage='short_comments')
+                    reason_counts.update(short_removed_df['removal_reason'].value_counts().to_dict())
+                
+                # Loại comment đã có trong dedup index toàn cục
+                if index is not None:
+                    kept_df, dedup_removed_df = index.split_new(kept_df, 'comment_raw')
+                    if len(dedup_removed_df) > 0:
+                        ledger.record(dedup_removed_df, stage='dedup')
+                        reason_counts.update(dedup_removed_df['removal_reason'].value_counts().to_dict())
+                    index.add(kept_df, 'comment_raw', source=index_source)
+                kept_writer.write(kept_df)
+                kept_rows += len(kept_df)
+                
+                print(f"  - Chunk {chunk_idx+1}: đã xử lý {total_rows:,} dòng, giữ lại {kept_rows:,}")
+        
+        # Gom cluster gần trùng trên toàn bộ output đã lọc
+        if near_duplicates and kept_rows > 0:
+            print("\n" + "="*60)
+            print("GOM CLUSTER COMMENT GẦN TRÙNG (MINHASH/LSH)")
+            print("="*60)
+            print(f"  - Pass này giữ comment_raw của {kept_rows:,} dòng trong bộ nhớ (không giới hạn theo chunk)")
+            near_removed = near_duplicates_stream(output_file, ledger, near_duplicates, near_duplicate_threshold,
+                                                  chunk_size, dedup_index=index)
+            if near_removed:
+                reason_counts[NEAR_DUPLICATE_REASON] += near_removed
+                kept_rows -= near_removed
+        
+        # BƯỚC 4: cân bằng comments (pass thứ hai)
+        if max_comments_per_post and kept_rows > 0:
+            print("\n" + "="*60)
+            print("BƯỚC 4: CÂN BẰNG COMMENTS CHO MỖI POST (PASS THỨ HAI)")
+            print("="*60)
+            balance_removed = balance_stream(output_file, ledger, max_comments_per_post, chunk_size,
+                                             max_priority_comments=max_priority_comments or None,
+                                             dedup_index=index)
+            if balance_removed:
+                reason_counts[f'Balanced - exceeded max {max_comments_per_post} comments per post'] += balance_removed
+                kept_rows -= balance_removed
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if index is not None:
+            index.close()
+    
+    elapsed = time.perf_counter() - start_time
+    total_removed = sum(reason_counts.values())
+    print(f"\nCleaning done!")
+    print(f"Tổng số dòng ban đầu: {total_rows:,}")
+    print(f"Tổng số dòng sau khi cleaning: {kept_rows:,}")
+    if total_rows:
+        print(f"Tổng số record bị xóa: {total_removed:,} ({total_removed/total_rows*100:.1f}%)")
+    if elapsed > 0:
+        print(f"Throughput: {total_rows/elapsed:,.0f} rows/sec")
+    if reason_counts:
+        print(f"Removal ledger: {ledger.path} (run {ledger.run_id})")
+        print("\nThống kê lý do xóa:")
+        for reason, count in reason_counts.most_common():
+            print(f"  - {reason}: {count:,} records")
+        if export_removed_excel:
+            export_removed_records(ledger, output_file)
+    
+    return {'input_rows': total_rows, 'kept_rows': kept_rows, 'removed_rows': total_removed,
+            'output_file': output_file, 'ledger_file': ledger.path, 'run_id': ledger.run_id}
+
+def export_removed_records(ledger, output_file):
+    """Xuất các record bị xóa của run hiện tại từ ledger ra Excel"""
+    excel_file = output_file.parent / f"{output_file.stem}_removed_records.xlsx"
+    print(f"\nĐang xuất records bị xóa của run {ledger.run_id} ra Excel: {excel_file}")
+    count = export_excel(ledger.path, excel_file, run_id=ledger.run_id)
+    print(f"Đã xuất {count:,} records: {excel_file}")
+    return excel_file
+
+def clean_single_file(input_file, version, target, output_file=None, workers=1, export_removed_excel=False,
+                      use_cache=True, dedup_index=None, near_duplicates=None, near_duplicate_threshold=0.8):
     """Xử lý một file đơn lẻ"""
     print(f"Version: {version}")
     print(f"Input file: {input_file}")
@@ -377,7 +770,10 @@ def clean_single_file(input_file, version, target, output_file=None):
         print(f"Đã đọc {len(df)} dòng dữ liệu")
         
         initial_rows = len(df)
-        all_removed_records = []  # List để lưu tất cả records bị xóa
+        reason_counts = Counter()  # Thống kê lý do xóa
+        
+        # Các record bị xóa được ghi dần vào removal ledger của thư mục output
+        ledger = RemovalLedger(output_file.parent / LEDGER_FILENAME, source_file=input_file.name)
         
         # ===== BƯỚC 1: LỌC COMMENT DÀI TRƯỚC =====
         print("\n" + "="*60)
@@ -396,72 +792,71 @@ def clean_single_file(input_file, version, target, output_file=None):
                 max_words = max(50, max_words)  # Tối thiểu 50 từ
                 print(f"Sử dụng ngưỡng: {max_words} từ")
                 
-                df, long_removed_df = filter_long_comments(
-                    df, 
-                    max_words=max_words, 
-                    save_filtered=True,
-                    output_dir=output_file.parent
-                )
+                df, long_removed_df = filter_long_comments(df, max_words=max_words, ledger=ledger)
                 
                 if len(long_removed_df) > 0:
-                    all_removed_records.append(long_removed_df)
+                    reason_counts.update(long_removed_df['removal_reason'].value_counts().to_dict())
                     
             except ValueError:
                 print("Giá trị không hợp lệ, bỏ qua bước lọc comment dài")
                 long_removed_df = pd.DataFrame()
         
-        # ===== BƯỚC 2: CLEANING CONTENT =====
-        print("\n" + "="*60)
-        print("BƯỚC 2: CLEANING NỘI DUNG COMMENT")
-        print("="*60)
-        
-        # CHẠY CHỈ CLEANING CHO comment_raw (KHÔNG CLEAN post_raw)
-        print("Đang thực hiện cleaning cho comment_raw...")
-        
-        if 'comment_raw' in df.columns:
-            print("  - Cleaning cột comment_raw...")
-            df['comment_raw'] = df['comment_raw'].apply(minimal_clean)
-        else:
+        if 'comment_raw' not in df.columns:
             print("  - Không tìm thấy cột comment_raw")
             return None
         
-        # ===== BƯỚC 3: LỌC COMMENT NGẮN =====
-        print("\n" + "="*60)
-        print("BƯỚC 3: LỌC COMMENT QUÁ NGẮN")
-        print("="*60)
-        
-        # Lọc các dòng có comment_raw có số từ <= 3
-        print("Lọc các dòng comment có số từ <= 3...")
         rows_before = len(df)
         
-        # Tạo list các index cần giữ lại
-        keep_indices = []
-        removed_indices = []  # Lưu các index bị xóa
-        
-        for idx, row in df.iterrows():
-            comment = row.get('comment_raw', '')
-            if isinstance(comment, str):
-                # Đếm số từ trong comment sau khi làm sạch
-                word_count = count_words(comment)
-                if word_count > 3 or is_special_pattern(comment):
-                    keep_indices.append(idx)
-                else:
-                    removed_indices.append(idx)
-            else:
-                removed_indices.append(idx)
-        
-        # Tạo DataFrame chứa các record bị xóa để backup
-        short_removed_df = df.loc[removed_indices].copy() if removed_indices else pd.DataFrame()
+        if use_cache:
+            # ===== BƯỚC 2 + 3: CLEANING (CHỈ DÒNG MỚI) VÀ LỌC COMMENT NGẮN =====
+            print("\n" + "="*60)
+            print("BƯỚC 2 + 3: CLEANING QUA CACHE VÀ LỌC COMMENT NGẮN")
+            print("="*60)
+            
+            start_time = time.perf_counter()
+            with CleanCache(output_file.parent / CACHE_FILENAME) as cache:
+                cleaned, word_counts = clean_with_cache(df['comment_raw'], cache, workers=workers)
+                print(f"  - Clean cache {cache.path}: {cache.hits:,} comment dùng lại, {cache.misses:,} comment mới được cleaning")
+            df['comment_raw'] = cleaned.tolist()
+            df, short_removed_df = filter_short_comments(df, word_counts)
+            elapsed = time.perf_counter() - start_time
+            if elapsed > 0:
+                print(f"  - Throughput cleaning + lọc: {rows_before/elapsed:,.0f} rows/sec")
+        elif workers and workers > 1:
+            # ===== BƯỚC 2 + 3: CLEANING VÀ LỌC SONG SONG THEO CHUNK =====
+            print("\n" + "="*60)
+            print(f"BƯỚC 2 + 3: CLEANING VÀ LỌC COMMENT NGẮN ({workers} WORKERS)")
+            print("="*60)
+            
+            start_time = time.perf_counter()
+            df, short_removed_df = parallel_clean_and_filter(df, workers)
+            elapsed = time.perf_counter() - start_time
+            if elapsed > 0:
+                print(f"  - Throughput cleaning + lọc: {rows_before/elapsed:,.0f} rows/sec")
+        else:
+            # ===== BƯỚC 2: CLEANING CONTENT =====
+            print("\n" + "="*60)
+            print("BƯỚC 2: CLEANING NỘI DUNG COMMENT")
+            print("="*60)
+            
+            # CHẠY CHỈ CLEANING CHO comment_raw (KHÔNG CLEAN post_raw)
+            print("Đang thực hiện cleaning cho comment_raw...")
+            print("  - Cleaning cột comment_raw...")
+            df['comment_raw'] = COMMENT_CLEANER.clean_many(df['comment_raw'])
+            print(f"  - Throughput cleaning: {COMMENT_CLEANER.rows_per_second:,.0f} rows/sec")
+            
+            # ===== BƯỚC 3: LỌC COMMENT NGẮN =====
+            print("\n" + "="*60)
+            print("BƯỚC 3: LỌC COMMENT QUÁ NGẮN")
+            print("="*60)
+            
+            # Lọc các dòng có comment_raw có số từ <= 3
+            print("Lọc các dòng comment có số từ <= 3...")
+            df, short_removed_df = filter_short_comments(df)
         
-        # Thêm thông tin chi tiết về lý do xóa
         if len(short_removed_df) > 0:
-            short_removed_df['removal_reason'] = short_removed_df.apply(
-                lambda row: get_removal_reason(row.get('comment_raw', '')), axis=1
-            )
-            all_removed_records.append(short_removed_df)
-        
-        # Lọc DataFrame theo indices
-        df = df.loc[keep_indices] if keep_indices else pd.DataFrame()
+            ledger.record(short_removed_df, stage='short_comments')
+            reason_counts.update(short_removed_df['removal_reason'].value_counts().to_dict())
         
         # Reset index sau khi lọc
         df = df.reset_index(drop=True)
@@ -469,6 +864,35 @@ def clean_single_file(input_file, version, target, output_file=None):
         filtered_rows = rows_before - len(df)
         print(f"Đã lọc bỏ {filtered_rows} dòng có số từ <= 3 ({filtered_rows/rows_before*100:.1f}%)")
         
+        # ===== LOẠI COMMENT ĐÃ CÓ TRONG DEDUP INDEX TOÀN CỤC =====
+        if dedup_index:
+            print("\n" + "="*60)
+            print("LOẠI COMMENT TRÙNG VỚI DEDUP INDEX TOÀN CỤC")
+            print("="*60)
+            
+            with DedupIndex(dedup_index, CLEAN_NAMESPACE) as index:
+                released = index.remove_source(source_key(input_file))
+                if released:
+                    print(f"  - Gỡ {released:,} comment của lần chạy trước trên file này")
+                df, dedup_removed_df = index.split_new(df, 'comment_raw')
+                print(f"  - Dedup index {index.path}: {len(index):,} comment đã giữ trước đó")
+            df = df.reset_index(drop=True)
+            print(f"  - Đã loại {len(dedup_removed_df):,} comment trùng")
+            if len(dedup_removed_df) > 0:
+                ledger.record(dedup_removed_df, stage='dedup')
+                reason_counts.update(dedup_removed_df['removal_reason'].value_counts().to_dict())
+        
+        # ===== GOM CLUSTER COMMENT GẦN TRÙNG =====
+        if near_duplicates and len(df) > 0:
+            print("\n" + "="*60)
+            print("GOM CLUSTER COMMENT GẦN TRÙNG (MINHASH/LSH)")
+            print("="*60)
+            
+            df, near_removed_df = apply_near_duplicates(df, near_duplicates, near_duplicate_threshold)
+            if len(near_removed_df) > 0:
+                ledger.record(near_removed_df, stage='near_duplicates')
+                reason_counts.update(near_removed_df['removal_reason'].value_counts().to_dict())
+        
         # ===== BƯỚC 4: CÂN BẰNG COMMENTS CHO MỖI POST =====
         print("\n" + "="*60)
         print("BƯỚC 4: CÂN BẰNG COMMENTS CHO MỖI POST")
@@ -487,12 +911,20 @@ def clean_single_file(input_file, version, target, output_file=None):
                     max_comments_per_post = int(max_comments_input) if max_comments_input else 1000
                     max_comments_per_post = max(100, max_comments_per_post)  # Tối thiểu 100
                     
-                    df, balance_removed_df = balance_comments_advanced(df, max_comments_per_post=max_comments_per_post)
+                    max_priority_comments = None
+                    if (df['post_id'].value_counts() > max_comments_per_post).any():
+                        max_priority_comments = ask_max_priority_comments()
+                    df, balance_removed_df = balance_comments_advanced(
+                        df,
+                        max_comments_per_post=max_comments_per_post,
+                        max_priority_comments=max_priority_comments
+                    )
                     
                     # Thêm balance_removed_df vào removed_df tổng
                     if balance_removed_df is not None and len(balance_removed_df) > 0:
                         balance_removed_df['removal_reason'] = f'Balanced - exceeded max {max_comments_per_post} comments per post'
-                        all_removed_records.append(balance_removed_df)
+                        ledger.record(balance_removed_df, stage='balancing')
+                        reason_counts[balance_removed_df['removal_reason'].iloc[0]] += len(balance_removed_df)
                         
                 except ValueError:
                     print("Giá trị không hợp lệ, bỏ qua bước cân bằng comments")
@@ -506,30 +938,32 @@ def clean_single_file(input_file, version, target, output_file=None):
         print("TỔNG HỢP KẾT QUẢ")
         print("="*60)
         
-        # Tạo file backup cho tất cả records bị xóa
-        if all_removed_records:
-            combined_removed_df = pd.concat(all_removed_records, ignore_index=True)
+        # Các record bị xóa đã nằm trong removal ledger, Excel chỉ xuất khi được yêu cầu
+        if reason_counts:
+            print(f"\nRemoval ledger: {ledger.path} (run {ledger.run_id})")
             
-            if len(combined_removed_df) > 0:
-                backup_file = output_file.parent / f"{output_file.stem}_removed_records.xlsx"
-                print(f"\nĐang tạo file backup cho {len(combined_removed_df)} record bị xóa: {backup_file}")
-                save_excel_file(combined_removed_df, backup_file)
-                print(f"File backup đã được lưu: {backup_file}")
-                
-                # In thống kê chi tiết về lý do xóa
-                print("\nThống kê lý do xóa:")
-                reason_counts = combined_removed_df['removal_reason'].value_counts()
-                for reason, count in reason_counts.items():
-                    print(f"  - {reason}: {count:,} records")
+            # In thống kê chi tiết về lý do xóa
+            print("\nThống kê lý do xóa:")
+            for reason, count in reason_counts.most_common():
+                print(f"  - {reason}: {count:,} records")
+            
+            if export_removed_excel:
+                export_removed_records(ledger, output_file)
         
         # Lưu kết quả
         print(f"\nĐang lưu kết quả vào: {output_file}")
         save_excel_file(df, output_file)
         
+        # Chỉ thêm vào index những comment thực sự có trong output
+        if dedup_index:
+            with DedupIndex(dedup_index, CLEAN_NAMESPACE) as index:
+                added = index.add(df, 'comment_raw', source=source_key(input_file))
+            print(f"Đã thêm {added:,} comment vào dedup index: {dedup_index}")
+        
         print(f"\nCleaning done!")
         print(f"Tổng số dòng ban đầu: {initial_rows:,}")
         print(f"Tổng số dòng sau khi cleaning: {len(df):,}")
-        total_removed = sum(len(removed_df) for removed_df in all_removed_records) if all_removed_records else 0
+        total_removed = sum(reason_counts.values())
         print(f"Tổng số record bị xóa: {total_removed:,} ({total_removed/initial_rows*100:.1f}%)")
         
         # Hiển thị số lượng dữ liệu theo platform
@@ -611,6 +1045,38 @@ def count_words(text):
     
     return len(meaningful_words)
 
+def count_words_series(series):
+    """Phiên bản vector hóa của count_words cho cả một cột (giá trị không phải str → 0)"""
+    if len(series) == 0 or not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return pd.Series(0, index=series.index, dtype='int64')
+    return series.str.count(MEANINGFUL_WORD_PATTERN).fillna(0).astype('int64')
+
+def is_text_series(series):
+    """Mask các giá trị là chuỗi (NaN, số, ... → False)"""
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return pd.Series(False, index=series.index)
+    return series.str.len().notna()
+
+def get_removal_reasons(word_counts, is_text=None):
+    """Phiên bản vector hóa của get_removal_reason, dựa trên số từ đã tính sẵn"""
+    if is_text is None:
+        is_text = pd.Series(True, index=word_counts.index)
+    conditions = [
+        ~is_text,
+        word_counts == 0,
+        word_counts == 1,
+        word_counts == 2,
+        word_counts == 3,
+    ]
+    choices = [
+        "Empty or invalid comment",
+        "Empty comment after cleaning",
+        "Single word comment",
+        "Two words comment",
+        "Three words comment",
+    ]
+    return pd.Series(np.select(conditions, choices, default="Other reason"), index=word_counts.index)
+
 def get_removal_reason(comment):
     """Xác định lý do xóa record"""
     if not isinstance(comment, str):
@@ -629,77 +1095,33 @@ def get_removal_reason(comment):
     else:
         return "Other reason"
 
+def find_keywords(text):
+    """Trả về tất cả từ khóa (PRESERVE_KEYWORDS + SPECIAL_PATTERNS) có trong text"""
+    return KEYWORD_MATCHER.find_all(text)
+
+def has_preserve_keywords(text):
+    """Check if text contains any sensitive keyword used to prioritize comments when balancing"""
+    return KEYWORD_MATCHER.contains_any(text, PRESERVE_KEYWORD_SET)
+
 def is_special_pattern(text):
     """Check if text contains special patterns that should be kept despite word count"""
     if not isinstance(text, str):
         return False
     
     # Giữ lại các pattern đặc biệt và từ khóa có ý nghĩa
-    special_patterns = [
-        # Các ký hiệu đặc biệt
-        "///", "3/", "3///", "3//", "3|||", "\\\\","\\|/",
-        
-        # Các từ viết tắt chính trị quan trọng
-        "cs", "csvn", "dcsvn", "xhcn", "dcs", "vc", "vnch", "vndcch", 
-        "redbull", "bò đỏ", "ba que", "ba sọc", "việt cộng", "vn cộng",
-        "phản động", "đảng trị", "barwhere", "cộng sản", "cộng phỉ", 
-        "tàu cộng", "tàu khựa", "bọn chệt"
-    ]
-    
-    text_lower = text.lower().strip()
-    return any(pattern in text_lower for pattern in special_patterns)
+    return KEYWORD_MATCHER.contains_any(text, SPECIAL_PATTERN_SET)
 
 def remove_emojis(text):
     """Xóa tất cả emoji khỏi văn bản"""
-    if not isinstance(text, str):
-        return ""
-        
     try:
-        # Sử dụng regex để xóa emoji
-        emoji_pattern = re.compile(
-            "["
-            u"\U0001F600-\U0001F64F"  # emoticons
-            u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-            u"\U0001F680-\U0001F6FF"  # transport & map symbols
-            u"\U0001F700-\U0001F77F"  # alchemical symbols
-            u"\U0001F780-\U0001F7FF"  # Geometric Shapes
-            u"\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-            u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-            u"\U0001FA00-\U0001FA6F"  # Chess Symbols
-            u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-            u"\U00002702-\U000027B0"  # Dingbats
-            u"\U000024C2-\U0001F251" 
-            "]+", flags=re.UNICODE
-        )
-        return emoji_pattern.sub(r'', text)
+        return COMMENT_CLEANER.remove_emojis(text)
     except:
         # Fallback nếu có lỗi với regex
         return text
 
 def remove_vn_emoticons(text):
     """Xóa các icon cảm xúc kiểu Việt Nam"""
-    if not isinstance(text, str):
-        return text
-        
-    # Danh sách các pattern icon cần xóa
-    vn_emoticon_patterns = [
-        r':[)]+',  # Matches :)), :))), etc.
-        r'=[)]+',  # Matches =)), =))), etc.
-        r':\(\(',  # Matches :((
-        r'=\(\(',  # Matches =((
-        r':>+',    # Matches :>, :>>, etc.
-        r':<+',    # Matches :<, :<<, etc.
-        r':v+',    # Matches :v, :vv, etc.
-        r':V+',    # Matches :V, :VV, etc.
-        r'=\)+',   # Matches =), =)), etc.
-        r'=\(+',   # Matches =(, =((, etc.
-    ]
-    
-    # Áp dụng các pattern để xóa icon
-    for pattern in vn_emoticon_patterns:
-        text = re.sub(pattern, '', text)
-    
-    return text
+    return COMMENT_CLEANER.remove_vn_emoticons(text)
 
 def minimal_clean(text):
     """
@@ -707,63 +1129,10 @@ def minimal_clean(text):
     1. Chuẩn hóa Unicode (UTF-8)
     2. Loại bỏ URL, tag, emoji và các chỉ báo phổ biến
     3. Lowercase 
-    """
-    if not isinstance(text, str):
-        return ""
-    
-    # Chuẩn hóa Unicode
-    text = unicodedata.normalize('NFC', text)
-    
-    # Loại bỏ URLs - cải thiện để bắt cả domain trơn như facebook.com
-    text = re.sub(r'https?://\S+|www\.\S+|\S+\.(com|org|net|co|vn|io)(/\S*)?', '', text)
-    
-    # Loại bỏ các MEDIA+N.GIPHY.COM, VD: MEDIA1.GIPHY.COM, MEDIA2.GIPHY.COM
-    text = re.sub(r'media\d*\.giphy\.com', '', text)
-
-    # Loại bỏ HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Loại bỏ mentions @username và các tham chiếu mạng xã hội
-    text = re.sub(r'@[\w\._]+', '', text)
-    text = re.sub(r'\(\s*ig\s+[\w\._]+\s*\)', '', text)  # (ig username)
-    text = re.sub(r'\(\s*instagram\s+[\w\._]+\s*\)', '', text)  # (instagram username)
-    
-    # Loại bỏ emoji
-    text = remove_emojis(text)
-    
-    # Loại bỏ icon kiểu Việt Nam
-    text = remove_vn_emoticons(text)
-    
-    # Loại bỏ các chỉ báo phổ biến
-    patterns = [
-        r'(?i)\[Đã chỉnh sửa\]',
-        r'(?i)\(Đã chỉnh sửa\)',
-        r'(?i)Đã chỉnh sửa',
-        r'(?i)See Translation',
-        r'(?i)Xem bản dịch',
-        r'(?i)See more',
-        r'(?i)Xem thêm',
-        r'(?i)Ẩn bớt',
-        r'(?i)Xem ít hơn',
-        r'(?i)Dịch',
-        r'(?i)Translated',
-        r'(?i)more',
-        r'(?i)less'
-    ]
-    
-    for pattern in patterns:
-        text = re.sub(pattern, '', text)
-    
-    # Loại bỏ dấu câu riêng lẻ hoặc các ký tự đặc biệt đứng một mình
-    text = re.sub(r'(?<!\w)[\^\'\`\~\"\,\.]+(?!\w)', ' ', text)
     
-    # Làm sạch khoảng trắng
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Chuyển thành chữ thường
-    text = text.lower()
-    
-    return text
+    Các pattern được compile sẵn trong CommentCleaner (utils/text_cleaning.py).
+    """
+    return COMMENT_CLEANER.clean(text)
 
 if __name__ == "__main__":
     try:
@@ -778,6 +1147,8 @@ if __name__ == "__main__":
         print(f"  - Input file: {args.input_file}")
         print(f"  - Output file: {args.output_file}")
         print(f"  - Target: {args.target}")
+        print(f"  - Workers: {args.workers}")
+        print(f"  - Stream: {args.stream}")
         
         if not args.version:
             print("ERROR: Version argument is required!")
@@ -789,7 +1160,18 @@ if __name__ == "__main__":
             source=args.source,
             input_filename=args.input_file,
             target=args.target,
-            output_filename=args.output_file
+            output_filename=args.output_file,
+            workers=args.workers,
+            stream=args.stream,
+            chunk_size=args.chunk_size,
+            max_words=args.max_words,
+            max_comments_per_post=args.max_comments_per_post,
+            max_priority_comments=args.max_priority_comments,
+            export_removed_excel=args.export_removed_excel,
+            use_cache=not args.no_clean_cache,
+            dedup_index=args.dedup_index,
+            near_duplicates=args.near_duplicates,
+            near_duplicate_threshold=args.near_duplicate_threshold
         )
         
         if result is None:
@@ -9,6 +9,7 @@ from pathlib import Path
 from tqdm import tqdm
 import unicodedata
 import json
+import threading
 import uuid
 import numpy as np
 from datetime import datetime, timedelta
@@ -21,6 +22,17 @@ sys.path.insert(0, str(parent_dir))
 
 # Thêm thư mục cha vào path để import config
 from utils.file_utils import save_excel_file
+from utils.api_scheduler import KeyScheduler, run_in_order
+from utils.api_resilience import classify_error, backoff_delay, QUOTA_EXHAUSTED, RATE_LIMITED, SAFETY_BLOCKED
+from utils.genai_client import GenAIClientPool, configure_genai
+from utils.summary_cache import (
+    SummaryCache, SUMMARY_CACHE_FILENAME, POST_FINGERPRINT_COLUMN, fingerprint_series, prompt_version
+)
+from utils.summary_journal import SummaryJournal
+from utils.json_stream import JsonObjectExtractor
+from utils.json_repair import parse_json_response
+from utils.token_estimator import TokenEstimator, TOKEN_ESTIMATOR_FILENAME, naive_estimate
+from utils.quota_coordinator import QuotaCoordinator, QUOTA_DB_ENV
 import config
 
 # Parse command line arguments
@@ -33,6 +45,24 @@ def parse_args():
     parser.add_argument('--file', '-f', help='Specific file to process')
     parser.add_argument('--all', '-a', action='store_true', 
                         help='Process all Excel files in the selected folder')
+    parser.add_argument('--max-in-flight-per-key', type=int, default=MAX_IN_FLIGHT_PER_KEY,
+                        help='Maximum concurrent requests per API key')
+    parser.add_argument('--max-input-tokens', type=int, default=MAX_INPUT_TOKENS,
+                        help='Prompt token budget per request')
+    parser.add_argument('--max-output-tokens', type=int, default=MAX_OUTPUT_TOKENS,
+                        help='Output token budget per request')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='Wait for the full response instead of streaming summaries as they complete')
+    parser.add_argument('--summary-cache', type=Path,
+                        help='Summary cache path (default: summary_cache.sqlite next to the summarized output; '
+                             'share one path across versions to reuse summaries)')
+    parser.add_argument('--no-summary-cache', action='store_true',
+                        help='Always call the API, do not read or write the summary cache')
+    parser.add_argument('--token-estimator', type=Path,
+                        help='Token estimator samples path (default: token_estimator.sqlite in the version output folder)')
+    parser.add_argument('--quota-db', type=Path,
+                        help=f'API quota ledger shared by every process using the same keys '
+                             f'(default: ${QUOTA_DB_ENV} or ~/.cache/gemini_quota/api_quota.sqlite)')
     return parser.parse_args()
 
 # Try to import google-generativeai with error handling
@@ -65,115 +95,59 @@ RATE_LIMITS = {
     }
 }
 
-BATCH_SIZE = 3    # Giảm batch size để tránh lỗi
-MAX_TOKENS = 4000 # Tăng token limit cho prompt phức tạp hơn
+# Batch được xếp theo ngân sách token thay vì số post cố định
+MAX_INPUT_TOKENS = 8000       # Token tối đa của prompt mỗi request (gồm cả phần hướng dẫn)
+MAX_OUTPUT_TOKENS = 4096      # max_output_tokens của mỗi request
+OUTPUT_TOKENS_PER_POST = 250  # Ước tính token JSON trả về cho một post
 RETRY_ATTEMPTS = 3
+MAX_IN_FLIGHT_PER_KEY = 2  # Số request chạy đồng thời tối đa trên mỗi API key
+STREAM_RESPONSES = True    # Nhận response dạng stream, lưu từng summary ngay khi object JSON của nó đóng
+RATE_LIMIT_COOLDOWN = 10   # Giây tạm ngưng một key sau lỗi 429 không kèm retry hint
+
+class PlaceholderSummary(str):
+    """Text ghi vào output khi không có summary thật (bị chặn, lỗi JSON, tách bằng regex, hết lượt thử); không bao giờ được cache"""
+
+BLOCKED_SUMMARY = PlaceholderSummary("Nội dung bị chặn bởi AI safety filter")
+JSON_ERROR_SUMMARY = PlaceholderSummary(
+    "1. Nội dung sơ lược: [Lỗi JSON]\n2. Vấn đề: Không xác định\n3. Phản động/tin giả: Không xác định"
+)
+FAILED_SUMMARY = PlaceholderSummary("Không thể tóm tắt sau nhiều lần thử")
 
 class APIKeyManager:
-    def __init__(self, api_keys, model_name="gemini-2.0-flash"):
+    """
+    Dùng tất cả API key cùng lúc: mỗi key có client riêng (GenAIClientPool) và
+    token bucket rpm/tpm/rpd riêng (KeyScheduler), nên các batch được gửi song
+    song trên mọi key thay vì lần lượt qua một key đang active.
+    quota (QuotaCoordinator) chia quota của key với các process khác (vd. bước gán nhãn).
+    """
+    def __init__(self, api_keys, model_name="gemini-2.0-flash", max_in_flight_per_key=MAX_IN_FLIGHT_PER_KEY,
+                 quota=None):
         self.api_keys = api_keys
-        self.current_key_index = 0
         self.model_name = model_name
         self.limits = RATE_LIMITS.get(model_name, RATE_LIMITS["gemini-2.0-flash"])
-        
-        # Tracking cho mỗi API key
-        self.usage_tracking = {key: {
-            "requests_today": 0,
-            "requests_this_minute": 0,
-            "last_request_time": None,
-            "last_reset_time": datetime.now()
-        } for key in api_keys}
-        
-        self.setup_genai()
+        self.scheduler = KeyScheduler(api_keys, self.limits, max_in_flight_per_key, quota=quota, model=model_name)
+        self.clients = GenAIClientPool(api_keys)
     
-    def setup_genai(self):
-        """Setup Google Generative AI with current API key"""
-        try:
-            genai.configure(api_key=self.api_keys[self.current_key_index])
-            # Test connection
-            list(genai.list_models())
-            print(f"✅ API Key {self.current_key_index + 1} configured successfully")
-        except Exception as e:
-            print(f"❌ Failed to configure API Key {self.current_key_index + 1}: {e}")
-            self.switch_api_key()
-    
-    def switch_api_key(self):
-        """Switch to next available API key"""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        print(f"🔄 Switching to API Key {self.current_key_index + 1}")
-        self.setup_genai()
-    
-    def can_make_request(self):
-        """Check if we can make a request with current API key"""
-        current_key = self.api_keys[self.current_key_index]
-        usage = self.usage_tracking[current_key]
-        now = datetime.now()
-        
-        # Reset daily counter if needed
-        if now.date() > usage["last_reset_time"].date():
-            usage["requests_today"] = 0
-            usage["last_reset_time"] = now
-        
-        # Reset minute counter if needed
-        if usage["last_request_time"] and (now - usage["last_request_time"]).seconds >= 60:
-            usage["requests_this_minute"] = 0
-        
-        # Check limits
-        if usage["requests_today"] >= self.limits["rpd"]:
-            print(f"⚠️ Daily limit reached for API Key {self.current_key_index + 1}")
-            return False
-        
-        if usage["requests_this_minute"] >= self.limits["rpm"]:
-            print(f"⚠️ Minute limit reached for API Key {self.current_key_index + 1}")
-            return False
-        
-        return True
+    @property
+    def max_workers(self):
+        """Số batch có thể gửi đồng thời"""
+        return self.scheduler.max_workers
     
-    def find_available_key(self):
-        """Find an API key that can make requests"""
-        original_index = self.current_key_index
-        
-        while True:
-            if self.can_make_request():
-                return True
-            
-            self.switch_api_key()
-            
-            # If we've tried all keys, return False
-            if self.current_key_index == original_index:
-                return False
-    
-    def record_request(self):
-        """Record that a request was made"""
-        current_key = self.api_keys[self.current_key_index]
-        usage = self.usage_tracking[current_key]
-        now = datetime.now()
-        
-        usage["requests_today"] += 1
-        usage["requests_this_minute"] += 1
-        usage["last_request_time"] = now
-    
-    def wait_if_needed(self):
-        """Wait if we need to respect rate limits"""
-        if not self.find_available_key():
-            # All keys are rate limited, wait
-            print("⏳ All API keys are rate limited. Waiting 60 seconds...")
-            time.sleep(60)
-            return self.find_available_key()
-        return True
+    def acquire(self, estimated_tokens):
+        """Chờ đến khi có key còn quota; trả về KeyLease hoặc None nếu mọi key đã hết quota ngày"""
+        return self.scheduler.acquire(estimated_tokens)
+    
+    def release(self, lease, actual_tokens=None, error=None):
+        """Trả lease sau request; error (ApiError, None nếu thành công) cập nhật breaker / AIMD của key"""
+        self.scheduler.release(lease, actual_tokens)
+        self.scheduler.report(lease.api_key, error, RATE_LIMIT_COOLDOWN)
+    
+    def model(self, api_key):
+        return self.clients.model(api_key, self.model_name)
     
     def get_usage_stats(self):
         """Get usage statistics for all API keys"""
-        stats = {}
-        for i, key in enumerate(self.api_keys):
-            usage = self.usage_tracking[key]
-            stats[f"Key_{i+1}"] = {
-                "requests_today": usage["requests_today"],
-                "requests_this_minute": usage["requests_this_minute"],
-                "daily_limit": self.limits["rpd"],
-                "minute_limit": self.limits["rpm"]
-            }
-        return stats
+        return self.scheduler.usage_stats()
 
 # ---- IMPROVED PROMPT WITH KEY TERMS RECOGNITION ----
 IMPROVED_PROMPT = """Trước khi tóm tắt, hãy nhận diện các từ khóa/biệt ngữ chính trị sau trong văn bản:
@@ -237,6 +211,9 @@ Lưu ý:
 3. Đánh giá "Phản động/tin giả" cần dựa trên việc có sử dụng ngôn ngữ thù ghét, kích động chia rẽ, xuyên tạc hay không.
 4. Ngay cả khi văn bản ngắn, hãy chú ý đến các từ khóa và biệt ngữ đã liệt kê để đánh giá đúng."""
 
+# Mã phiên bản prompt, là một phần khóa của summary cache: sửa prompt thì cache cũ không còn khớp
+PROMPT_VERSION = prompt_version(IMPROVED_PROMPT)
+
 def check_environment():
     """Kiểm tra môi trường trước khi chạy"""
     print("🔍 CHECKING ENVIRONMENT")
@@ -259,7 +236,7 @@ def check_environment():
     
     # Test API connection
     try:
-        genai.configure(api_key=API_KEYS[0])
+        configure_genai(API_KEYS[0])
         models = list(genai.list_models())
         print(f"✅ API connection: OK ({len(models)} models available)")
         return True
@@ -353,11 +330,17 @@ def choose_source_and_files(version):
         except ValueError:
             print("Vui lòng nhập số hoặc 'a'!")
 
-def estimate_tokens(text):
-    """Ước tính tokens (4 chars = 1 token for Vietnamese)"""
-    if not isinstance(text, str):
-        return 0
-    return max(1, len(text) // 4)
+# Token estimator học từ usage_metadata, khởi tạo trong main() khi đã chọn model
+token_estimator = None
+
+def estimate_tokens(text, fragment=False):
+    """
+    Ước tính tokens bằng token estimator của model (4 chars = 1 token khi chưa đủ mẫu).
+    fragment=True cho một phần của prompt (một post trong batch).
+    """
+    if token_estimator is not None:
+        return token_estimator.estimate(text, fragment)
+    return naive_estimate(text)
 
 def clean_text(text):
     """Làm sạch text để tránh safety filters"""
@@ -380,27 +363,8 @@ def clean_text(text):
     
     return text
 
-def create_batch_prompt(post_batch):
-    """Tạo prompt cho batch posts"""
-    text_entries = []
-    batch_ids = []
-    
-    for idx, post in enumerate(post_batch):
-        post_id = f"id{idx+1}"
-        batch_ids.append(post_id)
-        clean_post = clean_text(post)
-        
-        # Truncate if too long
-        if estimate_tokens(clean_post) > MAX_TOKENS // len(post_batch):
-            clean_post = clean_post[:int(len(clean_post) * 0.75)] + "..."
-        
-        text_entries.append(f"Văn bản {post_id}:\n\"{clean_post}\"")
-    
-    formatted_entries = "\n\n".join(text_entries)
-    
-    # Cập nhật prompt với hướng dẫn JSON rõ ràng hơn
-    prompt_template = IMPROVED_PROMPT.replace("{text_entries}", formatted_entries)
-    prompt_template += """
+# Hướng dẫn định dạng JSON nối vào cuối mọi prompt
+JSON_FORMAT_INSTRUCTIONS = """
 
 LƯU Ý QUAN TRỌNG VỀ ĐỊNH DẠNG JSON:
 1. Đảm bảo JSON trả về PHẢI hợp lệ 100%.
@@ -425,106 +389,222 @@ JSON PHẢI có cấu trúc chính xác như sau:
   ]
 }
 ```"""
+
+def format_post_entry(post_id, clean_post):
+    """Một mục văn bản trong prompt"""
+    return f"Văn bản {post_id}:\n\"{clean_post}\""
+
+def create_batch_prompt(post_batch, max_input_tokens=MAX_INPUT_TOKENS):
+    """
+    Tạo prompt cho batch posts.
+    Chỉ cắt bớt một post khi riêng post đó đã vượt ngân sách token của prompt.
+    """
+    text_entries = []
+    batch_ids = []
+    post_budget = max_input_tokens - prompt_overhead_tokens()
+    
+    for idx, post in enumerate(post_batch):
+        post_id = f"id{idx+1}"
+        batch_ids.append(post_id)
+        clean_post = clean_text(post)
+        
+        # Truncate only posts that cannot fit the budget on their own
+        if estimate_tokens(format_post_entry(post_id, clean_post), fragment=True) > post_budget:
+            text_budget = post_budget - estimate_tokens(format_post_entry(post_id, "..."), fragment=True) - 1
+            keep_chars = int(len(clean_post) * text_budget / estimate_tokens(clean_post, fragment=True))
+            clean_post = clean_post[:max(1, keep_chars)] + "..."
+        
+        text_entries.append(format_post_entry(post_id, clean_post))
+    
+    formatted_entries = "\n\n".join(text_entries)
+    
+    # Cập nhật prompt với hướng dẫn JSON rõ ràng hơn
+    prompt_template = IMPROVED_PROMPT.replace("{text_entries}", formatted_entries)
+    prompt_template += JSON_FORMAT_INSTRUCTIONS
     
     return prompt_template, batch_ids
 
-def process_batch(api_manager, post_batch, batch_index, total_batches):
-    """Xử lý một batch posts với API manager"""
+def prompt_overhead_tokens():
+    """Token của phần prompt cố định (hướng dẫn + định dạng JSON), không tính các post"""
+    template = IMPROVED_PROMPT.replace("{text_entries}", "")
+    return estimate_tokens(template + JSON_FORMAT_INSTRUCTIONS)
+
+def build_batches(posts, max_input_tokens=MAX_INPUT_TOKENS, max_output_tokens=MAX_OUTPUT_TOKENS):
+    """
+    Xếp posts (dict khóa → text post) vào ít request nhất có thể (first-fit decreasing).
+    
+    Post được sắp theo số token ước tính giảm dần, mỗi post vào batch đầu tiên còn
+    đủ chỗ cho cả ngân sách prompt (max_input_tokens) lẫn output (max_output_tokens).
+    Post vượt ngân sách một mình nằm riêng một batch và được cắt ở create_batch_prompt.
+    
+    Returns:
+        list: các batch (list khóa post)
+    """
+    input_budget = max_input_tokens - prompt_overhead_tokens()
+    max_posts = max(1, max_output_tokens // OUTPUT_TOKENS_PER_POST)
+    # id dài nhất có thể ("id" + số thứ tự) để ước tính chi phí mỗi mục không phụ thuộc vị trí
+    entry_id = f"id{max_posts}"
+    sized_posts = sorted(
+        ((estimate_tokens(format_post_entry(entry_id, clean_text(post)), fragment=True) + 1, key)
+         for key, post in posts.items()),
+        key=lambda item: item[0],
+        reverse=True
+    )
+    
+    batches = []
+    remaining = []  # Token prompt còn trống của từng batch
+    for tokens, key in sized_posts:
+        for batch_idx, batch in enumerate(batches):
+            if len(batch) < max_posts and tokens <= remaining[batch_idx]:
+                batch.append(key)
+                remaining[batch_idx] -= tokens
+                break
+        else:
+            batches.append([key])
+            remaining.append(input_budget - tokens)
+    return batches
+
+def process_batch(api_manager, post_batch, batch_index, total_batches,
+                  max_input_tokens=MAX_INPUT_TOKENS, max_output_tokens=MAX_OUTPUT_TOKENS, post_keys=None,
+                  usage=None, stream=STREAM_RESPONSES, on_summary=None):
+    """
+    Xử lý một batch posts với API manager.
+    post_keys: khóa của từng post trong dict kết quả (vd. fingerprint), mặc định là chính text post.
+    usage: dict nhận tổng 'prompt_tokens' / 'output_tokens' của các request đã gửi cho batch.
+    stream: đọc response dạng stream; mỗi summary được giao cho on_summary(key, summary) ngay khi
+    object JSON của nó đóng, và stream bị cắt ngang vẫn giữ các summary đã hoàn chỉnh.
+    """
+    if usage is None:
+        usage = {}
     # Convert NumPy array to list if needed
     if isinstance(post_batch, np.ndarray):
         post_batch = post_batch.tolist()
+    if post_keys is None:
+        post_keys = list(post_batch)
     
     # Check if batch is empty using length
     if len(post_batch) == 0:
         return {}
     
-    prompt, batch_ids = create_batch_prompt(post_batch)
+    prompt, batch_ids = create_batch_prompt(post_batch, max_input_tokens)
     estimated_tokens = estimate_tokens(prompt)
     
     print(f"\n📦 Processing batch {batch_index+1}/{total_batches}")
     print(f"   Posts in batch: {len(post_batch)}")
     print(f"   Estimated tokens: {estimated_tokens}")
     
-    # Check if batch is too large
-    if estimated_tokens > MAX_TOKENS:
-        print(f"⚠️  Batch too large ({estimated_tokens} tokens > {MAX_TOKENS})!")
-        if len(post_batch) <= 1:
-            # If single post is too large, truncate it
-            print("   Single post too large, truncating...")
-            prompt, batch_ids = create_batch_prompt([post_batch[0][:int(len(post_batch[0])*0.5)] + "..."])
-        else:
-            # Split batch in half and process recursively
-            print("   Splitting batch in half...")
-            mid = len(post_batch) // 2
-            results1 = process_batch(api_manager, post_batch[:mid], batch_index, total_batches)
-            results2 = process_batch(api_manager, post_batch[mid:], batch_index, total_batches)
-            results1.update(results2)
-            return results1
+    # build_batches đã xếp vừa ngân sách; chỉ tách đôi khi batch được truyền từ nơi khác quá lớn
+    if estimated_tokens > max_input_tokens and len(post_batch) > 1:
+        print(f"⚠️  Batch too large ({estimated_tokens} tokens > {max_input_tokens})! Splitting batch in half...")
+        mid = len(post_batch) // 2
+        results1 = process_batch(api_manager, post_batch[:mid], batch_index, total_batches,
+                                 max_input_tokens, max_output_tokens, post_keys[:mid], usage, stream, on_summary)
+        results2 = process_batch(api_manager, post_batch[mid:], batch_index, total_batches,
+                                 max_input_tokens, max_output_tokens, post_keys[mid:], usage, stream, on_summary)
+        results1.update(results2)
+        return results1
+    
+    # Summary đã nhận qua stream (khóa post → summary)
+    streamed = {}
+    
+    def commit_streamed(obj):
+        result_id = obj.get('id')
+        if result_id in batch_ids and 'summary' in obj:
+            key = post_keys[batch_ids.index(result_id)]
+            if key not in streamed:
+                streamed[key] = obj['summary']
+                if on_summary is not None:
+                    on_summary(key, obj['summary'])
     
     # Process batch with retries
     for attempt in range(RETRY_ATTEMPTS):
+        # Wait for rate limit using API manager
+        lease = api_manager.acquire(estimated_tokens)
+        if lease is None:
+            print("❌ All API keys exhausted for today")
+            return streamed
+        current_key = lease.api_key
+        actual_tokens = None
+        error = None
+        retry_delay = 0.0
+        
         try:
-            # Wait for rate limit using API manager
-            if not api_manager.wait_if_needed():
-                print("❌ All API keys exhausted for today")
-                return {}
-            
-            current_key = api_manager.api_keys[api_manager.current_key_index]
             print(f"  🔑 Using API key: ...{current_key[-4:]}")
             
-            response = genai.GenerativeModel(api_manager.model_name).generate_content(
+            response = api_manager.model(current_key).generate_content(
                 prompt,
                 generation_config={
                     "temperature": 0.1,
-                    "max_output_tokens": 2048
+                    "max_output_tokens": max_output_tokens
                 },
                 safety_settings={
                     'HATE': 'BLOCK_NONE',
                     'HARASSMENT': 'BLOCK_NONE', 
                     'SEXUAL': 'BLOCK_NONE',
                     'DANGEROUS': 'BLOCK_NONE'
-                }
+                },
+                stream=stream
             )
             
-            # Record the request
-            api_manager.record_request()
+            streamed_text = None
+            if stream:
+                extractor = JsonObjectExtractor()
+                chunks = []
+                for chunk in response:
+                    chunk_text = response_chunk_text(chunk)
+                    chunks.append(chunk_text)
+                    for obj in extractor.feed(chunk_text):
+                        commit_streamed(obj)
+                streamed_text = "".join(chunks)
             
             # Log token usage
             try:
-                usage = response.usage_metadata
-                prompt_tokens = usage.prompt_token_count
-                output_tokens = getattr(usage, 'candidates_token_count', 0)
+                usage_metadata = response.usage_metadata
+                prompt_tokens = usage_metadata.prompt_token_count
+                output_tokens = getattr(usage_metadata, 'candidates_token_count', 0)
+                actual_tokens = prompt_tokens + (output_tokens or 0)
+                usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + prompt_tokens
+                usage['output_tokens'] = usage.get('output_tokens', 0) + (output_tokens or 0)
+                if token_estimator is not None:
+                    token_estimator.record(prompt, prompt_tokens)
                 print(f"  ✅ Batch {batch_index+1}/{total_batches} | " 
                       f"In: {prompt_tokens} | Out: {output_tokens} tokens")
             except:
                 print(f"  ✅ Batch {batch_index+1}/{total_batches} | Token usage unavailable")
             
+            # Stream đã cho đủ summary của mọi post
+            if len(streamed) == len(post_keys):
+                print(f"  ✅ Successfully processed {len(streamed)}/{len(post_batch)} posts (streamed)")
+                return dict(streamed)
+            
             # Check if response is blocked or empty
-            if not response.candidates or not response.candidates[0].content.parts:
+            if not streamed_text and (not response.candidates or not response.candidates[0].content.parts):
                 finish_reason = response.candidates[0].finish_reason if response.candidates else "UNKNOWN"
                 print(f"  ⚠️ Response blocked or empty. Finish reason: {finish_reason}")
                 
                 # Create fallback summaries for this batch
                 fallback_summaries = {}
-                for post in post_batch:
-                    fallback_summaries[post] = "Nội dung bị chặn bởi AI safety filter"
+                for key in post_keys:
+                    fallback_summaries[key] = BLOCKED_SUMMARY
+                fallback_summaries.update(streamed)
                 return fallback_summaries
     
             # Extract text from response
-            response_text = response.text.strip()
+            response_text = (streamed_text if stream else response.text).strip()
             
             # Super resilient JSON parsing
             try:
                 results_dict = super_resilient_json_parser(response_text)
                 
                 # Map results to post_batch
-                summaries = {}
+                summaries = dict(streamed)
                 for result in results_dict.get('results', []):
                     result_id = result.get('id')
-                    if result_id in batch_ids:
+                    # Kết quả bị cắt cụt (không có summary) để post đó được báo là chưa tóm tắt
+                    if result_id in batch_ids and result.get('summary'):
                         post_idx = batch_ids.index(result_id)
                         if post_idx < len(post_batch):
-                            summaries[post_batch[post_idx]] = result.get('summary', '')
+                            summaries.setdefault(post_keys[post_idx], result.get('summary', ''))
                 
                 print(f"  ✅ Successfully processed {len(summaries)}/{len(post_batch)} posts")
                 return summaries
@@ -533,67 +613,100 @@ def process_batch(api_manager, post_batch, batch_index, total_batches):
                 print(f"  ❌ All JSON parsing methods failed: {e}")
                 print(f"  📑 Dumping response for debugging (first 200 chars): {response_text[:200]}...")
                 
-                # Ultimate fallback - extract anything that looks like a summary with regex
-                summaries = {}
+                # Ultimate fallback - extract anything that looks like a summary with regex.
+                # Matches are mapped to posts by position, so they are PlaceholderSummary:
+                # shown in this run's output but never cached or journaled
+                summaries = dict(streamed)
                 pattern = r'1\.\s*Nội dung sơ lược:(.*?)(?:(?:\n|\\n)2\.|$)'
-                matches = re.findall(pattern, response_text, re.DOTALL)
+                matches = list(re.finditer(pattern, response_text, re.DOTALL))
                 
                 if matches:
                     print(f"  🔄 Last resort: Found {len(matches)} potential summaries")
-                    for i, match in enumerate(matches):
-                        if i < len(post_batch):
-                            # Try to rebuild a complete summary by looking for parts 2 and 3
-                            summary_text = f"1. Nội dung sơ lược:{match.strip()}"
-                            
-                            # Look for part 2
-                            part2_match = re.search(r'2\.\s*Vấn đề:(.*?)(?:(?:\n|\\n)3\.|$)', response_text, re.DOTALL)
-                            if part2_match:
-                                summary_text += f"\n2. Vấn đề:{part2_match.group(1).strip()}"
-                            
-                            # Look for part 3
-                            part3_match = re.search(r'3\.\s*Phản động/tin giả:(.*?)(?:\n|\\n|$)', response_text, re.DOTALL)
-                            if part3_match:
-                                summary_text += f"\n3. Phản động/tin giả:{part3_match.group(1).strip()}"
-                            
-                            summaries[post_batch[i]] = summary_text
+                    for i, match in enumerate(matches[:len(post_batch)]):
+                        # Parts 2 and 3 of this summary lie between its part 1 and the next one
+                        section_end = matches[i + 1].start() if i + 1 < len(matches) else len(response_text)
+                        section = response_text[match.end(1):section_end]
+                        summary_text = f"1. Nội dung sơ lược:{match.group(1).strip()}"
+                        
+                        # Look for part 2
+                        part2_match = re.search(r'2\.\s*Vấn đề:(.*?)(?:(?:\n|\\n)3\.|$)', section, re.DOTALL)
+                        if part2_match:
+                            summary_text += f"\n2. Vấn đề:{part2_match.group(1).strip()}"
+                        
+                        # Look for part 3
+                        part3_match = re.search(r'3\.\s*Phản động/tin giả:(.*?)(?:\n|\\n|$)', section, re.DOTALL)
+                        if part3_match:
+                            summary_text += f"\n3. Phản động/tin giả:{part3_match.group(1).strip()}"
+                        
+                        summaries.setdefault(post_keys[i], PlaceholderSummary(summary_text))
                     
                     if summaries:
-                        print(f"  ✅ Extracted {len(summaries)} summaries through final fallback")
+                        print(f"  ✅ Extracted {len(summaries)} summaries through final fallback (not cached)")
                         return summaries
                 
                 # If absolutely nothing worked, create placeholder summaries
                 print("  ⚠️ Using placeholder summaries as last resort")
                 placeholders = {}
-                for idx, post in enumerate(post_batch):
-                    placeholders[post] = f"1. Nội dung sơ lược: [Lỗi JSON]\n2. Vấn đề: Không xác định\n3. Phản động/tin giả: Không xác định"
+                for key in post_keys:
+                    placeholders[key] = JSON_ERROR_SUMMARY
+                placeholders.update(streamed)
                 return placeholders
                 
         except Exception as e:
-            error_str = str(e)
-            print(f"  ❌ Attempt {attempt+1} failed: {error_str}")
+            error = classify_error(e)
+            print(f"  ❌ Attempt {attempt+1} failed ({error.kind}): {e}")
+            
+            # Stream bị cắt sau khi đã có summary hoàn chỉnh: giữ chúng, gửi lại phần còn thiếu
+            if streamed:
+                print(f"  ✂️  Stream cut off after {len(streamed)}/{len(post_batch)} summaries")
+                break
             
             # Check for specific error types
-            if "finish_reason" in error_str and "2" in error_str:
+            if error.kind == SAFETY_BLOCKED:
                 print(f"  🚫 Content blocked by safety filter")
                 # Return fallback immediately for safety blocks
                 fallback_summaries = {}
-                for post in post_batch:
-                    fallback_summaries[post] = "Nội dung bị chặn bởi AI safety filter"
+                for key in post_keys:
+                    fallback_summaries[key] = BLOCKED_SUMMARY
                 return fallback_summaries
-            elif "429" in error_str or "quota" in error_str.lower():
-                print(f"  🔄 Rate limit detected, switching API key...")
-                api_manager.switch_api_key()
-                time.sleep(2)
+            elif error.kind in (RATE_LIMITED, QUOTA_EXHAUSTED):
+                # release() tạm ngưng key theo retry hint; lần thử sau chọn key khác
+                print(f"  🔄 Rate limit detected ({error.kind}), pausing key ...{current_key[-4:]} "
+                      f"and retrying on another key...")
             elif attempt < RETRY_ATTEMPTS - 1:
-                time.sleep(10)
+                retry_delay = backoff_delay(attempt, error.retry_after)
+        finally:
+            api_manager.release(lease, actual_tokens, error)
+        
+        # Chờ sau khi đã trả key để request khác vẫn dùng được chỗ của nó
+        if retry_delay:
+            print(f"  ⏳ Retrying in {retry_delay:.1f}s...")
+            time.sleep(retry_delay)
+    
+    if streamed:
+        remaining = [idx for idx, key in enumerate(post_keys) if key not in streamed]
+        results = dict(streamed)
+        if remaining:
+            results.update(process_batch(
+                api_manager, [post_batch[idx] for idx in remaining], batch_index, total_batches,
+                max_input_tokens, max_output_tokens, [post_keys[idx] for idx in remaining], usage, stream, on_summary
+            ))
+        return results
     
     # Fallback if all attempts fail
     print("  ❌ All attempts failed for this batch")
     fallback_summaries = {}
-    for post in post_batch:
-        fallback_summaries[post] = "Không thể tóm tắt sau nhiều lần thử"
+    for key in post_keys:
+        fallback_summaries[key] = FAILED_SUMMARY
     return fallback_summaries
 
+def response_chunk_text(chunk):
+    """Text của một chunk stream ('' nếu chunk không có nội dung, vd. chunk cuối chỉ có finish_reason)"""
+    try:
+        return chunk.text
+    except (ValueError, AttributeError, IndexError):
+        return ""
+
 def save_error_log(batch_index, response_text, error):
     """Save error log for debugging"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -609,134 +722,21 @@ def save_error_log(batch_index, response_text, error):
     
     print(f"  📝 Error log saved to {log_file}")
 
-def clean_json_text(text):
-    """Clean up JSON text from response"""
-    if '```json' in text:
-        json_start = text.find('```json') + 7
-        json_end = text.find('```', json_start)
-        if json_end != -1:
-            text = text[json_start:json_end].strip()
-        else:
-            text = text[json_start:].strip()
-    elif '{' in text and '}' in text:
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        text = text[start:end]
-    
-    text = text.replace('```', '').strip()
-    return text
-
-def fix_json_format(json_text):
-    """Fix common JSON format issues, especially with newlines"""
-    # Level 1: Basic fixes
-    json_text = re.sub(r'([^\\])\\n', r'\1\\n', json_text)  # Fix unescaped newlines
-    json_text = re.sub(r'([^\\])\\\"', r'\1\\"', json_text)  # Fix unescaped quotes
-    json_text = re.sub(r'([^\\])"([^"]*)"([^"]*)"', r'\1"\2\\"\3"', json_text)  # Fix nested quotes
-    json_text = re.sub(r'"}(\s*){', r'"},\1{', json_text)  # Fix missing commas between objects
-    
-    # Level 2: More aggressive fixes
-    json_text = re.sub(r'\n', '', json_text)  # Remove actual newlines
-    json_text = re.sub(r'\\+n', '\\n', json_text)  # Fix multiple backslashes before n
-    json_text = re.sub(r'\\+\"', '\\"', json_text)  # Fix multiple backslashes before quotes
-    
-    # Level 3: Extreme fixes
-    try:
-        # Try parsing as is
-        json.loads(json_text)
-        return json_text
-    except json.JSONDecodeError as e:
-        error_message = str(e)
-        
-        if "Expecting ',' delimiter" in error_message:
-            # Fix missing commas - find position and insert comma
-            position = int(re.search(r'char (\d+)', error_message).group(1))
-            fixed_text = json_text[:position] + "," + json_text[position:]
-            return fixed_text
-            
-        elif "Expecting property name enclosed in double quotes" in error_message:
-            # Fix missing quotes around property names
-            return re.sub(r'(\s+)(\w+)(:)', r'\1"\2"\3', json_text)
-            
-        elif "Unterminated string" in error_message:
-            # Fix unterminated strings - add missing quote
-            position = int(re.search(r'char (\d+)', error_message).group(1))
-            fixed_text = json_text[:position] + "\"" + json_text[position:]
-            return fixed_text
-    
-    # Return the original if nothing worked
-    return json_text
-
 def super_resilient_json_parser(response_text):
-    """Super resilient JSON parser with multiple fallback strategies"""
-    # Strategy 1: Clean and try to parse directly
-    json_text = clean_json_text(response_text)
-    
-    try:
-        return json.loads(json_text)
-    except json.JSONDecodeError:
-        print("  ⚠️ Initial JSON parse failed, trying fixes...")
-    
-    # Strategy 2: Apply fixes and try again
-    fixed_json = fix_json_format(json_text)
-    
-    try:
-        return json.loads(fixed_json)
-    except json.JSONDecodeError:
-        print("  ⚠️ Fixed JSON still failed, trying more aggressive fixes...")
-    
-    # Strategy 3: Rebuild JSON entirely if there's a pattern
-    summaries = {}
-    results = []
-    
-    # Try extracting with regex
-    id_pattern = r'"id"\s*:\s*"(id\d+)"'
-    summary_pattern = r'"summary"\s*:\s*"([^"]*(?:\\.[^"]*)*)(?<!\\)"'
-    
-    id_matches = re.findall(id_pattern, response_text)
-    summary_matches = re.findall(summary_pattern, response_text)
-    
-    if id_matches and summary_matches and len(id_matches) == len(summary_matches):
-        print(f"  ⚠️ Rebuilding JSON from {len(id_matches)} matched patterns")
-        
-        for i in range(len(id_matches)):
-            result_id = id_matches[i]
-            summary = summary_matches[i].replace('\\n', '\n').replace('\\"', '"')
-            results.append({"id": result_id, "summary": summary})
-        
-        return {"results": results}
-    
-    # Strategy 4: Super aggressive - just extract based on labels
-    if "1. Nội dung sơ lược:" in response_text:
-        print("  ⚠️ Last resort: Rebuilding from text patterns")
-        
-        # Extract all post sections
-        post_sections = re.split(r'"id"\s*:\s*"id\d+"', response_text)
-        
-        if len(post_sections) > 1:
-            for i, section in enumerate(post_sections[1:], 1):  # Skip first empty split
-                result_id = f"id{i}"
-                
-                # Try to extract the three parts
-                summary_match = re.search(r'1\.\s*Nội dung sơ lược:\s*(.*?)(?:2\.|$)', section, re.DOTALL)
-                problem_match = re.search(r'2\.\s*Vấn đề:\s*(.*?)(?:3\.|$)', section, re.DOTALL)
-                fake_match = re.search(r'3\.\s*Phản động/tin giả:\s*(.*?)(?:"|$)', section, re.DOTALL)
-                
-                summary_text = ""
-                if summary_match:
-                    summary_text += f"1. Nội dung sơ lược: {summary_match.group(1).strip()}\n"
-                if problem_match:
-                    summary_text += f"2. Vấn đề: {problem_match.group(1).strip()}\n"
-                if fake_match:
-                    summary_text += f"3. Phản động/tin giả: {fake_match.group(1).strip()}"
-                
-                if summary_text:
-                    results.append({"id": result_id, "summary": summary_text.strip()})
-        
+    """
+    Parse JSON kết quả tóm tắt: json.loads nếu hợp lệ, nếu không thì parser dễ dãi một lượt
+    (utils.json_repair) chịu được xuống dòng thật, thiếu dấu phẩy, dấu " không escape,
+    code fence và JSON bị cắt cụt.
+    Raise JSONDecodeError (để dùng regex fallback) khi không tìm thấy kết quả nào.
+    """
+    parsed = parse_json_response(response_text)
+    if isinstance(parsed, list):
+        parsed = {"results": parsed}
+    if isinstance(parsed, dict):
+        results = [result for result in parsed.get('results') or [] if isinstance(result, dict)]
         if results:
-            return {"results": results }
-    
-    # If all else fails, throw an error that will trigger the regex fallback
-    raise json.JSONDecodeError("Failed all parsing strategies", json_text, 0)
+            return {"results": results}
+    raise json.JSONDecodeError("No summary results found in response", response_text, 0)
 
 def check_required_columns(df):
     """Kiểm tra các cột bắt buộc trong DataFrame"""
@@ -759,8 +759,76 @@ def check_required_columns(df):
     
     return True
 
-def process_single_file(api_manager, input_file, version, model_name):
-    """Process a single Excel file"""
+def is_successful_summary(summary):
+    """Summary thật (không phải PlaceholderSummary khi lỗi / bị chặn) - chỉ những summary này được cache"""
+    return isinstance(summary, str) and bool(summary) and not isinstance(summary, PlaceholderSummary)
+
+def summarize_posts(api_manager, posts, batches, max_input_tokens=MAX_INPUT_TOKENS,
+                    max_output_tokens=MAX_OUTPUT_TOKENS, stream=STREAM_RESPONSES, commit=None, commit_usage=None):
+    """
+    Gửi các batch song song trên mọi API key (kết quả giữ đúng thứ tự batch).
+    posts: dict khóa → text post; batches: list các list khóa (build_batches).
+    commit(summaries, tokens): nhận mỗi summary thành công đúng một lần - ngay khi stream
+    xong summary đó (tokens None vì chưa có usage), hoặc khi batch của nó hoàn thành.
+    commit_usage(keys, tokens): khi batch hoàn thành, token của batch cho các summary đã
+    commit lúc stream.
+    
+    Returns:
+        dict: khóa post → summary (kể cả placeholder khi lỗi)
+    """
+    progress = tqdm(total=len(batches), desc="Xử lý batch")
+    batch_usage = [{} for _ in batches]
+    streamed_keys = [[] for _ in batches]
+    committed = set()
+    commit_lock = threading.Lock()
+    
+    def commit_summaries(summaries, tokens=None):
+        with commit_lock:
+            successful = {
+                key: summary for key, summary in summaries.items()
+                if key not in committed and is_successful_summary(summary)
+            }
+            committed.update(successful)
+        if commit is not None and successful:
+            commit(successful, tokens)
+        return successful
+    
+    def commit_streamed(batch_idx, key, summary):
+        streamed_keys[batch_idx].extend(commit_summaries({key: summary}))
+    
+    def on_batch_done(batch_idx, batch_results):
+        progress.update(1)
+        # Ghi ngay sau mỗi batch; các summary đã stream thì đã được ghi trước đó, giờ mới có token
+        usage = batch_usage[batch_idx]
+        tokens = usage.get('prompt_tokens', 0) + usage.get('output_tokens', 0) or None
+        commit_summaries(batch_results, tokens)
+        if commit_usage is not None and streamed_keys[batch_idx]:
+            commit_usage(streamed_keys[batch_idx], tokens)
+    
+    batch_results_list = run_in_order(
+        lambda batch_idx, batch: process_batch(api_manager, [posts[key] for key in batch],
+                                               batch_idx, len(batches), max_input_tokens, max_output_tokens,
+                                               post_keys=batch, usage=batch_usage[batch_idx], stream=stream,
+                                               on_summary=lambda key, summary: commit_streamed(batch_idx, key, summary)),
+        batches,
+        api_manager.max_workers,
+        on_result=on_batch_done
+    )
+    progress.close()
+    
+    summaries = {}
+    for batch_results in batch_results_list:
+        summaries.update(batch_results)
+    return summaries
+
+def process_single_file(api_manager, input_file, version, model_name, summary_cache=None,
+                        max_input_tokens=MAX_INPUT_TOKENS, max_output_tokens=MAX_OUTPUT_TOKENS,
+                        stream=STREAM_RESPONSES):
+    """
+    Process a single Excel file.
+    Mỗi batch hoàn thành được ghi vào journal <file>_summarized_journal.jsonl; nếu lần chạy
+    trước bị dừng giữa chừng, các summary trong journal được dùng lại thay vì gọi API.
+    """
     print(f"\n🔄 Xử lý file: {input_file.name}")
     print("-" * 50)
     
@@ -774,37 +842,72 @@ def process_single_file(api_manager, input_file, version, model_name):
         if not check_required_columns(df_original):
             return None
             
-        # Get unique posts
+        # Get unique posts: mỗi post được nhận diện bằng fingerprint (NFC, gộp khoảng trắng)
+        # tính một lần; dict kết quả, batch và cache đều dùng khóa này
         post_column = 'post_raw'
-        unique_posts = df_original[post_column].dropna().unique().tolist()
+        df_original[POST_FINGERPRINT_COLUMN] = fingerprint_series(df_original[post_column])
+        has_post = df_original[POST_FINGERPRINT_COLUMN].notna()
+        first_rows = df_original[has_post].drop_duplicates(POST_FINGERPRINT_COLUMN)
+        unique_posts = dict(zip(first_rows[POST_FINGERPRINT_COLUMN], first_rows[post_column]))
         print(f"🔍 Tìm thấy {len(unique_posts)} bài post duy nhất để tóm tắt")
     except Exception as e:
         print(f"❌ Failed to load data: {e}")
         return None
     
+    # Post đã tóm tắt ở lần chạy / file trước được lấy từ cache, không gửi lại API
+    cached_summaries = summary_cache.get_many(unique_posts) if summary_cache is not None else {}
+    posts_to_process = {
+        fingerprint: post for fingerprint, post in unique_posts.items() if fingerprint not in cached_summaries
+    }
+    if summary_cache is not None:
+        print(f"💾 Cache: {len(cached_summaries)} post đã có tóm tắt, còn {len(posts_to_process)} post cần gọi API")
+    
+    # Generate output filename - use 'summarized' not 'analyzed'
+    file_stem = input_file.stem
+    if not file_stem.endswith('_summarized'):
+        file_stem += '_summarized'
+    
+    # Resume: summary đã nhận ở lần chạy bị dừng giữa chừng nằm trong journal
+    journal = SummaryJournal(
+        config.get_path(version, "summarized", filename=f"{file_stem}_journal.jsonl"), model_name, PROMPT_VERSION
+    )
+    journal_summaries = journal.replay()
+    resumed_summaries = {
+        fingerprint: journal_summaries[fingerprint] for fingerprint in posts_to_process if fingerprint in journal_summaries
+    }
+    if resumed_summaries:
+        posts_to_process = {
+            fingerprint: post for fingerprint, post in posts_to_process.items() if fingerprint not in resumed_summaries
+        }
+        print(f"♻️  Journal: khôi phục {len(resumed_summaries)} summary từ lần chạy trước, "
+              f"còn {len(posts_to_process)} post cần gọi API")
+    
+    # Xếp post vào batch theo ngân sách token
+    batches = build_batches(posts_to_process, max_input_tokens, max_output_tokens)
+    
     # Estimate time
-    num_batches = (len(unique_posts) + BATCH_SIZE - 1) // BATCH_SIZE
-    rate_limit = 60 / api_manager.limits["rpm"]  # Calculate delay based on RPM
+    num_batches = len(batches)
+    # Các key chạy song song nên RPM khả dụng là tổng RPM của mọi key
+    rate_limit = 60 / (api_manager.limits["rpm"] * len(api_manager.api_keys))
     estimated_minutes = num_batches * rate_limit / 60
     
     print(f"\n📊 Thông tin xử lý:")
     print(f"   Tổng số bản ghi: {len(df_original):,}")
     print(f"   Số post duy nhất: {len(unique_posts):,}")
-    print(f"   Kích thước batch: {BATCH_SIZE} posts/request")
-    print(f"   Số lượng batch: {num_batches}")
+    print(f"   Số post cần gọi API: {len(posts_to_process):,}")
+    print(f"   Ngân sách token: {max_input_tokens} input / {max_output_tokens} output mỗi request")
+    print(f"   Số lượng batch: {num_batches}"
+          f" (trung bình {len(posts_to_process) / max(num_batches, 1):.1f} posts/request)")
     print(f"   Model: {model_name}")
+    print(f"   API keys: {len(api_manager.api_keys)} (tối đa {api_manager.max_workers} request đồng thời)")
     print(f"   Rate limit: {rate_limit:.1f}s/batch")
     print(f"   Thời gian ước tính: {estimated_minutes:.1f} phút")
     
-    # Create batches - Explicitly convert to list
-    batches = []
-    for i in range(0, len(unique_posts), BATCH_SIZE):
-        batches.append(unique_posts[i:i+BATCH_SIZE])
-    
-    print(f"\n🔄 Đang xử lý {len(unique_posts)} bài viết trong {len(batches)} batch...")
+    print(f"\n🔄 Đang xử lý {len(posts_to_process)} bài viết trong {len(batches)} batch...")
     
     # Dictionary to store all summaries
-    all_summaries = {}
+    all_summaries = dict(cached_summaries)
+    all_summaries.update(resumed_summaries)
     
     # Text comparison content
     txt_content = [
@@ -813,7 +916,7 @@ def process_single_file(api_manager, input_file, version, model_name):
         f"File: {input_file.name}",
         f"Tạo vào: {pd.Timestamp.now()}",
         f"Tổng số post: {len(unique_posts)}",
-        f"Kích thước batch: {BATCH_SIZE}",
+        f"Ngân sách token: {max_input_tokens} input / {max_output_tokens} output",
         f"Model: {model_name}",
         "=" * 80,
         ""
@@ -821,37 +924,46 @@ def process_single_file(api_manager, input_file, version, model_name):
     
     start_time = time.time()
     
-    # Process all batches
-    for batch_idx, batch in enumerate(tqdm(batches, desc="Xử lý batch")):
-        batch_results = process_batch(api_manager, batch, batch_idx, len(batches))
-        all_summaries.update(batch_results)
+    def commit_summaries(summaries, tokens=None):
+        """Ghi journal (fsync) và cache các summary thành công; gọi được từ thread gửi request"""
+        journal.append(summaries, tokens)
+        if summary_cache is not None and summaries:
+            summary_cache.put_many(summaries)
+    
+    all_summaries.update(summarize_posts(api_manager, posts_to_process, batches, max_input_tokens,
+                                         max_output_tokens, stream, commit=commit_summaries,
+                                         commit_usage=journal.append_usage))
+    journal.close()
+    
+    # Add results to text comparison, in the original post order
+    for post_idx, (fingerprint, post) in enumerate(unique_posts.items()):
+        summary_text = all_summaries.get(fingerprint, "❌ Không thể tóm tắt")
+        source_note = (" (cache)" if fingerprint in cached_summaries else
+                       " (journal)" if fingerprint in resumed_summaries else "")
         
-        # Add batch results to text comparison
-        for post_idx, post in enumerate(batch):
-            post_num = batch_idx * BATCH_SIZE + post_idx + 1
-            summary_text = batch_results.get(post, "❌ Không thể tóm tắt")
-            
-            txt_content.extend([
-                f"POST {post_num}:",
-                "-" * 50,
-                "ORIGINAL:",
-                str(post),
-                "",
-                "SUMMARY:",
-                str(summary_text),
-                "",
-                "=" * 80,
-                ""
-            ])
+        txt_content.extend([
+            f"POST {post_idx + 1}{source_note}:",
+            "-" * 50,
+            "ORIGINAL:",
+            str(post),
+            "",
+            "SUMMARY:",
+            str(summary_text),
+            "",
+            "=" * 80,
+            ""
+        ])
     
     # Add summary column to original DataFrame
     df_output = df_original.copy()
     
-    # Create mapping and add summary column
-    for post in unique_posts:
-        summary_text = all_summaries.get(post, '')
-        mask = df_output[post_column] == post
-        df_output.loc[mask, 'summary'] = summary_text
+    # Gán summary cho mọi dòng bằng một lần map theo fingerprint
+    post_summaries = df_output[POST_FINGERPRINT_COLUMN].map(all_summaries)
+    post_summaries = post_summaries.where(~has_post | post_summaries.notna(), '')
+    if 'summary' in df_output.columns:
+        # Dòng không có post giữ nguyên summary cũ
+        post_summaries = post_summaries.where(has_post, df_output['summary'])
+    df_output['summary'] = post_summaries.tolist()
 
     # Make sure all required columns are present
     required_cols = ['post_id', 'post_raw', 'comment_id', 'comment_raw', 'created_date', 'platform']
@@ -892,11 +1004,6 @@ def process_single_file(api_manager, input_file, version, model_name):
     available_columns = [col for col in desired_order if col in df_output.columns]
     df_output = df_output[available_columns]
     
-    # Generate output filename - use 'summarized' not 'analyzed'
-    file_stem = input_file.stem
-    if not file_stem.endswith('_summarized'):
-        file_stem += '_summarized'
-    
     output_file = config.get_path(version, "summarized", filename=f"{file_stem}.xlsx")
     txt_file = config.get_path(version, "summarized", filename=f"{file_stem}_comparison.txt")
     
@@ -910,8 +1017,12 @@ def process_single_file(api_manager, input_file, version, model_name):
         print(f"✅ Đã lưu Excel: {output_file}")
     except Exception as e:
         print(f"❌ Lỗi khi lưu Excel: {e}")
+        print(f"   Các summary đã nhận vẫn nằm trong journal: {journal.path}")
         return None
     
+    # Kết quả đã nằm trong file Excel, journal không còn cần
+    journal.discard()
+    
     try:
         with open(txt_file, 'w', encoding='utf-8') as f:
             f.write('\n'.join(txt_content))
@@ -921,21 +1032,21 @@ def process_single_file(api_manager, input_file, version, model_name):
     
     # Stats for this file
     elapsed_time = time.time() - start_time
-    success_count = sum(1 for summary in all_summaries.values() 
-                       if isinstance(summary, str) and 
-                       summary and 
-                       "Không thể" not in summary and
-                       "JSON lỗi" not in summary and
-                       "bị chặn" not in summary)
+    success_count = sum(1 for summary in all_summaries.values() if is_successful_summary(summary))
     
     print(f"\n📊 Kết quả file {input_file.name}:")
     print(f"   ✅ Thành công: {success_count}/{len(unique_posts)}")
     print(f"   ❌ Thất bại: {len(unique_posts) - success_count}/{len(unique_posts)}")
+    print(f"   💾 Từ cache: {len(cached_summaries)}/{len(unique_posts)}")
+    if resumed_summaries:
+        print(f"   ♻️  Từ journal: {len(resumed_summaries)}/{len(unique_posts)}")
     print(f"   ⏱️  Thời gian xử lý: {elapsed_time/60:.2f} phút")
     
     return {
         'file': input_file.name,
         'success': success_count,
+        'cached': len(cached_summaries),
+        'resumed': len(resumed_summaries),
         'total': len(unique_posts),
         'time': elapsed_time
     }
@@ -943,7 +1054,7 @@ def process_single_file(api_manager, input_file, version, model_name):
 def list_available_models():
     """List all available Gemini models"""
     try:
-        genai.configure(api_key=API_KEYS[0])
+        configure_genai(API_KEYS[0])
         models = list(genai.list_models())
         
         print("\n📋 Available Gemini models:")
@@ -996,8 +1107,12 @@ def choose_model():
         else:
             return "gemini-2.0-flash"
 
-def main(version, source_type=None, target_files=None, process_all=False):
+def main(version, source_type=None, target_files=None, process_all=False, max_in_flight_per_key=MAX_IN_FLIGHT_PER_KEY,
+         summary_cache_path=None, use_summary_cache=True,
+         max_input_tokens=MAX_INPUT_TOKENS, max_output_tokens=MAX_OUTPUT_TOKENS, token_estimator_path=None,
+         stream=STREAM_RESPONSES, quota_db_path=None):
     """Main function - Analyze posts with improved prompt"""
+    global token_estimator
     # Check environment first
     if not check_environment():
         print("\n🚨 Environment check failed! Please fix the issues above.")
@@ -1009,9 +1124,6 @@ def main(version, source_type=None, target_files=None, process_all=False):
     # Choose model interactively
     model_name = choose_model()
     
-    # Initialize API manager
-    api_manager = APIKeyManager(API_KEYS, model_name)
-    
     # Choose source and files if not provided
     if source_type is None or target_files is None:
         source_type, target_files = choose_source_and_files(version)
@@ -1037,18 +1149,43 @@ def main(version, source_type=None, target_files=None, process_all=False):
         print("❌ Đã hủy")
         return
     
+    # Initialize API manager
+    quota = QuotaCoordinator(quota_db_path)
+    print(f"\n🚦 Quota ledger: {quota.path}")
+    api_manager = APIKeyManager(API_KEYS, model_name, max_in_flight_per_key, quota)
+    
+    if token_estimator_path is None:
+        token_estimator_path = config.get_path(version, "output", filename=TOKEN_ESTIMATOR_FILENAME)
+    token_estimator = TokenEstimator(token_estimator_path, model_name)
+    print(f"\n📏 {token_estimator.report()}")
+    
+    summary_cache = None
+    if use_summary_cache:
+        if summary_cache_path is None:
+            summary_cache_path = config.get_path(version, "summarized", filename=SUMMARY_CACHE_FILENAME)
+        summary_cache = SummaryCache(summary_cache_path, model_name, PROMPT_VERSION)
+        print(f"\n💾 Summary cache: {summary_cache_path} (prompt {PROMPT_VERSION}, {len(summary_cache):,} entries)")
+    
     # Process all files
     results = []
     total_start_time = time.time()
     
-    for i, file in enumerate(target_files):
-        print(f"\n{'='*70}")
-        print(f"FILE {i+1}/{len(target_files)}: {file.name}")
-        print(f"{'='*70}")
-        
-        result = process_single_file(api_manager, file, version, model_name)
-        if result:
-            results.append(result)
+    try:
+        for i, file in enumerate(target_files):
+            print(f"\n{'='*70}")
+            print(f"FILE {i+1}/{len(target_files)}: {file.name}")
+            print(f"{'='*70}")
+            
+            result = process_single_file(api_manager, file, version, model_name, summary_cache,
+                                         max_input_tokens, max_output_tokens, stream)
+            if result:
+                results.append(result)
+    finally:
+        if summary_cache is not None:
+            summary_cache.close()
+        print(f"\n📏 {token_estimator.report()}")
+        token_estimator.close()
+        quota.close()
     
     # Final summary
     total_elapsed = time.time() - total_start_time
@@ -1066,6 +1203,7 @@ def main(version, source_type=None, target_files=None, process_all=False):
         success_rate = (total_success / total_posts * 100) if total_posts > 0 else 0
         
         print(f"   ✅ Tổng posts thành công: {total_success}/{total_posts}")
+        print(f"   💾 Lấy từ cache: {sum(r['cached'] for r in results)}/{total_posts}")
         print(f"   📈 Tỷ lệ thành công: {success_rate:.1f}%")
     
     print(f"\n📈 Final API Usage:")
@@ -1091,4 +1229,6 @@ if __name__ == "__main__":
         print("❌ Version is required!")
         exit(1)
     
-    main(version, args.source, None, args.all)
\ No newline at end of file
+    main(version, args.source, None, args.all, args.max_in_flight_per_key,
+         args.summary_cache, not args.no_summary_cache,
+         args.max_input_tokens, args.max_output_tokens, args.token_estimator, not args.no_stream, args.quota_db)
\ No newline at end of file
@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Điều chỉnh đường dẫn import
+current_dir = Path(__file__).parent
+parent_dir = current_dir.parent
+sys.path.insert(0, str(parent_dir))
+
+from utils.text_normalization import TextNormalizer, deduplicate_comments, load_abbreviation_dictionary
+from utils.chunked_io import iter_chunks, ChunkWriter, STREAM_SUFFIXES
+from utils.dedup_index import DedupIndex, NORMALIZED_NAMESPACE, source_key
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Final 7-step text normalization (ported from Preprocessing.ipynb)')
+    parser.add_argument('--input', '-i', required=True,
+                        help='Input file (.csv, .jsonl, .parquet or .xlsx)')
+    parser.add_argument('--output', '-o',
+                        help='Output file (default: <input>_normalized with the same format)')
+    parser.add_argument('--dictionary', '-d',
+                        help='abbreviation_dictionary.json for lexical normalization (step 4 is skipped without it)')
+    parser.add_argument('--column', default='comment_raw',
+                        help='Column to normalize')
+    parser.add_argument('--output-column', default='comment_clean',
+                        help='Column to write normalized text to')
+    parser.add_argument('--columns', nargs='+',
+                        help='Only keep these input columns in the output (e.g. summary comment_raw label)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of worker processes for steps 1-6')
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help='Rows per chunk (per worker task, and per read in streaming mode)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read and write CSV/JSONL/Parquet in chunks with bounded memory')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Skip step 7 (deduplication on the normalized column)')
+    parser.add_argument('--dedup-index',
+                        help='Global dedup index (SQLite): step 7 also drops comments kept by earlier runs/files')
+    return parser.parse_args()
+
+
+def read_table(path):
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        return pd.read_csv(path)
+    if suffix == '.jsonl':
+        return pd.read_json(path, lines=True)
+    if suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def write_table(df, path):
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        df.to_csv(path, index=False)
+    elif suffix == '.jsonl':
+        df.to_json(path, orient='records', lines=True, force_ascii=False)
+    elif suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def print_summary(original_count, final_count, label_counts=None):
+    """In thống kê giống notebook"""
+    total_reduction = original_count - final_count
+    print("\n" + "="*50)
+    print(f"Original comments:      {original_count:,}")
+    if original_count:
+        print(f"Final comments:         {final_count:,} ({final_count/original_count*100:.1f}%)")
+        print(f"Total reduction:        {total_reduction:,} comments ({total_reduction/original_count*100:.1f}%)")
+
+    if label_counts is not None and len(label_counts) > 0:
+        print(f"\n Label Distribution:")
+        for label, count in label_counts.sort_index().items():
+            percentage = (count / final_count) * 100 if final_count else 0
+            print(f"  • {label:<18}: {count:,} ({percentage:.1f}%)")
+    print("="*50)
+
+
+def normalize_file(input_file, output_file, normalizer, column='comment_raw', output_column='comment_clean',
+                   columns=None, dedup=True, dedup_index=None):
+    """Chuẩn hóa cả file trong bộ nhớ"""
+    df = read_table(input_file)
+    if column not in df.columns:
+        print(f"Lỗi: Không tìm thấy cột {column}")
+        return None
+    if columns:
+        df = df[[col for col in columns if col in df.columns]].copy()
+    original_count = len(df)
+    print(f"Đã đọc {original_count:,} dòng từ {input_file}")
+
+    print("1-6. Normalizing Unicode, removing emoji/links/HTML/UI indicators, reducing elongation, "
+          "lexical normalization, punctuation and whitespace")
+    start_time = time.perf_counter()
+    df[output_column] = normalizer.normalize_many(df[column])
+    elapsed = time.perf_counter() - start_time
+    if elapsed > 0:
+        print(f"  Throughput: {original_count/elapsed:,.0f} rows/sec")
+
+    if dedup and dedup_index is not None:
+        print(f"7. Removing duplicate comments (global index {dedup_index.path})")
+        df, duplicates_df = dedup_index.split_new(df, output_column)
+        df = df.reset_index(drop=True)
+        print(f"  Removed {len(duplicates_df):,} duplicate comments")
+    elif dedup:
+        print("7. Removing duplicate comments")
+        before_dedup = len(df)
+        df = deduplicate_comments(df, col=output_column)
+        print(f"  Removed {before_dedup - len(df):,} duplicate comments")
+
+    write_table(df, output_file)
+    if dedup and dedup_index is not None:
+        dedup_index.add(df, output_column, source=source_key(input_file))
+    print(f"Normalized comments exported to: {output_file}")
+    print_summary(original_count, len(df), df['label'].value_counts() if 'label' in df.columns else None)
+    return df
+
+
+def normalize_stream(input_file, output_file, normalizer, column='comment_raw', output_column='comment_clean',
+                     columns=None, dedup=True, chunk_size=50000, dedup_index=None):
+    """
+    Chuẩn hóa theo chunk; dedup dùng tập hash của các comment đã giữ (16 byte mỗi comment),
+    hoặc dedup_index trên đĩa nếu có (trùng cả với các run trước)
+    """
+    seen = set()
+    original_count = 0
+    label_counts = None
+    start_time = time.perf_counter()
+
+    with ChunkWriter(output_file) as writer:
+        for chunk_idx, chunk in enumerate(iter_chunks(input_file, chunk_size)):
+            if column not in chunk.columns:
+                print(f"Lỗi: Không tìm thấy cột {column}")
+                return None
+            if columns:
+                chunk = chunk[[col for col in columns if col in chunk.columns]].copy()
+            original_count += len(chunk)
+            chunk[output_column] = normalizer.normalize_many(chunk[column])
+
+            if dedup and dedup_index is not None:
+                chunk, _ = dedup_index.split_new(chunk, output_column)
+                dedup_index.add(chunk, output_column, source=source_key(input_file))
+            elif dedup:
+                keep = []
+                for text in chunk[output_column]:
+                    key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+                    keep.append(key not in seen)
+                    seen.add(key)
+                chunk = chunk[keep]
+
+            writer.write(chunk)
+            if 'label' in chunk.columns:
+                counts = chunk['label'].value_counts()
+                label_counts = counts if label_counts is None else label_counts.add(counts, fill_value=0)
+            print(f"  - Chunk {chunk_idx+1}: đã xử lý {original_count:,} dòng, giữ lại {writer.rows_written:,}")
+
+    elapsed = time.perf_counter() - start_time
+    if elapsed > 0:
+        print(f"  Throughput: {original_count/elapsed:,.0f} rows/sec")
+    print(f"Normalized comments exported to: {output_file}")
+    if label_counts is not None:
+        label_counts = label_counts.astype(int)
+    print_summary(original_count, writer.rows_written, label_counts)
+    return writer.rows_written
+
+
+def main():
+    args = parse_args()
+    input_file = Path(args.input)
+    if not input_file.exists():
+        print(f"Lỗi: Không tìm thấy file input: {input_file}")
+        sys.exit(1)
+    output_file = Path(args.output) if args.output else input_file.with_name(f"{input_file.stem}_normalized{input_file.suffix}")
+    if args.stream and (input_file.suffix.lower() not in STREAM_SUFFIXES or output_file.suffix.lower() not in STREAM_SUFFIXES):
+        print(f"Lỗi: Chế độ streaming chỉ hỗ trợ {', '.join(STREAM_SUFFIXES)}")
+        sys.exit(1)
+
+    norm_dict = {}
+    if args.dictionary:
+        norm_dict = load_abbreviation_dictionary(args.dictionary)
+        print(f"Đã tải {len(norm_dict):,} mục từ điển: {args.dictionary}")
+    else:
+        print("Không có --dictionary, bỏ qua bước 4 (lexical normalization)")
+
+    dedup_index = DedupIndex(args.dedup_index, NORMALIZED_NAMESPACE) if args.dedup_index and not args.no_dedup else None
+    if dedup_index is not None:
+        released = dedup_index.remove_source(source_key(input_file))
+        if released:
+            print(f"Dedup index: gỡ {released:,} comment của lần chạy trước trên file này")
+    try:
+        with TextNormalizer(norm_dict, workers=args.workers, chunk_size=args.chunk_size) as normalizer:
+            kwargs = dict(column=args.column, output_column=args.output_column, columns=args.columns,
+                          dedup=not args.no_dedup, dedup_index=dedup_index)
+            if args.stream:
+                result = normalize_stream(input_file, output_file, normalizer, chunk_size=args.chunk_size, **kwargs)
+            else:
+                result = normalize_file(input_file, output_file, normalizer, **kwargs)
+    finally:
+        if dedup_index is not None:
+            dedup_index.close()
+
+    if result is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
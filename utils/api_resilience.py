@@ -0,0 +1,208 @@
+import random
+import re
+import time
+
+# Loại lỗi khi gọi Gemini API
+RATE_LIMITED = "rate_limited"        # 429 giới hạn theo phút (RPM/TPM): thử lại sau retry hint
+QUOTA_EXHAUSTED = "quota_exhausted"  # 429 hết quota ngày (RPD): bỏ key đến khi có lại quota
+SERVER_ERROR = "server_error"        # 5xx, timeout, mất kết nối: thử lại với backoff
+SAFETY_BLOCKED = "safety_blocked"    # Nội dung bị chặn: gửi lại cũng vô ích
+OTHER = "other"
+
+DEFAULT_RATE_LIMIT_COOLDOWN = 10     # Giây tạm ngưng key sau 429 không kèm retry hint
+DAILY_QUOTA_COOLDOWN = 60 * 60       # Giây bỏ key sau 429 hết quota ngày không kèm retry hint
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+_RETRY_PATTERNS = [
+    re.compile(r'retry in\s+([\d.]+)\s*(ms|s)\b', re.IGNORECASE),          # "Please retry in 37.4s."
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)'),                    # RetryInfo dạng text của gRPC
+    re.compile(r'"?retryDelay"?\s*[:=]\s*"?([\d.]+)s'),                    # RetryInfo dạng JSON của REST
+]
+_STATUS_PATTERN = re.compile(r'^\s*(\d{3})\b')
+# "finish_reason: SAFETY", "The candidate's [finish_reason](<link>) is 3."
+_FINISH_REASON_PATTERN = re.compile(r'finish_?reason(?:\]\([^)]*\))?\W*?(?:is\s+)?(\w+)', re.IGNORECASE)
+# FinishReason SAFETY / BLOCKLIST / PROHIBITED_CONTENT / SPII (tên hoặc giá trị enum)
+_SAFETY_FINISH_REASONS = {'SAFETY', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII', '3', '7', '8', '9'}
+_SERVER_ERROR_NAMES = {'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+                       'BadGateway', 'RemoteDisconnected', 'IncompleteRead', 'ChunkedEncodingError'}
+_SAFETY_ERROR_NAMES = {'BlockedPromptException'}
+
+
+class ApiError:
+    """Lỗi đã phân loại của một request: kind, HTTP status, số giây server yêu cầu chờ (retry_after)"""
+
+    def __init__(self, kind, status=None, retry_after=None, message=""):
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+    def __repr__(self):
+        return f"ApiError({self.kind}, status={self.status}, retry_after={self.retry_after})"
+
+
+def _detail_fields(detail):
+    """(retry delay giây, các quotaId) của một phần tử error.details (dict REST hoặc protobuf gRPC)"""
+    delay, quota_ids = None, []
+    if isinstance(detail, dict):
+        value = detail.get('retryDelay') or detail.get('retry_delay')
+        if isinstance(value, str) and value.endswith('s'):
+            try:
+                delay = float(value[:-1])
+            except ValueError:
+                pass
+        for violation in detail.get('violations') or []:
+            quota_ids.append(str(violation.get('quotaId') or violation.get('quota_id') or ''))
+    else:
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None:
+            delay = getattr(retry_delay, 'seconds', 0) + getattr(retry_delay, 'nanos', 0) / 1e9
+        for violation in getattr(detail, 'violations', None) or []:
+            quota_ids.append(str(getattr(violation, 'quota_id', '')))
+    return delay, quota_ids
+
+
+def parse_retry_after(text):
+    """Số giây chờ từ thông báo lỗi ("Please retry in 37.4s", RetryInfo retryDelay), None nếu không có"""
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            seconds = float(match.group(1))
+            if match.lastindex > 1 and match.group(2) == 'ms':
+                seconds /= 1000
+            return seconds
+    return None
+
+
+def classify_error(exc):
+    """
+    Phân loại exception của SDK (google.api_core / google.generativeai) theo status, error.details
+    (RetryInfo, QuotaFailure) và loại exception, thay cho việc dò chuỗi "429" trong thông báo.
+    """
+    message = str(exc)
+    name = type(exc).__name__
+
+    status = getattr(exc, 'code', None)
+    if not isinstance(status, int):
+        match = _STATUS_PATTERN.match(message)
+        status = int(match.group(1)) if match else None
+
+    retry_after, quota_ids = None, []
+    for detail in getattr(exc, 'details', None) or []:
+        delay, ids = _detail_fields(detail)
+        retry_after = delay if delay is not None else retry_after
+        quota_ids.extend(ids)
+    if retry_after is None:
+        retry_after = parse_retry_after(message)
+
+    if status == 429 or name in ('ResourceExhausted', 'TooManyRequests'):
+        daily = any('PerDay' in quota_id for quota_id in quota_ids) or 'PerDay' in message
+        return ApiError(QUOTA_EXHAUSTED if daily else RATE_LIMITED, 429, retry_after, message)
+
+    finish_reason = _FINISH_REASON_PATTERN.search(message)
+    if name in _SAFETY_ERROR_NAMES or 'block_reason' in message or (
+            finish_reason and finish_reason.group(1).upper() in _SAFETY_FINISH_REASONS):
+        return ApiError(SAFETY_BLOCKED, status, None, message)
+
+    if (status is not None and 500 <= status < 600) or name in _SERVER_ERROR_NAMES \
+            or isinstance(exc, (ConnectionError, TimeoutError)):
+        return ApiError(SERVER_ERROR, status, retry_after, message)
+    return ApiError(OTHER, status, retry_after, message)
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE, cap=BACKOFF_CAP, rng=random):
+    """
+    Số giây chờ trước lần thử thứ attempt + 1: theo retry hint của server nếu có (cộng jitter nhỏ
+    để các worker không cùng gửi lại một lúc), nếu không thì exponential backoff full jitter.
+    """
+    if retry_after is not None:
+        return retry_after + rng.uniform(0, base)
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker của một API key.
+
+    closed: gửi bình thường. Sau failure_threshold lỗi liên tiếp → open: không gửi trong
+    reset_timeout giây. Hết thời gian → half_open: cho một request thử; thành công thì
+    closed, lỗi thì open lại với thời gian gấp đôi (tối đa max_reset_timeout).
+    Không tự khóa: bên gọi giữ lock (vd. KeyScheduler).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=600.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.timeout = reset_timeout
+        self.open_until = 0.0
+
+    def wait_time(self):
+        """Số giây còn phải chờ trước khi được gửi (0 nếu closed / half_open)"""
+        if self.state == self.OPEN:
+            remaining = self.open_until - self.clock()
+            if remaining > 0:
+                return remaining
+            self.state = self.HALF_OPEN
+        return 0.0
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.timeout = self.reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.timeout = min(self.max_reset_timeout, self.timeout * 2)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.open_until = self.clock() + self.timeout
+        self.failures = 0
+
+
+class AdaptiveConcurrency:
+    """
+    Số request đồng thời tối đa của một key, điều chỉnh kiểu AIMD theo 429 quan sát được:
+    mỗi request thành công tăng 1/limit (≈ +1 sau một lượt đầy), mỗi đợt 429 nhân
+    decrease_factor (một lần mỗi decrease_interval giây, vì các request đang chạy cùng lúc
+    thường bị 429 cùng nhau). rate_limited_ratio là tỷ lệ 429 gần đây (EWMA).
+    Không tự khóa: bên gọi giữ lock.
+    """
+
+    def __init__(self, maximum, minimum=1, decrease_factor=0.5, decrease_interval=5.0, smoothing=0.1,
+                 clock=time.monotonic):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.smoothing = smoothing
+        self.clock = clock
+        self.limit = float(maximum)
+        self.rate_limited_ratio = 0.0
+        self._last_decrease = float('-inf')
+
+    @property
+    def max_in_flight(self):
+        return max(self.minimum, int(self.limit))
+
+    def on_success(self):
+        self.rate_limited_ratio *= 1 - self.smoothing
+        self.limit = min(self.maximum, self.limit + 1.0 / max(1.0, self.limit))
+
+    def on_rate_limited(self):
+        self.rate_limited_ratio = self.rate_limited_ratio * (1 - self.smoothing) + self.smoothing
+        now = self.clock()
+        if now - self._last_decrease >= self.decrease_interval:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            self._last_decrease = now
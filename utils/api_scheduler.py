@@ -0,0 +1,270 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+from utils.api_resilience import (
+    AdaptiveConcurrency, CircuitBreaker, DAILY_QUOTA_COOLDOWN, DEFAULT_RATE_LIMIT_COOLDOWN,
+    QUOTA_EXHAUSTED, RATE_LIMITED, SAFETY_BLOCKED
+)
+
+# Dung lượng bucket = tỷ lệ này × giới hạn mỗi phút: đủ để nhiều request chạy cùng
+# lúc nhưng không dồn cả quota một phút vào vài giây đầu
+BURST_FRACTION = 0.25
+
+
+class TokenBucket:
+    """Token bucket nạp đều `per_minute` đơn vị mỗi phút, chứa tối đa `capacity`"""
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, capacity if capacity is not None else per_minute * BURST_FRACTION)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Số giây cần chờ để có `amount` đơn vị (0 nếu có ngay)"""
+        self._refill()
+        # Request lớn hơn cả bucket chỉ cần bucket đầy
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        """Trừ thêm (delta > 0) hoặc hoàn lại (delta < 0) sau khi biết lượng dùng thực tế"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class KeyState:
+    """
+    Trạng thái quota của một API key: bucket RPM/TPM, số request trong ngày, request đang chạy,
+    circuit breaker và số request đồng thời tối đa (AIMD, không vượt max_in_flight cấu hình)
+    """
+
+    def __init__(self, api_key, limits, max_in_flight, clock=time.monotonic):
+        self.api_key = api_key
+        self.limits = limits
+        self.clock = clock
+        self.breaker = CircuitBreaker(clock=clock)
+        self.concurrency = AdaptiveConcurrency(max_in_flight, clock=clock)
+        self.rpm = TokenBucket(limits["rpm"], clock=clock)
+        self.tpm = TokenBucket(limits["tpm"], clock=clock)
+        self.day = date.today()
+        self.requests_today = 0
+        self.tokens_today = 0
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        # Hết quota ngày theo sổ quota dùng chung (request của các process khác)
+        self.exhausted_until = 0.0
+
+    def _reset_day_if_needed(self):
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.requests_today = 0
+            self.tokens_today = 0
+
+    @property
+    def max_in_flight(self):
+        # half_open: chỉ một request thử
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            return 1
+        return self.concurrency.max_in_flight
+
+    @property
+    def exhausted(self):
+        self._reset_day_if_needed()
+        return self.requests_today >= self.limits["rpd"] or self.clock() < self.exhausted_until
+
+    def wait_time(self, tokens):
+        """Số giây cần chờ trước khi key này gửi được request `tokens` token"""
+        if self.exhausted:
+            return float('inf')
+        cooldown = max(0.0, self.blocked_until - self.clock())
+        return max(cooldown, self.breaker.wait_time(), self.rpm.wait_time(1), self.tpm.wait_time(tokens))
+
+
+class KeyLease:
+    """Chỗ của một request do KeyScheduler.acquire() cấp: key, token ước tính và id chỗ giữ trong sổ quota"""
+
+    def __init__(self, api_key, estimated_tokens, reservation_id=None):
+        self.api_key = api_key
+        self.estimated_tokens = estimated_tokens
+        self.reservation_id = reservation_id
+
+    def __repr__(self):
+        return f"KeyLease(...{self.api_key[-4:]}, tokens={self.estimated_tokens}, reservation={self.reservation_id})"
+
+
+class KeyScheduler:
+    """
+    Phân phối request lên nhiều API key cùng lúc.
+
+    Mỗi key có token bucket RPM và TPM riêng (theo RATE_LIMITS của model), bộ đếm
+    RPD và giới hạn số request đang chạy. acquire() chọn key rảnh nhất còn quota và
+    trả về KeyLease (truyền lại cho release()), chờ (không giữ lock) khi mọi key đều
+    phải đợi, và trả về None khi mọi key đã hết quota trong ngày. Dùng an toàn từ nhiều thread.
+
+    quota (QuotaCoordinator, tùy chọn): trước khi giao key, chỗ được giữ trong sổ quota
+    dùng chung với các process khác; key bị từ chối được tạm ngưng đến khi có lại chỗ.
+    """
+
+    def __init__(self, api_keys, limits, max_in_flight_per_key=2, clock=time.monotonic, quota=None, model=None):
+        self.limits = limits
+        self.max_in_flight_per_key = max_in_flight_per_key
+        self.clock = clock
+        self.quota = quota
+        self.model = model
+        self.keys = [KeyState(key, limits, max_in_flight_per_key, clock) for key in api_keys]
+        self._by_key = {state.api_key: state for state in self.keys}
+        self._condition = threading.Condition()
+
+    @property
+    def max_workers(self):
+        """Số request tối đa có thể chạy đồng thời trên tất cả key"""
+        return len(self.keys) * self.max_in_flight_per_key
+
+    def acquire(self, tokens=1):
+        """
+        Giữ chỗ một request ước tính `tokens` token.
+
+        Returns:
+            KeyLease | None: key được chọn (kèm chỗ giữ trong sổ quota), None nếu mọi key
+            đã hết quota trong ngày
+        """
+        with self._condition:
+            while True:
+                best, best_wait = None, float('inf')
+                for state in self.keys:
+                    if state.in_flight >= state.max_in_flight:
+                        # Bận, nhưng sẽ rảnh khi có release()
+                        if not state.exhausted:
+                            best_wait = min(best_wait, 1.0)
+                        continue
+                    wait = state.wait_time(tokens)
+                    if wait == 0 and (best is None or state.in_flight < best.in_flight):
+                        best = state
+                    best_wait = min(best_wait, wait)
+
+                reservation_id = None
+                if best is not None and self.quota is not None:
+                    reservation_id, wait, reason = self.quota.reserve(best.api_key, self.model, self.limits, tokens)
+                    if reservation_id is None:
+                        # Process khác đã dùng hoặc chặn quota của key: ngưng key đến khi có chỗ, chọn lại.
+                        # Hết quota ngày (kể cả block "rpd" của process khác) thì bỏ key như exhausted
+                        if reason == "rpd":
+                            best.exhausted_until = max(best.exhausted_until, self.clock() + wait)
+                        else:
+                            best.blocked_until = max(best.blocked_until, self.clock() + wait)
+                        continue
+
+                if best is not None:
+                    best.rpm.consume(1)
+                    best.tpm.consume(tokens)
+                    best.requests_today += 1
+                    best.tokens_today += tokens
+                    best.in_flight += 1
+                    return KeyLease(best.api_key, tokens, reservation_id)
+                if best_wait == float('inf'):
+                    return None
+                self._condition.wait(timeout=best_wait)
+
+    def release(self, lease, actual_tokens=None):
+        """
+        Trả chỗ của lease sau khi request kết thúc; actual_tokens điều chỉnh bucket TPM
+        và được ghi vào đúng chỗ đã giữ của request này trong sổ quota.
+        """
+        with self._condition:
+            state = self._by_key[lease.api_key]
+            state.in_flight = max(0, state.in_flight - 1)
+            if actual_tokens is not None:
+                state.tpm.adjust(actual_tokens - lease.estimated_tokens)
+                state.tokens_today += actual_tokens - lease.estimated_tokens
+            if lease.reservation_id is not None:
+                self.quota.commit(lease.reservation_id, actual_tokens)
+                lease.reservation_id = None
+            self._condition.notify_all()
+
+    def cooldown(self, api_key, seconds):
+        """Tạm ngưng gửi trên một key (vd. sau lỗi 429), cho cả các process dùng chung sổ quota"""
+        with self._condition:
+            state = self._by_key[api_key]
+            state.blocked_until = max(state.blocked_until, self.clock() + seconds)
+            if self.quota is not None:
+                self.quota.block(api_key, self.model, seconds, reason="cooldown")
+            self._condition.notify_all()
+
+    def report(self, api_key, error=None, cooldown=DEFAULT_RATE_LIMIT_COOLDOWN):
+        """
+        Cập nhật sức khỏe của key theo kết quả một request (error: ApiError, None nếu thành công).
+
+        429 theo phút giảm số request đồng thời của key và tạm ngưng key theo retry hint của
+        server (mặc định cooldown giây); hết quota ngày bỏ key đến khi có lại quota; lỗi khác
+        tính vào circuit breaker. Nội dung bị chặn không phải lỗi của key.
+        """
+        with self._condition:
+            state = self._by_key[api_key]
+            if error is None or error.kind == SAFETY_BLOCKED:
+                state.breaker.record_success()
+                state.concurrency.on_success()
+                return
+            if error.kind == QUOTA_EXHAUSTED:
+                seconds = error.retry_after if error.retry_after is not None else DAILY_QUOTA_COOLDOWN
+                state.exhausted_until = max(state.exhausted_until, self.clock() + seconds)
+                if self.quota is not None:
+                    self.quota.block(api_key, self.model, seconds, reason="rpd")
+                self._condition.notify_all()
+                return
+            state.breaker.record_failure()
+            if error.kind == RATE_LIMITED:
+                state.concurrency.on_rate_limited()
+                self.cooldown(api_key, error.retry_after if error.retry_after is not None else cooldown)
+            self._condition.notify_all()
+
+    def usage_stats(self):
+        with self._condition:
+            return {
+                f"Key_{i+1}": {
+                    "requests_today": state.requests_today,
+                    "tokens_today": state.tokens_today,
+                    "in_flight": state.in_flight,
+                    "daily_limit": self.limits["rpd"],
+                    "minute_limit": self.limits["rpm"],
+                    "max_in_flight": state.max_in_flight,
+                    "rate_limited_ratio": round(state.concurrency.rate_limited_ratio, 3),
+                    "breaker": state.breaker.state,
+                }
+                for i, state in enumerate(self.keys)
+            }
+
+
+def run_in_order(func, items, max_workers, on_result=None):
+    """
+    Chạy func(index, item) trên thread pool, trả về list kết quả theo thứ tự items.
+
+    on_result(index, result) được gọi ở thread gọi hàm ngay khi từng item xong
+    (theo thứ tự hoàn thành), vd. để cập nhật progress bar.
+    """
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(func, index, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            if on_result is not None:
+                on_result(index, results[index])
+    return results
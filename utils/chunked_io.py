@@ -0,0 +1,97 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+STREAM_SUFFIXES = ('.csv', '.jsonl', '.parquet')
+
+
+def _suffix(path):
+    suffix = Path(path).suffix.lower()
+    if suffix not in STREAM_SUFFIXES:
+        raise ValueError(f"Unsupported streaming format '{suffix}' (use {', '.join(STREAM_SUFFIXES)})")
+    return suffix
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet streaming requires pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def iter_chunks(path, chunk_size=50000):
+    """Đọc file CSV/JSONL/Parquet theo từng chunk DataFrame có kích thước cố định"""
+    suffix = _suffix(path)
+    offset = 0
+
+    if suffix == '.csv':
+        reader = pd.read_csv(path, chunksize=chunk_size)
+    elif suffix == '.jsonl':
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        pa = _require_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path)
+        reader = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size))
+
+    for chunk in reader:
+        # Giữ index liên tục giữa các chunk như khi đọc cả file một lần
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+class ChunkWriter:
+    """Ghi nối tiếp từng chunk DataFrame vào file CSV/JSONL/Parquet"""
+
+    def __init__(self, path, columns=None):
+        self.path = Path(path)
+        self.suffix = _suffix(path)
+        self.columns = list(columns) if columns is not None else None
+        self.rows_written = 0
+        self._parquet_writer = None
+        self._schema = None
+        self._started = False
+
+        # Ghi đè output cũ giống mode 'w'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, df):
+        """Append một chunk; cột được chuẩn hóa theo chunk đầu tiên"""
+        if df is None or len(df) == 0:
+            return
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+
+        if self.suffix == '.csv':
+            df.to_csv(self.path, mode='a', header=not self._started, index=False)
+        elif self.suffix == '.jsonl':
+            text = df.to_json(orient='records', lines=True, force_ascii=False)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(text if text.endswith('\n') else text + '\n')
+        else:
+            pa = _require_pyarrow()
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._parquet_writer is None:
+                self._schema = table.schema
+                self._parquet_writer = pa.parquet.ParquetWriter(self.path, self._schema)
+            self._parquet_writer.write_table(table)
+
+        self._started = True
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
@@ -0,0 +1,87 @@
+import hashlib
+import sqlite3
+from pathlib import Path
+
+from utils.text_cleaning import CLEANER_VERSION
+
+CACHE_FILENAME = "clean_cache.sqlite"
+
+# Giới hạn số tham số mỗi câu lệnh SQLite
+_QUERY_BATCH = 900
+
+
+def text_key(text, version=CLEANER_VERSION):
+    """Hash cố định 16 byte của (phiên bản cleaner, comment gốc)"""
+    data = f"{version}\x00{text}".encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class CleanCache:
+    """
+    Cache SQLite cho kết quả cleaning: hash(comment gốc, CLEANER_VERSION) → (text đã clean, số từ).
+
+    Phiên bản cleaner nằm trong khóa hash, nên khi CLEANER_VERSION thay đổi các
+    entry cũ không còn khớp; chúng được xóa ngay khi mở cache.
+    """
+
+    def __init__(self, path, version=CLEANER_VERSION):
+        self.path = Path(path)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS clean_cache ("
+            " key BLOB PRIMARY KEY,"
+            " version TEXT NOT NULL,"
+            " cleaned TEXT NOT NULL,"
+            " word_count INTEGER NOT NULL)"
+        )
+        stale = self.conn.execute("DELETE FROM clean_cache WHERE version != ?", (self.version,)).rowcount
+        self.conn.commit()
+        if stale:
+            print(f"  - Clean cache: đã xóa {stale:,} entry của phiên bản cleaner cũ")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM clean_cache").fetchone()[0]
+
+    def keys_for(self, texts):
+        return [text_key(text, self.version) for text in texts]
+
+    def get_many(self, keys):
+        """Trả về dict key → (cleaned, word_count) cho các key đã có trong cache"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), _QUERY_BATCH):
+            batch = unique_keys[start:start + _QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, cleaned, word_count FROM clean_cache WHERE key IN ({placeholders})", batch
+            )
+            for key, cleaned, word_count in rows:
+                found[key] = (cleaned, word_count)
+        self.hits += len(found)
+        self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Lưu iterable (key, cleaned, word_count)"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO clean_cache (key, version, cleaned, word_count) VALUES (?, ?, ?, ?)",
+            ((key, self.version, cleaned, int(word_count)) for key, cleaned, word_count in entries),
+        )
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
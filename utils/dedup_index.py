@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DEDUP_INDEX_FILENAME = "dedup_index.sqlite"
+
+# Tên không gian hash: text sau 1_first_clean và text sau chuẩn hóa cuối khác nhau
+CLEAN_NAMESPACE = "clean"
+NORMALIZED_NAMESPACE = "normalized"
+
+DUPLICATE_TEXT_REASON = "Duplicate text of a previously kept comment"
+DUPLICATE_ID_REASON = "Comment id already kept for this platform"
+DUPLICATE_BATCH_REASON = "Duplicate text within this batch"
+
+
+def text_hash(text):
+    """Hash cố định 16 byte của text đã clean"""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def source_key(path):
+    """Nguồn ghi vào index cho một file input: đường dẫn tuyệt đối (file cùng tên ở version khác là nguồn khác)"""
+    return str(Path(path).resolve())
+
+
+def _key_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+        return None
+    return str(value)
+
+
+class DedupIndex:
+    """
+    Index dedup toàn cục trên đĩa (SQLite) cho mọi comment đã được giữ lại.
+
+    Lưu hash 16 byte của text đã clean và cặp (platform, comment_id), theo từng
+    namespace. Truy vấn và thêm đều theo lô qua bảng tạm nên một lần gọi xử lý
+    được hàng triệu dòng, dùng chung cho cleaning, merge và chuẩn hóa cuối.
+
+    Mỗi dòng ghi lại file nguồn đã thêm nó. Chạy lại một file phải gọi
+    remove_source() trước, nếu không comment của chính file đó (từ lần chạy trước,
+    hoặc các chunk đã thêm trước khi lần chạy trước bị dừng) bị coi là trùng.
+    """
+
+    def __init__(self, path, namespace=CLEAN_NAMESPACE):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS text_hashes ("
+            " namespace TEXT NOT NULL,"
+            " hash BLOB NOT NULL,"
+            " platform TEXT,"
+            " comment_id TEXT,"
+            " source TEXT,"
+            " added_at TEXT,"
+            " PRIMARY KEY (namespace, hash)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS comment_keys ("
+            " namespace TEXT NOT NULL,"
+            " platform TEXT NOT NULL,"
+            " comment_id TEXT NOT NULL,"
+            " source TEXT,"
+            " PRIMARY KEY (namespace, platform, comment_id)) WITHOUT ROWID"
+        )
+        # Index tạo trước khi comment_keys có cột source
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(comment_keys)")}
+        if 'source' not in columns:
+            self.conn.execute("ALTER TABLE comment_keys ADD COLUMN source TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS text_hashes_source ON text_hashes (namespace, source)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS comment_keys_source ON comment_keys (namespace, source)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM text_hashes WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def _existing_hashes(self, hashes):
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_hashes (hash BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("DELETE FROM query_hashes")
+        self.conn.executemany("INSERT OR IGNORE INTO query_hashes VALUES (?)", ((h,) for h in hashes))
+        rows = self.conn.execute(
+            "SELECT q.hash FROM query_hashes q JOIN text_hashes t ON t.namespace = ? AND t.hash = q.hash",
+            (self.namespace,)
+        )
+        return {row[0] for row in rows}
+
+    def _existing_keys(self, keys):
+        self.conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS query_keys (platform TEXT, comment_id TEXT,"
+            " PRIMARY KEY (platform, comment_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("DELETE FROM query_keys")
+        self.conn.executemany("INSERT OR IGNORE INTO query_keys VALUES (?, ?)", keys)
+        rows = self.conn.execute(
+            "SELECT q.platform, q.comment_id FROM query_keys q JOIN comment_keys k"
+            " ON k.namespace = ? AND k.platform = q.platform AND k.comment_id = q.comment_id",
+            (self.namespace,)
+        )
+        return {(row[0], row[1]) for row in rows}
+
+    def _frame_keys(self, df, text_column, platform_column, id_column):
+        hashes = [text_hash(text) if isinstance(text, str) else None for text in df[text_column]]
+        platforms = df[platform_column].map(_key_value) if platform_column in df.columns else pd.Series(None, index=df.index)
+        comment_ids = df[id_column].map(_key_value) if id_column in df.columns else pd.Series(None, index=df.index)
+        keys = [
+            (platform or '', comment_id) if comment_id is not None else None
+            for platform, comment_id in zip(platforms, comment_ids)
+        ]
+        return hashes, keys
+
+    def find_duplicates(self, df, text_column, platform_column='platform', id_column='comment_id'):
+        """
+        Đánh dấu các dòng trùng với index hoặc trùng với dòng đứng trước trong cùng lô.
+
+        Returns:
+            pd.Series: lý do trùng cho mỗi dòng (None = comment mới)
+        """
+        hashes, keys = self._frame_keys(df, text_column, platform_column, id_column)
+        existing_hashes = self._existing_hashes(h for h in hashes if h is not None)
+        existing_keys = self._existing_keys([k for k in keys if k is not None])
+
+        reasons = []
+        batch_hashes = set()
+        for h, key in zip(hashes, keys):
+            if key is not None and key in existing_keys:
+                reasons.append(DUPLICATE_ID_REASON)
+            elif h is not None and h in existing_hashes:
+                reasons.append(DUPLICATE_TEXT_REASON)
+            elif h is not None and h in batch_hashes:
+                reasons.append(DUPLICATE_BATCH_REASON)
+            else:
+                reasons.append(None)
+                if h is not None:
+                    batch_hashes.add(h)
+        return pd.Series(reasons, index=df.index, dtype=object)
+
+    def split_new(self, df, text_column, platform_column='platform', id_column='comment_id'):
+        """
+        Tách lô thành (new_df, duplicates_df); duplicates_df có cột removal_reason.
+        Không ghi gì vào index (gọi add() cho các dòng cuối cùng được giữ).
+        """
+        reasons = self.find_duplicates(df, text_column, platform_column, id_column)
+        is_new = reasons.isna()
+        duplicates_df = df[~is_new].copy()
+        if len(duplicates_df) > 0:
+            duplicates_df['removal_reason'] = reasons[~is_new]
+        return df[is_new], duplicates_df
+
+    def add(self, df, text_column, platform_column='platform', id_column='comment_id', source=None):
+        """Thêm các dòng đã giữ vào index (bỏ qua hash / comment id đã có)"""
+        hashes, keys = self._frame_keys(df, text_column, platform_column, id_column)
+        added_at = datetime.now().isoformat(timespec='seconds')
+        source = str(source) if source is not None else None
+        added = self.conn.executemany(
+            "INSERT OR IGNORE INTO text_hashes (namespace, hash, platform, comment_id, source, added_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (self.namespace, h, key[0] if key else None, key[1] if key else None, source, added_at)
+                for h, key in zip(hashes, keys) if h is not None
+            )
+        ).rowcount
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO comment_keys (namespace, platform, comment_id, source) VALUES (?, ?, ?, ?)",
+            ((self.namespace, key[0], key[1], source) for key in keys if key is not None)
+        )
+        self.conn.commit()
+        return added
+
+    def remove_source(self, source):
+        """
+        Gỡ mọi dòng do `source` thêm vào (gọi trước khi xử lý lại file đó, để lần chạy mới
+        thay thế phần đóng góp của lần trước thay vì coi chính nó là trùng).
+
+        Returns:
+            int: số text đã gỡ
+        """
+        source = str(source)
+        removed = self.conn.execute(
+            "DELETE FROM text_hashes WHERE namespace = ? AND source = ?", (self.namespace, source)
+        ).rowcount
+        self.conn.execute("DELETE FROM comment_keys WHERE namespace = ? AND source = ?", (self.namespace, source))
+        self.conn.commit()
+        return removed
+
+    def remove(self, df, text_column, platform_column='platform', id_column='comment_id'):
+        """Gỡ các dòng khỏi index (vd. comment mới bị loại ở bước sau trong cùng run)"""
+        hashes, keys = self._frame_keys(df, text_column, platform_column, id_column)
+        self.conn.executemany(
+            "DELETE FROM text_hashes WHERE namespace = ? AND hash = ?",
+            ((self.namespace, h) for h in hashes if h is not None)
+        )
+        self.conn.executemany(
+            "DELETE FROM comment_keys WHERE namespace = ? AND platform = ? AND comment_id = ?",
+            ((self.namespace, key[0], key[1]) for key in keys if key is not None)
+        )
+        self.conn.commit()
+
+    def stats(self):
+        """Số hash và comment id theo namespace"""
+        rows = self.conn.execute(
+            "SELECT namespace, COUNT(*) FROM text_hashes GROUP BY namespace"
+        ).fetchall()
+        key_rows = dict(self.conn.execute(
+            "SELECT namespace, COUNT(*) FROM comment_keys GROUP BY namespace"
+        ).fetchall())
+        return {namespace: {'texts': count, 'comment_ids': key_rows.get(namespace, 0)} for namespace, count in rows}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect the global dedup index')
+    parser.add_argument('index', help='Path to dedup_index.sqlite')
+    args = parser.parse_args()
+
+    with DedupIndex(args.index) as index:
+        stats = index.stats()
+    if not stats:
+        print("Index trống")
+    for namespace, counts in stats.items():
+        print(f"{namespace}: {counts['texts']:,} texts, {counts['comment_ids']:,} comment ids")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import threading
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client_module
+
+# Gửi request tới endpoint khác API thật (vd. benchmarks/fake_gemini_server.py): http://127.0.0.1:8765
+API_ENDPOINT_ENV = "GEMINI_API_ENDPOINT"
+
+
+def endpoint_options():
+    """transport / client_options cho endpoint trong GEMINI_API_ENDPOINT (dict rỗng nếu không đặt)"""
+    endpoint = os.environ.get(API_ENDPOINT_ENV)
+    if not endpoint:
+        return {}
+    return {'transport': 'rest', 'client_options': {'api_endpoint': endpoint}}
+
+
+def configure_genai(api_key):
+    """genai.configure(api_key) có tính đến GEMINI_API_ENDPOINT"""
+    genai.configure(api_key=api_key, **endpoint_options())
+
+
+class GenAIClientPool:
+    """
+    Một generative client riêng cho mỗi API key.
+
+    genai.configure() chỉ có một cấu hình toàn cục nên không thể gửi song song trên
+    nhiều key; mỗi key ở đây có _ClientManager riêng của SDK và GenerativeModel
+    được gắn client của key đó, nên các thread dùng key khác nhau không ảnh hưởng nhau.
+    """
+
+    def __init__(self, api_keys, transport=None, client_options=None):
+        self.api_keys = list(api_keys)
+        if transport is None and client_options is None:
+            options = endpoint_options()
+            transport, client_options = options.get('transport'), options.get('client_options')
+        self.transport = transport
+        self.client_options = dict(client_options or {})
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, api_key):
+        """Generative client (tạo một lần) cho api_key"""
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                manager = genai_client_module._ClientManager()
+                options = dict(self.client_options, api_key=api_key)
+                manager.configure(transport=self.transport, client_options=options)
+                client = manager.get_default_client("generative")
+                self._clients[api_key] = client
+            return client
+
+    def model(self, api_key, model_name, **kwargs):
+        """GenerativeModel gửi request bằng api_key (kwargs như genai.GenerativeModel)"""
+        model = genai.GenerativeModel(model_name, **kwargs)
+        model._client = self.client(api_key)
+        return model
@@ -0,0 +1,293 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+# Ký tự kết thúc một giá trị không có dấu ngoặc kép (số, true/false, từ trần)
+_BARE_STOP = set(",:]}\"'\n")
+# Độ dài tối đa của key khi nhìn trước "key": sau dấu nháy (giữ parser tuyến tính)
+_KEY_LOOKAHEAD = 64
+
+
+class _LenientParser:
+    """
+    Parser JSON dễ dãi, một lượt O(n) trên text.
+
+    Chịu được: code fence / lời dẫn quanh JSON, xuống dòng thật trong chuỗi,
+    thiếu dấu phẩy, dấu phẩy thừa, dấu " không escape bên trong chuỗi, key không
+    có ngoặc kép, escape sai và JSON bị cắt cụt (các object / mảng đang mở được
+    đóng lại; thuộc tính có chuỗi bị cắt dở bị bỏ để không lưu giá trị thiếu).
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.n = len(text)
+        self.pos = 0
+        # Chuỗi vừa parse kết thúc vì hết text (không có nháy đóng)
+        self.unterminated = False
+
+    def skip_whitespace(self):
+        text, pos, n = self.text, self.pos, self.n
+        while pos < n and text[pos] in _WHITESPACE:
+            pos += 1
+        self.pos = pos
+
+    def skip_separators(self):
+        """Bỏ qua khoảng trắng, dấu phẩy (kể cả thừa) và code fence"""
+        text, n = self.text, self.n
+        while True:
+            self.skip_whitespace()
+            if self.pos < n and text[self.pos] == ',':
+                self.pos += 1
+            elif text.startswith('```', self.pos):
+                self.pos += 3
+            else:
+                return
+
+    def parse(self):
+        # Bắt đầu từ dấu { hoặc [ đầu tiên (bỏ qua ```json và lời dẫn)
+        starts = [i for i in (self.text.find('{'), self.text.find('[')) if i != -1]
+        if not starts:
+            return None
+        self.pos = min(starts)
+        return self.parse_value()
+
+    def parse_value(self, in_array=False):
+        self.skip_whitespace()
+        if self.pos >= self.n:
+            return None
+        char = self.text[self.pos]
+        if char == '{':
+            return self.parse_object()
+        if char == '[':
+            return self.parse_array()
+        if char == '"' or char == "'":
+            return self.parse_string(char, in_array=in_array)
+        return self.parse_bare()
+
+    def parse_object(self):
+        self.pos += 1
+        result = {}
+        text, n = self.text, self.n
+        while True:
+            self.skip_separators()
+            if self.pos >= n:
+                return result
+            char = text[self.pos]
+            if char == '}':
+                self.pos += 1
+                return result
+            if char == ']':
+                # Ngoặc đóng lệch: coi như đóng object
+                self.pos += 1
+                return result
+            if char == '"' or char == "'":
+                key = self.parse_string(char, in_key=True)
+            else:
+                key = self.parse_bare()
+                if key is None:
+                    self.pos += 1
+                    continue
+                key = str(key)
+            self.skip_whitespace()
+            if self.pos < n and text[self.pos] == ':':
+                self.pos += 1
+            self.unterminated = False
+            value = self.parse_value()
+            if self.unterminated:
+                self.unterminated = False
+            else:
+                result[key] = value
+
+    def parse_array(self):
+        self.pos += 1
+        result = []
+        text, n = self.text, self.n
+        while True:
+            self.skip_separators()
+            if self.pos >= n:
+                return result
+            char = text[self.pos]
+            if char == ']' or char == '}':
+                self.pos += 1
+                return result
+            start = self.pos
+            result.append(self.parse_value(in_array=True))
+            if self.pos == start:
+                # Không tiến được (ký tự lạ): bỏ qua để luôn kết thúc
+                result.pop()
+                self.pos += 1
+
+    def _skip_whitespace_from(self, i):
+        text, n = self.text, self.n
+        while i < n and text[i] in _WHITESPACE:
+            i += 1
+        return i
+
+    def _key_follows(self, i):
+        """Tại i có một key ("key": hoặc key ASCII không nháy:) không, nhìn trước tối đa _KEY_LOOKAHEAD ký tự"""
+        text, n = self.text, self.n
+        if i >= n:
+            return False
+        char = text[i]
+        if char == '"' or char == "'":
+            end = text.find(char, i + 1, i + 2 + _KEY_LOOKAHEAD)
+            if end == -1:
+                return False
+            j = end + 1
+        else:
+            j = i
+            limit = min(n, i + _KEY_LOOKAHEAD)
+            while j < limit and text[j].isascii() and (text[j].isalnum() or text[j] == '_'):
+                j += 1
+            if j == i:
+                return False
+        j = self._skip_whitespace_from(j)
+        return j < n and text[j] == ':'
+
+    def _value_follows_comma(self, i, in_array):
+        """
+        Sau dấu nháy là dấu phẩy (tại i): nháy đó chỉ đóng chuỗi khi sau dấu phẩy là
+        phần tử tiếp theo thật sự - key mới (trong object), một giá trị (trong mảng),
+        ngoặc hoặc hết text. Nếu không, đó là trích dẫn trong chuỗi: "từ "bò đỏ", "vẹm" ..."
+        """
+        text, n = self.text, self.n
+        i = self._skip_whitespace_from(i + 1)
+        if i >= n:
+            return True
+        char = text[i]
+        if char in '{}]':
+            return True
+        if in_array:
+            return char in '"\'[-' or char.isdigit() or text.startswith(('true', 'false', 'null'), i)
+        return self._key_follows(i)
+
+    def _closes_string(self, pos, in_key, in_array=False):
+        """
+        Dấu nháy tại pos có phải nháy đóng chuỗi không: đúng khi sau nó (bỏ khoảng
+        trắng) là } ] (hoặc : với key), hết text, dấu phẩy rồi tới phần tử tiếp theo,
+        hoặc một chuỗi mới ở dòng sau (thiếu dấu phẩy giữa hai phần tử).
+        """
+        text, n = self.text, self.n
+        i = pos + 1
+        newline = False
+        while i < n and text[i] in _WHITESPACE:
+            newline = newline or text[i] == '\n'
+            i += 1
+        if i >= n:
+            return True
+        char = text[i]
+        if char in '}]':
+            return True
+        if char == ',':
+            return in_key or self._value_follows_comma(i, in_array)
+        if char == ':':
+            return in_key
+        if in_key:
+            return False
+        if char == '{':
+            return newline
+        if char != '"':
+            return False
+        if newline:
+            return True
+        # Thiếu dấu phẩy trên cùng dòng: "a" "key": ...
+        end = text.find('"', i + 1, i + 2 + _KEY_LOOKAHEAD)
+        if end == -1:
+            return False
+        j = end + 1
+        while j < n and text[j] in _WHITESPACE:
+            j += 1
+        return j < n and text[j] == ':'
+
+    def parse_string(self, quote, in_key=False, in_array=False):
+        text, n = self.text, self.n
+        pos = self.pos + 1
+        parts = []
+        segment_start = pos
+        while pos < n:
+            char = text[pos]
+            if char == '\\':
+                parts.append(text[segment_start:pos])
+                if pos + 1 >= n:
+                    pos += 1
+                    segment_start = pos
+                    break
+                escape = text[pos + 1]
+                if escape == 'u' and pos + 6 <= n:
+                    try:
+                        parts.append(chr(int(text[pos + 2:pos + 6], 16)))
+                        pos += 6
+                        segment_start = pos
+                        continue
+                    except ValueError:
+                        pass
+                # Escape không hợp lệ: giữ nguyên ký tự sau dấu \
+                parts.append(_ESCAPES.get(escape, escape))
+                pos += 2
+                segment_start = pos
+                continue
+            if char == quote and self._closes_string(pos, in_key, in_array):
+                parts.append(text[segment_start:pos])
+                self.pos = pos + 1
+                return "".join(parts)
+            if char == '`' and text.startswith('```', pos):
+                # Code fence đóng khi chuỗi cuối bị cắt cụt
+                break
+            pos += 1
+        parts.append(text[segment_start:pos])
+        self.pos = pos
+        self.unterminated = True
+        return "".join(parts)
+
+    def parse_bare(self):
+        text, n = self.text, self.n
+        start = pos = self.pos
+        while pos < n and text[pos] not in _BARE_STOP:
+            pos += 1
+        self.pos = pos
+        word = text[start:pos].strip()
+        if not word:
+            return None
+        if word in _LITERALS:
+            return _LITERALS[word]
+        try:
+            return int(word)
+        except ValueError:
+            pass
+        try:
+            return float(word)
+        except ValueError:
+            return word
+
+
+def lenient_loads(text):
+    """
+    Parse JSON trong response của model một lượt, chấp nhận các lỗi định dạng thường gặp.
+
+    Returns:
+        dict | list | None: giá trị JSON đầu tiên tìm thấy, None nếu text không có { hoặc [
+    """
+    if not isinstance(text, str):
+        return None
+    return _LenientParser(text).parse()
+
+
+def parse_json_response(text):
+    """
+    json.loads nếu response là JSON hợp lệ (sau khi bỏ code fence), nếu không thì lenient_loads.
+
+    Returns:
+        dict | list | None
+    """
+    if not isinstance(text, str):
+        return None
+    stripped = text.strip()
+    if stripped.startswith('```'):
+        stripped = stripped.strip('`').strip()
+        if stripped.startswith('json'):
+            stripped = stripped[4:]
+    try:
+        return json.loads(stripped, strict=False)
+    except json.JSONDecodeError:
+        return lenient_loads(text)
@@ -0,0 +1,62 @@
+import json
+
+from utils.json_repair import lenient_loads
+
+
+class JsonObjectExtractor:
+    """
+    Tách object JSON từ text nhận theo từng chunk (response dạng stream).
+
+    feed() trả về các object "lá" (không chứa object con, vd. từng
+    {"id": ..., "summary": ...} trong mảng results) ngay khi dấu } của chúng
+    xuất hiện, không cần chờ toàn bộ JSON. Dấu ngoặc trong chuỗi và ký tự
+    escape được bỏ qua đúng; text ngoài JSON (```json, lời dẫn) không ảnh hưởng.
+    Object lỗi cú pháp (thiếu dấu phẩy, escape sai...) được sửa bằng lenient_loads.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        # Mỗi object đang mở: [vị trí '{', đã có object con hay chưa]
+        self._stack = []
+
+    def feed(self, chunk):
+        """Thêm một chunk text; trả về list các object lá vừa đóng"""
+        if not chunk:
+            return []
+        self._text += chunk
+        text = self._text
+        objects = []
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._stack:
+                    self._stack[-1][1] = True
+                self._stack.append([i, False])
+            elif char == '}' and self._stack:
+                start, has_child = self._stack.pop()
+                if not has_child:
+                    try:
+                        # strict=False: chấp nhận xuống dòng thật trong chuỗi
+                        obj = json.loads(text[start:i + 1], strict=False)
+                    except json.JSONDecodeError:
+                        obj = lenient_loads(text[start:i + 1])
+                    if isinstance(obj, dict):
+                        objects.append(obj)
+        self._pos = len(text)
+        if not self._stack:
+            # Không còn object mở: phần đã quét không cần giữ lại
+            self._text = ""
+            self._pos = 0
+        return objects
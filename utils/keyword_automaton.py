@@ -0,0 +1,79 @@
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick automaton for case-insensitive substring keyword matching.
+
+    Built once from a keyword list; each scan is a single pass over the text
+    with one transition lookup per character, so the cost does not grow with
+    the number of keywords.
+    """
+
+    def __init__(self, keywords):
+        # Giữ thứ tự và bỏ trùng sau khi lowercase
+        self.keywords = list(dict.fromkeys(k.lower() for k in keywords if k))
+
+        goto = [{}]
+        outputs = [[]]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(keyword)
+
+        # BFS để tính failure link rồi gộp thành bảng chuyển trạng thái đầy đủ (DFA),
+        # chỉ lưu các transition khác trạng thái gốc. Con của root có fail = 0.
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            transitions = dict(delta[fail[state]])
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                transitions[ch] = child
+                queue.append(child)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def find_all(self, text):
+        """Trả về tất cả keyword xuất hiện trong text (theo thứ tự gặp đầu tiên)"""
+        if not isinstance(text, str) or not text:
+            return []
+        delta = self._delta
+        outputs = self._outputs
+        found = {}
+        state = 0
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for keyword in outputs[state]:
+                    found.setdefault(keyword, None)
+        return list(found)
+
+    def contains_any(self, text, keywords=None):
+        """True nếu text chứa ít nhất một keyword (hoặc một keyword trong tập con cho trước)"""
+        if not isinstance(text, str) or not text:
+            return False
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                if keywords is None or not keywords.isdisjoint(outputs[state]):
+                    return True
+        return False
@@ -0,0 +1,119 @@
+import re
+
+
+def classify_slang(slang):
+    """'pure' (chỉ ký hiệu), 'mixed' (ký hiệu + chữ) hoặc 'word' - giống phân loại của notebook"""
+    if re.fullmatch(r"[^\w\s]+", slang):
+        return 'pure'
+    if re.search(r"[^\w\s]", slang) and re.search(r"\w", slang):
+        return 'mixed'
+    return 'word'
+
+
+def trie_pattern(keys):
+    """
+    Regex dạng trie cho một tập key: mỗi ký tự chỉ được so khớp một lần, nhánh
+    dài hơn được thử trước nên luôn ưu tiên key dài nhất (có backtrack nếu cần).
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        end = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if end else body
+
+    return build(trie)
+
+
+class LexicalNormalizer:
+    """
+    Chuẩn hóa teencode với số lần quét cố định (một lần cho mỗi nhóm mixed → pure → words).
+
+    Mỗi nhóm là một regex trie nên chi phí mỗi vị trí không tăng theo kích thước từ
+    điển; từ chuẩn được tra qua dict. Cố gắng cho cùng kết quả với vòng lặp tuần tự
+    apply_lexical_normalization của notebook:
+    - nhóm sau chạy trên text đã thay của nhóm trước, nên \\b của words được xét sau
+      khi key ký hiệu đã được thay (vd. "à^^ok" với key "^^") và match của nhóm
+      trước luôn thắng match chồng lấn của nhóm sau;
+    - từ chuẩn được thay trước bằng các key cùng nhóm đứng sau nó trong thứ tự của
+      notebook (thay dây chuyền, vd. "ck" → giá trị chứa "k").
+
+    Vẫn có thể khác vòng lặp tuần tự ở hai trường hợp hiếm: trong cùng một nhóm,
+    một key ngắn hơn bắt đầu trước chồng lấn một key dài hơn (quét trái sang phải
+    lấy key bắt đầu trước), và một key chỉ xuất hiện khi từ chuẩn ghép với text
+    xung quanh nó (vòng lặp khớp qua ranh giới chỗ đã thay, ở đây thì không).
+    """
+
+    def __init__(self, norm_dict):
+        self.norm_dict = dict(norm_dict)
+        groups = {'mixed': [], 'pure': [], 'word': []}
+        for slang, std in self.norm_dict.items():
+            if slang:
+                groups[classify_slang(slang)].append((slang, std))
+
+        self.lookup = {}
+        self.patterns = []
+        for kind in ('mixed', 'pure', 'word'):
+            entries = groups[kind]
+            if not entries:
+                continue
+            # Thứ tự của build_lexical_patterns: dài trước (theo pattern đã escape), giữ thứ tự từ điển
+            entries.sort(key=lambda item: -len(re.escape(item[0])))
+            pattern = trie_pattern([slang.lower() for slang, _ in entries])
+            if kind == 'word':
+                pattern = rf'\b{pattern}\b'
+            pattern = re.compile(pattern, re.IGNORECASE)
+            for slang, std in self._chain(pattern, kind, entries):
+                # Key trùng khi không phân biệt hoa thường: giữ mục được áp dụng trước
+                self.lookup.setdefault(slang.lower(), std)
+            self.patterns.append(pattern)
+
+    @staticmethod
+    def _chain(pattern, kind, entries):
+        """Thay trong từ chuẩn của mỗi mục các key cùng nhóm đứng sau nó, như vòng lặp tuần tự"""
+        compiled = [None] * len(entries)
+        chained = []
+        for index, (slang, std) in enumerate(entries):
+            if isinstance(std, str) and pattern.search(std):
+                for later in range(index + 1, len(entries)):
+                    later_slang, later_std = entries[later]
+                    if later_slang.lower() not in std.lower():
+                        continue
+                    if compiled[later] is None:
+                        escaped = re.escape(later_slang)
+                        compiled[later] = re.compile(rf'\b{escaped}\b' if kind == 'word' else escaped,
+                                                     re.IGNORECASE)
+                    std = compiled[later].sub(later_std, std)
+            chained.append((slang, std))
+        return chained
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def _replace(self, match):
+        found = match.group(0)
+        std = self.lookup.get(found.lower())
+        if std is None:
+            # Trường hợp hiếm: IGNORECASE khớp nhưng lower() khác key (vd. ký tự đặc biệt Unicode)
+            for slang, candidate in self.norm_dict.items():
+                if re.fullmatch(re.escape(slang), found, re.IGNORECASE):
+                    return candidate
+            return found
+        return std
+
+    def normalize(self, text):
+        if not isinstance(text, str):
+            return text
+        for pattern in self.patterns:
+            text = pattern.sub(self._replace, text)
+        return text
+
+    __call__ = normalize
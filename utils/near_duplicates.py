@@ -0,0 +1,227 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+CLUSTER_COLUMN = "cluster_id"
+CLUSTER_SIZE_COLUMN = "cluster_size"
+REPRESENTATIVE_COLUMN = "is_cluster_representative"
+
+NEAR_DUPLICATE_REASON = "Near-duplicate of a kept comment (same cluster)"
+
+# Dạng chuẩn để tạo shingle: bỏ emoji/dấu câu và ký tự kéo dài, nên các comment
+# copy-paste chỉ khác nhau ở emoji hay "quáaaa" có cùng tập shingle
+SHINGLE_STRIP_REGEX = re.compile(r"[^\w\s]+")
+SHINGLE_ELONGATED_REGEX = re.compile(r"(\w)\1+")
+
+# Số shingle tối đa mỗi lô khi tính signature (giới hạn bộ nhớ num_perm × lô)
+_SHINGLE_BATCH = 100_000
+_SHINGLE_BASE = np.uint64(1_000_003)
+
+
+def shingle_text(text):
+    """Dạng chuẩn của comment dùng để tạo shingle"""
+    text = SHINGLE_STRIP_REGEX.sub(" ", text.lower())
+    text = SHINGLE_ELONGATED_REGEX.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Gốc luôn là phần tử nhỏ nhất để cluster id ổn định
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+
+class NearDuplicateDetector:
+    """
+    Phát hiện comment gần trùng bằng MinHash trên shingle ký tự + LSH banding.
+
+    Signature gồm num_perm giá trị min của các hàm hash multiply-shift; LSH chia
+    signature thành `bands` dải, comment chung bucket ở ít nhất một dải là ứng
+    viên. Ứng viên chỉ được gộp khi độ tương đồng Jaccard ước lượng >= threshold,
+    và chỉ so với phần tử đầu bucket, nên chi phí gần tuyến tính theo số comment.
+    Text trùng khớp hoàn toàn được gộp trước, signature chỉ tính cho text duy nhất.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=5, seed=42):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) phải chia hết cho bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Hệ số nhân lẻ cho multiply-shift; phép nhân uint64 tự tràn modulo 2^64
+        self._a = rng.integers(1, 2**63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+
+    def _shingle_hashes(self, codepoints):
+        """Hash 32-bit của mọi cửa sổ shingle_size ký tự (rolling hash đa thức, vector hóa)"""
+        k = self.shingle_size
+        windows = len(codepoints) - k + 1
+        hashes = np.zeros(windows, dtype=np.uint64)
+        for offset in range(k):
+            hashes = hashes * _SHINGLE_BASE + codepoints[offset:offset + windows]
+        return (hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF)
+
+    def signatures(self, texts):
+        """
+        MinHash signature (n × num_perm, uint32) cho từng text.
+        Text rỗng / không phải chuỗi có signature toàn 0xFFFFFFFF.
+
+        Text của một lô được nối bằng ký tự phân cách và hash mọi cửa sổ cùng lúc;
+        cửa sổ vắt qua hai text bị bỏ. Shingle lặp lại không cần loại vì min không đổi.
+        """
+        k = self.shingle_size
+        canonical = [shingle_text(text) if isinstance(text, str) else "" for text in texts]
+        result = np.full((len(canonical), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+
+        def flush(rows):
+            # Text ngắn hơn k ký tự được pad để có đúng một shingle
+            docs = [canonical[row].ljust(k) for row in rows]
+            codepoints = np.frombuffer("\x00".join(docs).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+            lengths = np.fromiter((len(doc) for doc in docs), dtype=np.int64, count=len(docs))
+            doc_starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+            windows_per_doc = lengths - k + 1
+            # Vị trí bắt đầu của các cửa sổ nằm trọn trong một text
+            positions = np.repeat(doc_starts, windows_per_doc) + (
+                np.arange(windows_per_doc.sum()) - np.repeat(np.cumsum(windows_per_doc) - windows_per_doc, windows_per_doc)
+            )
+            hashes = self._shingle_hashes(codepoints)[positions]
+            values = ((self._a * hashes + self._b) >> np.uint64(32)).astype(np.uint32)
+            offsets = np.concatenate(([0], np.cumsum(windows_per_doc)[:-1]))
+            result[rows] = np.minimum.reduceat(values, offsets, axis=1).T
+
+        batch_rows, batch_size = [], 0
+        for row, text in enumerate(canonical):
+            if not text:
+                continue
+            batch_rows.append(row)
+            batch_size += max(len(text), k)
+            if batch_size >= _SHINGLE_BATCH:
+                flush(batch_rows)
+                batch_rows, batch_size = [], 0
+        if batch_rows:
+            flush(batch_rows)
+        return result
+
+    def cluster(self, texts):
+        """
+        Gán cluster id cho từng text (cùng thứ tự đầu vào).
+
+        Cluster id là số thứ tự của cluster theo lần xuất hiện đầu tiên; text rỗng
+        hoặc không phải chuỗi luôn là cluster riêng.
+        """
+        texts = pd.Series(list(texts), dtype=object)
+        is_text = texts.map(lambda t: isinstance(t, str) and bool(t.strip())).to_numpy(dtype=bool)
+        inverse, unique_texts = pd.factorize(texts[is_text])
+
+        signatures = self.signatures(unique_texts)
+        has_shingles = signatures[:, 0] != np.iinfo(np.uint32).max
+        uf = _UnionFind(len(unique_texts))
+        candidates = np.flatnonzero(has_shingles)
+
+        for band in range(self.bands):
+            if len(candidates) < 2:
+                break
+            band_values = np.ascontiguousarray(
+                signatures[candidates, band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            )
+            keys = band_values.view(np.dtype((np.void, band_values.dtype.itemsize * self.rows_per_band))).ravel()
+            _, bucket, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            shared = counts[bucket] > 1
+            if not shared.any():
+                continue
+            members = candidates[shared]
+            member_buckets = bucket[shared]
+            order = np.argsort(member_buckets, kind='stable')
+            members, member_buckets = members[order], member_buckets[order]
+            # Phần tử đầu mỗi bucket (chỉ số nhỏ nhất) làm mốc so sánh
+            starts = np.flatnonzero(np.r_[True, member_buckets[1:] != member_buckets[:-1]])
+            heads = members[np.repeat(starts, np.diff(np.r_[starts, len(members)]))]
+            similarity = (signatures[members] == signatures[heads]).mean(axis=1)
+            for member, head in zip(members[similarity >= self.threshold], heads[similarity >= self.threshold]):
+                if member != head:
+                    uf.union(int(head), int(member))
+
+        roots = np.fromiter((uf.find(i) for i in range(len(unique_texts))), dtype=np.int64, count=len(unique_texts))
+        row_roots = np.full(len(texts), -1, dtype=np.int64)
+        row_roots[is_text] = roots[inverse]
+        # Text không hợp lệ: mỗi dòng một root riêng, không trùng với root của text
+        invalid_rows = np.flatnonzero(~is_text)
+        row_roots[invalid_rows] = len(unique_texts) + np.arange(len(invalid_rows))
+
+        _, first_rows, dense = np.unique(row_roots, return_index=True, return_inverse=True)
+        # Đánh số cluster theo thứ tự dòng đầu tiên xuất hiện
+        rank = np.empty(len(first_rows), dtype=np.int64)
+        rank[np.argsort(first_rows, kind='stable')] = np.arange(len(first_rows))
+        return rank[dense]
+
+
+def assign_clusters(df, column='comment_raw', detector=None):
+    """
+    Thêm cột cluster_id, cluster_size và is_cluster_representative (dòng đầu tiên
+    của mỗi cluster) vào bản sao của df.
+    """
+    detector = detector or NearDuplicateDetector()
+    df = df.copy()
+    cluster_ids = detector.cluster(df[column]) if len(df) else np.array([], dtype=np.int64)
+    df[CLUSTER_COLUMN] = cluster_ids
+    df[CLUSTER_SIZE_COLUMN] = df.groupby(CLUSTER_COLUMN)[CLUSTER_COLUMN].transform('size')
+    df[REPRESENTATIVE_COLUMN] = ~df[CLUSTER_COLUMN].duplicated()
+    return df
+
+
+def keep_representatives(df):
+    """
+    Giữ một comment đại diện cho mỗi cluster (df phải có cột từ assign_clusters).
+
+    Returns:
+        tuple: (kept_df, removed_df với cột removal_reason)
+    """
+    is_representative = df[REPRESENTATIVE_COLUMN].astype(bool)
+    removed_df = df[~is_representative].copy()
+    if len(removed_df) > 0:
+        removed_df['removal_reason'] = NEAR_DUPLICATE_REASON
+    return df[is_representative], removed_df
+
+
+def first_in_cluster(df, context_column=None):
+    """
+    Mask dòng đầu tiên của mỗi cluster. Với context_column (vd. summary của post),
+    cluster được tách theo context: comment gần trùng ở hai post khác nhau là hai nhóm.
+    """
+    keys = [CLUSTER_COLUMN] + ([context_column] if context_column else [])
+    return ~df.duplicated(subset=keys)
+
+
+def broadcast_labels(df, label_column='label', labeled_mask=None, context_column=None):
+    """
+    Gán nhãn của comment đại diện cho mọi comment cùng cluster (và cùng context_column nếu có).
+
+    labeled_mask chỉ ra các dòng đã được gán nhãn (mặc định: dòng đại diện).
+    """
+    if labeled_mask is None:
+        labeled_mask = df[REPRESENTATIVE_COLUMN].astype(bool)
+    keys = [CLUSTER_COLUMN] + ([context_column] if context_column else [])
+    labeled = df.loc[labeled_mask, keys + [label_column]].drop_duplicates(keys)
+    broadcast = df[keys].merge(labeled, on=keys, how='left')[label_column].to_numpy()
+    df = df.copy()
+    df[label_column] = np.where(pd.notna(broadcast), broadcast, df[label_column].to_numpy()).tolist()
+    return df
@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+QUOTA_DB_ENV = "GEMINI_QUOTA_DB"
+MINUTE_SECONDS = 60
+DAY_SECONDS = 24 * 60 * 60
+# Xóa request cũ hơn cửa sổ ngày sau mỗi chừng này lần reserve
+PRUNE_EVERY = 200
+
+
+def default_quota_path():
+    """
+    File quota mặc định: GEMINI_QUOTA_DB, nếu không thì ~/.cache/gemini_quota/api_quota.sqlite.
+    Quota gắn với API key chứ không với version dữ liệu, nên mọi version / bước dùng chung một file.
+    """
+    path = os.environ.get(QUOTA_DB_ENV)
+    if path:
+        return Path(path)
+    return Path.home() / ".cache" / "gemini_quota" / "api_quota.sqlite"
+
+
+def key_id(api_key):
+    """Mã của API key lưu trong file quota (không lưu chính key)"""
+    return hashlib.blake2b(api_key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class QuotaCoordinator:
+    """
+    Sổ quota dùng chung giữa các process (SQLite WAL) cho từng (API key, model).
+
+    Mỗi request được ghi lại trước khi gửi; reserve() đếm request / token trong cửa
+    sổ trượt 60 giây và 24 giờ rồi ghi chỗ mới trong cùng một transaction
+    BEGIN IMMEDIATE, nên hai process (vd. bước tóm tắt và bước gán nhãn chạy cùng
+    lúc, hoặc script vừa khởi động lại) không cùng vượt giới hạn của một key.
+    commit() cập nhật số token thực tế; block() tạm ngưng một key cho mọi process
+    (vd. khi server trả 429). Dùng an toàn từ nhiều thread.
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = Path(path) if path is not None else default_quota_path()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._reserves = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khóa ghi giữa các process)
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS requests ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key_id TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " sent_at REAL NOT NULL,"
+            " tokens INTEGER NOT NULL DEFAULT 0,"
+            " committed INTEGER NOT NULL DEFAULT 0,"
+            " pid INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS requests_window ON requests (key_id, model, sent_at)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            " key_id TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " blocked_until REAL NOT NULL,"
+            " reason TEXT,"
+            " PRIMARY KEY (key_id, model))"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _window(self, key, model, since):
+        return self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM requests"
+            " WHERE key_id = ? AND model = ? AND sent_at > ?",
+            (key, model, since)
+        ).fetchone()
+
+    def _slot_frees_at(self, key, model, since, count, limit, window):
+        """Thời điểm request thứ (count - limit + 1) cũ nhất rời cửa sổ, tức lúc có lại một chỗ"""
+        row = self.conn.execute(
+            "SELECT sent_at FROM requests WHERE key_id = ? AND model = ? AND sent_at > ?"
+            " ORDER BY sent_at LIMIT 1 OFFSET ?",
+            (key, model, since, max(0, count - limit))
+        ).fetchone()
+        return (row[0] if row else since) + window
+
+    def reserve(self, api_key, model, limits, tokens=0):
+        """
+        Giữ chỗ một request `tokens` token trên (api_key, model) nếu còn quota.
+
+        Args:
+            limits: dict có "rpm", "rpd" và (tùy chọn) "tpm" của model theo cách tính của bên gọi
+
+        Returns:
+            tuple: (reservation_id, 0.0, None) nếu được gửi, hoặc
+            (None, số giây cần chờ, lý do "rpd" / "rpm" / "tpm"). Khi key đang bị chặn, lý do
+            là reason đã lưu khi block ("rpd" nếu hết quota ngày), "blocked" nếu không có
+        """
+        key = key_id(api_key)
+        tokens = int(tokens or 0)
+        with self._lock:
+            now = self.clock()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT blocked_until, reason FROM blocks WHERE key_id = ? AND model = ?", (key, model)
+                ).fetchone()
+                denied = None
+                if row and row[0] > now:
+                    denied = (row[0] - now, row[1] or "blocked")
+                else:
+                    day_count, _ = self._window(key, model, now - DAY_SECONDS)
+                    minute_count, minute_tokens = self._window(key, model, now - MINUTE_SECONDS)
+                    if day_count >= limits["rpd"]:
+                        frees_at = self._slot_frees_at(key, model, now - DAY_SECONDS, day_count, limits["rpd"], DAY_SECONDS)
+                        denied = (frees_at - now, "rpd")
+                    elif minute_count >= limits["rpm"]:
+                        frees_at = self._slot_frees_at(key, model, now - MINUTE_SECONDS, minute_count, limits["rpm"],
+                                                       MINUTE_SECONDS)
+                        denied = (frees_at - now, "rpm")
+                    elif limits.get("tpm") and minute_count and minute_tokens + tokens > limits["tpm"]:
+                        # Chờ request cũ nhất rời cửa sổ phút
+                        frees_at = self._slot_frees_at(key, model, now - MINUTE_SECONDS, minute_count, minute_count,
+                                                       MINUTE_SECONDS)
+                        denied = (frees_at - now, "tpm")
+                if denied is not None:
+                    self.conn.execute("ROLLBACK")
+                    return None, max(0.0, denied[0]), denied[1]
+                reservation_id = self.conn.execute(
+                    "INSERT INTO requests (key_id, model, sent_at, tokens, pid) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, now, tokens, os.getpid())
+                ).lastrowid
+                self._reserves += 1
+                if self._reserves % PRUNE_EVERY == 0:
+                    self.conn.execute("DELETE FROM requests WHERE sent_at <= ?", (now - DAY_SECONDS,))
+                    self.conn.execute("DELETE FROM blocks WHERE blocked_until <= ?", (now,))
+                self.conn.execute("COMMIT")
+                return reservation_id, 0.0, None
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def commit(self, reservation_id, actual_tokens=None):
+        """Đánh dấu request đã gửi xong, cập nhật số token thực tế nếu biết"""
+        if reservation_id is None:
+            return
+        with self._lock:
+            if actual_tokens is None:
+                self.conn.execute("UPDATE requests SET committed = 1 WHERE id = ?", (reservation_id,))
+            else:
+                self.conn.execute("UPDATE requests SET committed = 1, tokens = ? WHERE id = ?",
+                                  (int(actual_tokens), reservation_id))
+
+    def block(self, api_key, model, seconds, reason=None):
+        """
+        Không cho process nào gửi trên (api_key, model) trong `seconds` giây.
+
+        Nếu key đang bị chặn lâu hơn thì giữ cả thời hạn lẫn reason cũ: một 429 ngắn đến sau
+        (request khác đang chạy trên cùng key) không được biến block "rpd" thành cooldown.
+        """
+        key = key_id(api_key)
+        with self._lock:
+            until = self.clock() + seconds
+            self.conn.execute(
+                "INSERT INTO blocks (key_id, model, blocked_until, reason) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key_id, model) DO UPDATE SET"
+                " blocked_until = MAX(blocked_until, excluded.blocked_until),"
+                " reason = CASE WHEN excluded.blocked_until >= blocked_until THEN excluded.reason ELSE reason END",
+                (key, model, until, reason)
+            )
+
+    def usage(self, api_key, model):
+        """Số request / token trong cửa sổ phút và ngày, và số giây còn bị chặn của (api_key, model)"""
+        key = key_id(api_key)
+        with self._lock:
+            now = self.clock()
+            minute_count, minute_tokens = self._window(key, model, now - MINUTE_SECONDS)
+            day_count, day_tokens = self._window(key, model, now - DAY_SECONDS)
+            row = self.conn.execute(
+                "SELECT blocked_until FROM blocks WHERE key_id = ? AND model = ?", (key, model)
+            ).fetchone()
+        return {
+            'minute_requests': minute_count,
+            'minute_tokens': minute_tokens,
+            'day_requests': day_count,
+            'day_tokens': day_tokens,
+            'blocked_for': max(0.0, row[0] - now) if row else 0.0,
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def self_check():
+    """
+    Kiểm tra block() / reserve() với các request lỗi xen kẽ trên cùng key (file tạm, đồng hồ giả).
+
+    Returns:
+        list: mô tả các trường hợp sai (rỗng nếu đúng hết)
+    """
+    import tempfile
+
+    now = [1000.0]
+    limits = {"rpm": 10, "rpd": 100}
+    cases = [
+        # (các block theo thứ tự (giây, reason), số giây trôi qua, reason reserve phải trả về)
+        ([(3600, "rpd"), (10, "429")], 0, "rpd"),
+        ([(10, "429"), (3600, "rpd")], 0, "rpd"),
+        ([(3600, "rpd"), (10, "cooldown"), (20, "429")], 0, "rpd"),
+        ([(10, "rpd"), (60, "429")], 0, "429"),
+        ([(10, "rpd")], 20, None),
+    ]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with QuotaCoordinator(Path(tmp_dir) / "quota.sqlite", clock=lambda: now[0]) as quota:
+            for i, (blocks, elapsed, expected) in enumerate(cases):
+                model = f"check-{i}"
+                for seconds, reason in blocks:
+                    quota.block("key", model, seconds, reason=reason)
+                now[0] += elapsed
+                _, _, reason = quota.reserve("key", model, limits)
+                if reason != expected:
+                    failures.append(f"block {blocks}, +{elapsed}s: reserve → {reason!r}, cần {expected!r}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show API quota usage recorded by all processes')
+    parser.add_argument('quota_db', nargs='?', type=Path, help=f'Quota database (default: ${QUOTA_DB_ENV} or ~/.cache)')
+    parser.add_argument('--self-check', action='store_true',
+                        help='Check block/reserve on interleaved failures against a temporary database and exit')
+    args = parser.parse_args()
+
+    if args.self_check:
+        failures = self_check()
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            raise SystemExit(1)
+        print("✅ block/reserve: OK")
+        return
+
+    path = args.quota_db or default_quota_path()
+    if not path.exists():
+        print(f"❌ Không tìm thấy file: {path}")
+        return
+
+    now = time.time()
+    conn = sqlite3.connect(str(path))
+    try:
+        rows = conn.execute(
+            "SELECT key_id, model,"
+            " SUM(sent_at > ?), SUM(CASE WHEN sent_at > ? THEN tokens ELSE 0 END),"
+            " SUM(sent_at > ?), SUM(committed = 0 AND sent_at > ?)"
+            " FROM requests GROUP BY key_id, model ORDER BY model, key_id",
+            (now - MINUTE_SECONDS, now - MINUTE_SECONDS, now - DAY_SECONDS, now - DAY_SECONDS)
+        ).fetchall()
+        blocks = {
+            (key, model): (until - now, reason)
+            for key, model, until, reason in conn.execute("SELECT key_id, model, blocked_until, reason FROM blocks")
+            if until > now
+        }
+    finally:
+        conn.close()
+    if not rows:
+        print("Chưa có request nào")
+    for key, model, minute_requests, minute_tokens, day_requests, uncommitted in rows:
+        line = (f"{model} | key {key}: {minute_requests or 0} req / {minute_tokens or 0:,} tokens trong 60s,"
+                f" {day_requests or 0} req trong 24h")
+        if uncommitted:
+            line += f" ({uncommitted} chưa commit)"
+        if (key, model) in blocks:
+            blocked_for, reason = blocks[(key, model)]
+            line += f", bị chặn thêm {blocked_for:.0f}s ({reason or 'blocked'})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import gzip
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+LEDGER_FILENAME = "removal_ledger.jsonl.gz"
+
+# Các cột nguồn được giữ lại trong ledger (nếu có trong DataFrame)
+LEDGER_SOURCE_COLUMNS = ['comment_id', 'post_id', 'platform', 'comment_raw']
+LEDGER_COLUMNS = ['run_id', 'stage', 'removal_reason', 'removed_at', 'source_file'] + LEDGER_SOURCE_COLUMNS
+
+
+def new_run_id():
+    """Run id dạng 20240131_153000_ab12cd"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+class RemovalLedger:
+    """
+    Append-only ledger (gzip JSONL) của các comment bị loại trong quá trình cleaning.
+
+    Mỗi lần ghi là một gzip member mới được append vào file, nên các record được
+    ghi ngay khi bị loại và file vẫn đọc được như một luồng JSONL duy nhất.
+    """
+
+    def __init__(self, path, run_id=None, source_file=None):
+        self.path = Path(path)
+        self.run_id = run_id or new_run_id()
+        self.source_file = str(source_file) if source_file is not None else None
+        self.rows_written = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def record(self, df, stage, reason=None):
+        """Ghi các dòng bị loại; reason=None thì lấy theo cột removal_reason"""
+        if df is None or len(df) == 0:
+            return 0
+
+        entries = pd.DataFrame({
+            'run_id': self.run_id,
+            'stage': stage,
+            'removal_reason': df['removal_reason'].to_numpy() if reason is None and 'removal_reason' in df.columns else reason,
+            'removed_at': datetime.now().isoformat(timespec='seconds'),
+            'source_file': self.source_file,
+        }, index=pd.RangeIndex(len(df)))
+        for col in LEDGER_SOURCE_COLUMNS:
+            if col in df.columns:
+                entries[col] = df[col].to_numpy()
+        text = entries.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write(text if text.endswith('\n') else text + '\n')
+        self.rows_written += len(entries)
+        return len(entries)
+
+
+def iter_ledger(path, comment_id=None, run_id=None, stage=None):
+    """Duyệt các record trong ledger, lọc theo comment_id / run_id / stage"""
+    path = Path(path)
+    if not path.exists():
+        return
+    comment_id = str(comment_id) if comment_id is not None else None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if comment_id is not None and str(entry.get('comment_id')) != comment_id:
+                continue
+            if run_id is not None and entry.get('run_id') != run_id:
+                continue
+            if stage is not None and entry.get('stage') != stage:
+                continue
+            yield entry
+
+
+def read_ledger(path, **filters):
+    """Đọc ledger thành DataFrame (các tham số lọc giống iter_ledger)"""
+    return pd.DataFrame(list(iter_ledger(path, **filters)), columns=LEDGER_COLUMNS)
+
+
+def why_removed(path, comment_id):
+    """Tất cả lần comment_id bị loại, qua mọi run"""
+    return list(iter_ledger(path, comment_id=comment_id))
+
+
+def export_excel(path, excel_path, **filters):
+    """Xuất (một phần) ledger ra Excel theo yêu cầu"""
+    df = read_ledger(path, **filters)
+    df.to_excel(excel_path, index=False)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the cleaning removal ledger')
+    parser.add_argument('ledger', help='Path to removal_ledger.jsonl.gz')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    why_parser = subparsers.add_parser('why', help='Show why a comment was removed')
+    why_parser.add_argument('comment_id')
+
+    summary_parser = subparsers.add_parser('summary', help='Count removed records per run, stage and reason')
+    summary_parser.add_argument('--run-id')
+
+    export_parser = subparsers.add_parser('export', help='Export records to Excel')
+    export_parser.add_argument('excel_file')
+    export_parser.add_argument('--run-id')
+    export_parser.add_argument('--stage')
+
+    args = parser.parse_args()
+
+    if args.command == 'why':
+        entries = why_removed(args.ledger, args.comment_id)
+        if not entries:
+            print(f"Không tìm thấy comment_id {args.comment_id} trong ledger")
+        for entry in entries:
+            print(f"[{entry['removed_at']}] run {entry['run_id']} - {entry['stage']}: {entry['removal_reason']}")
+    elif args.command == 'summary':
+        df = read_ledger(args.ledger, run_id=args.run_id)
+        if len(df) == 0:
+            print("Ledger trống")
+            return
+        counts = df.groupby(['run_id', 'stage', 'removal_reason']).size()
+        for (run_id, stage, reason), count in counts.items():
+            print(f"{run_id}  {stage:<16} {reason}: {count:,}")
+    else:
+        count = export_excel(args.ledger, args.excel_file, run_id=args.run_id, stage=args.stage)
+        print(f"Đã xuất {count:,} records vào: {args.excel_file}")
+
+
+if __name__ == "__main__":
+    main()
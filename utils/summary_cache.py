@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_CACHE_FILENAME = "summary_cache.sqlite"
+POST_FINGERPRINT_COLUMN = "post_fingerprint"
+
+# Giới hạn số tham số mỗi câu lệnh SQLite
+_QUERY_BATCH = 900
+
+
+def canonical_post(text):
+    """Dạng chuẩn của post để so khớp: NFC và gộp mọi khoảng trắng"""
+    return " ".join(unicodedata.normalize('NFC', str(text)).split())
+
+
+def post_fingerprint(text):
+    """Hash cố định 16 byte của dạng chuẩn của post"""
+    return hashlib.blake2b(canonical_post(text).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def fingerprint_series(posts):
+    """
+    Fingerprint cho từng dòng của Series post (None với ô trống).
+    Hash chỉ tính một lần cho mỗi giá trị post khác nhau.
+    """
+    codes, uniques = pd.factorize(posts)
+    fingerprints = np.array([post_fingerprint(post) for post in uniques] + [None], dtype=object)
+    # Mã -1 (ô trống) lấy phần tử None cuối mảng
+    return pd.Series(fingerprints[codes], index=posts.index, dtype=object)
+
+
+def prompt_version(prompt):
+    """Mã phiên bản ngắn của prompt (đổi prompt là đổi mã, cache cũ không còn khớp)"""
+    return hashlib.blake2b(prompt.encode('utf-8'), digest_size=6).hexdigest()
+
+
+class SummaryCache:
+    """
+    Cache SQLite cho tóm tắt post: (fingerprint post, model, phiên bản prompt) → summary.
+
+    Post giống nhau sau chuẩn hóa NFC / khoảng trắng dùng chung một entry, nên chạy
+    lại một file hay gặp lại post ở file platform khác không tốn thêm request.
+    Mỗi lần chạy ghi số hit/miss vào bảng runs để xem hit rate qua `cache_stats()`.
+    Dùng được từ nhiều thread (summary stream được ghi ngay từ thread gửi request).
+    """
+
+    def __init__(self, path, model_name, prompt_version):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " fingerprint BLOB NOT NULL,"
+            " model TEXT NOT NULL,"
+            " prompt_version TEXT NOT NULL,"
+            " summary TEXT NOT NULL,"
+            " created_at TEXT,"
+            " PRIMARY KEY (fingerprint, model, prompt_version)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_at TEXT,"
+            " model TEXT,"
+            " prompt_version TEXT,"
+            " hits INTEGER,"
+            " misses INTEGER)"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM summaries WHERE model = ? AND prompt_version = ?",
+            (self.model_name, self.prompt_version)
+        ).fetchone()[0]
+
+    def get_many(self, fingerprints):
+        """Trả về dict fingerprint → summary cho các fingerprint đã có trong cache"""
+        unique_keys = list(dict.fromkeys(fingerprints))
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique_keys), _QUERY_BATCH):
+                batch = unique_keys[start:start + _QUERY_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT fingerprint, summary FROM summaries"
+                    f" WHERE model = ? AND prompt_version = ? AND fingerprint IN ({placeholders})",
+                    [self.model_name, self.prompt_version, *batch]
+                )
+                for fingerprint, summary in rows:
+                    found[fingerprint] = summary
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, summaries):
+        """Lưu dict fingerprint → summary"""
+        created_at = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO summaries (fingerprint, model, prompt_version, summary, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    (fingerprint, self.model_name, self.prompt_version, summary, created_at)
+                    for fingerprint, summary in summaries.items()
+                )
+            )
+            self.conn.commit()
+
+    def record_run(self):
+        """Ghi hit/miss của lần chạy hiện tại vào bảng runs và reset bộ đếm"""
+        if self.hits or self.misses:
+            self.conn.execute(
+                "INSERT INTO runs (run_at, model, prompt_version, hits, misses) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), self.model_name, self.prompt_version,
+                 self.hits, self.misses)
+            )
+            self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.record_run()
+            self.conn.close()
+            self.conn = None
+
+
+def cache_stats(conn):
+    """Số entry và hit rate tích lũy theo (model, phiên bản prompt)"""
+    stats = {}
+    for model, version, count in conn.execute(
+        "SELECT model, prompt_version, COUNT(*) FROM summaries GROUP BY model, prompt_version"
+    ):
+        stats[(model, version)] = {'entries': count, 'hits': 0, 'misses': 0}
+    for model, version, hits, misses in conn.execute(
+        "SELECT model, prompt_version, SUM(hits), SUM(misses) FROM runs GROUP BY model, prompt_version"
+    ):
+        entry = stats.setdefault((model, version), {'entries': 0, 'hits': 0, 'misses': 0})
+        entry['hits'], entry['misses'] = hits or 0, misses or 0
+    return stats
+
+
+def invalidate(conn, prompt_version=None, model=None, keep_prompt_version=None):
+    """
+    Xóa entry theo phiên bản prompt và/hoặc model.
+    keep_prompt_version: xóa mọi phiên bản prompt khác phiên bản này.
+
+    Returns:
+        int: số entry đã xóa
+    """
+    conditions, params = [], []
+    if prompt_version is not None:
+        conditions.append("prompt_version = ?")
+        params.append(prompt_version)
+    if keep_prompt_version is not None:
+        conditions.append("prompt_version != ?")
+        params.append(keep_prompt_version)
+    if model is not None:
+        conditions.append("model = ?")
+        params.append(model)
+    if not conditions:
+        raise ValueError("Cần ít nhất một điều kiện xóa (prompt_version, model hoặc keep_prompt_version)")
+    deleted = conn.execute(f"DELETE FROM summaries WHERE {' AND '.join(conditions)}", params).rowcount
+    conn.commit()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the post summary cache')
+    parser.add_argument('cache', help='Path to summary_cache.sqlite')
+    parser.add_argument('--invalidate-prompt', metavar='VERSION',
+                        help='Delete entries created with this prompt version')
+    parser.add_argument('--keep-prompt', metavar='VERSION',
+                        help='Delete entries of every prompt version except this one')
+    parser.add_argument('--model', help='Only invalidate entries of this model')
+    args = parser.parse_args()
+
+    if not Path(args.cache).exists():
+        print(f"❌ Không tìm thấy cache: {args.cache}")
+        return
+
+    conn = sqlite3.connect(args.cache)
+    try:
+        if args.invalidate_prompt or args.keep_prompt or args.model:
+            deleted = invalidate(conn, args.invalidate_prompt, args.model, args.keep_prompt)
+            print(f"🗑️  Đã xóa {deleted:,} entry")
+
+        stats = cache_stats(conn)
+        if not stats:
+            print("Cache trống")
+        for (model, version), entry in sorted(stats.items()):
+            lookups = entry['hits'] + entry['misses']
+            hit_rate = entry['hits'] / lookups * 100 if lookups else 0.0
+            print(f"{model} | prompt {version}: {entry['entries']:,} entries, "
+                  f"{entry['hits']:,}/{lookups:,} hits ({hit_rate:.1f}%)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
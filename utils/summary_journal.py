@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+class SummaryJournal:
+    """
+    Write-ahead journal (JSONL) cho các summary đã nhận từ API.
+
+    Mỗi batch hoàn thành được ghi thành các dòng (fingerprint, summary, model,
+    phiên bản prompt, token của batch, thời điểm) rồi flush + fsync ngay, nên
+    chương trình bị dừng giữa chừng không mất summary đã trả quota. Lần chạy sau
+    replay() lại journal để chỉ gửi những post chưa có summary. Dòng cuối bị
+    ghi dở (crash giữa lúc ghi) được bỏ qua khi replay. Summary nhận qua stream được ghi
+    trước khi batch xong (chưa biết token); khi batch xong, append_usage() ghi token của
+    batch cho các fingerprint đó thành dòng riêng không có summary. append() /
+    append_usage() dùng được từ nhiều thread.
+    """
+
+    def __init__(self, path, model_name, prompt_version):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def replay(self):
+        """
+        Đọc lại journal.
+
+        Returns:
+            dict: fingerprint (bytes) → summary, chỉ các dòng cùng model và phiên bản prompt
+        """
+        summaries = {}
+        if not self.path.exists():
+            return summaries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get('model') != self.model_name or entry.get('prompt_version') != self.prompt_version:
+                    continue
+                if 'summary' not in entry:
+                    # Dòng token của append_usage()
+                    continue
+                try:
+                    summaries[bytes.fromhex(entry['fingerprint'])] = entry['summary']
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return summaries
+
+    def append(self, summaries, tokens=None):
+        """Ghi dict fingerprint → summary của một batch và fsync"""
+        if not summaries:
+            return
+        timestamp = datetime.now().isoformat(timespec='seconds')
+        self._write([
+            json.dumps({
+                'fingerprint': fingerprint.hex(),
+                'summary': summary,
+                'model': self.model_name,
+                'prompt_version': self.prompt_version,
+                'batch_tokens': tokens,
+                'timestamp': timestamp,
+            }, ensure_ascii=False)
+            for fingerprint, summary in summaries.items()
+        ])
+
+    def append_usage(self, fingerprints, tokens):
+        """Ghi token của batch cho các summary đã append() trước đó khi chưa biết token (stream)"""
+        if not fingerprints or tokens is None:
+            return
+        timestamp = datetime.now().isoformat(timespec='seconds')
+        self._write([
+            json.dumps({
+                'fingerprint': fingerprint.hex(),
+                'model': self.model_name,
+                'prompt_version': self.prompt_version,
+                'batch_tokens': tokens,
+                'timestamp': timestamp,
+            }, ensure_ascii=False)
+            for fingerprint in fingerprints
+        ])
+
+    def _write(self, lines):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Xóa journal sau khi kết quả của file đã được lưu xong"""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
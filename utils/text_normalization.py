@@ -0,0 +1,453 @@
+import json
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import emoji
+import pandas as pd
+import regex
+
+from utils.lexical_normalizer import LexicalNormalizer
+
+# Các bước 1-7 của pipeline chuẩn hóa cuối (port từ preprocessing/Preprocessing.ipynb).
+# Mọi pattern được compile một lần ở mức module.
+
+# ===== 2. Emoji, links/HTML tags/mentions/hashtags/UI indicators =====
+EMOTICON_PATTERNS = [
+    r":\)+",       # :), :)), :))), ...
+    r":\(+",       # :(, :((, ...
+    r":v+",        # :v, :vvv, ...
+    r":V+",        # :V, :VV, ...
+    r"=+\)+",      # =), =)), ...
+    r"=+\(+",      # =(, =((, ...
+    r":d+",        # :d, :dd
+    r":p+",        # :p, :pp
+    r"<3+",        # <3<3<3
+    r"=+\]+",      # =], =]], =]]], ...
+    r"=+\[+",      # =[, =[[, =[[[ ...
+    r":>+",        # :>, :>>, ...
+    r":<+",        # :<, :<<, ...
+    r":\(\(",      # :((
+    r"=\(\(",      # =((
+]
+# Tương đương "|".join(EMOTICON_PATTERNS) (":((" và "=((" đã nằm trong ":(+" và "=+(+"),
+# viết gộp để mọi nhánh bắt đầu bằng ':', '=' hoặc '<' và re nhảy thẳng tới các ký tự đó
+EMOTICON_REGEX = re.compile(r":(?:\)+|\(+|v+|d+|p+|>+|<+)|==*(?:\)+|\(+|\]+|\[+)|<3+", re.IGNORECASE)
+
+EMOJI_REGEX = re.compile(
+    "["
+    u"\U0001F600-\U0001F64F"
+    u"\U0001F300-\U0001F5FF"
+    u"\U0001F680-\U0001F6FF"
+    u"\U0001F700-\U0001F77F"
+    u"\U0001F780-\U0001F7FF"
+    u"\U0001F800-\U0001F8FF"
+    u"\U0001F900-\U0001F9FF"
+    u"\U0001FA00-\U0001FA6F"
+    u"\U0001FA70-\U0001FAFF"
+    u"\U00002702-\U000027B0"
+    u"\U000024C2-\U0001F251"
+    "]+", flags=re.UNICODE
+)
+
+# emoji.replace_emoji thay mỗi emoji bằng khoảng trắng và bỏ các variation selector
+# FE0E/FE0F còn sót; với emoji một codepoint có thể làm giống hệt bằng str.translate
+EMOJI_SINGLE_CODEPOINTS = frozenset(ord(e) for e in emoji.EMOJI_DATA if len(e) == 1)
+VARIATION_SELECTORS = frozenset((0xFE0E, 0xFE0F))
+ZERO_WIDTH_JOINER_UTF8 = "\u200d".encode()
+# Codepoint chỉ xuất hiện bên trong chuỗi emoji nhiều codepoint (ZWJ, keycap, cờ,
+# tag). Text chứa chúng có thể khớp cả chuỗi (vd. "1️⃣" gồm cả chữ số) nên phải đi
+# đường chuỗi emoji; chữ số, '#' và '*' chỉ thuộc chuỗi khi đi kèm các codepoint này.
+EMOJI_SEQUENCE_CODEPOINTS = frozenset(
+    ord(ch) for e in emoji.EMOJI_DATA if len(e) > 1 for ch in e if not ch.isascii()
+) - EMOJI_SINGLE_CODEPOINTS - VARIATION_SELECTORS
+
+
+def _emoji_trie():
+    """Cây tiền tố của mọi emoji (giống cây tìm kiếm của emoji.tokenize); '' đánh dấu hết một emoji"""
+    trie = {}
+    for e in emoji.EMOJI_DATA:
+        node = trie
+        for ch in e:
+            node = node.setdefault(ch, {})
+        node[''] = True
+    return trie
+
+
+def _byte_class(values):
+    """Một byte trong values (đã sắp xếp), các byte liền nhau viết thành khoảng"""
+    if len(values) == 1:
+        return re.escape(bytes(values))
+    ranges = []
+    for value in values:
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return b'[' + b''.join(
+        re.escape(bytes([start])) if start == end else re.escape(bytes([start])) + b'-' + re.escape(bytes([end]))
+        for start, end in ranges
+    ) + b']'
+
+
+def _utf8_alternatives(paths):
+    """
+    Regex bytes khớp một trong các ký tự (dạng UTF-8) rồi tới pattern đuôi đi kèm ký tự đó.
+    Các ký tự được gom theo tiền tố byte, byte cuối có cùng đuôi gộp thành một lớp [...]:
+    lớp byte của re là bitmap nên mỗi byte chỉ tốn một lần tra.
+    """
+    trie = {}
+    for data, tail in paths:
+        node = trie
+        for value in data:
+            node = node.setdefault(value, {})
+        node[None] = tail
+
+    def build(node):
+        if None in node:
+            # UTF-8 là mã tiền tố: nút kết thúc một ký tự không có nút con
+            return node[None]
+        groups = {}
+        for value, child in sorted(node.items()):
+            groups.setdefault(build(child), []).append(value)
+        alternatives = [_byte_class(values) + tail for tail, values in groups.items()]
+        return alternatives[0] if len(alternatives) == 1 else b'(?:' + b'|'.join(alternatives) + b')'
+
+    return build(trie)
+
+
+def _emoji_sequence_pattern(node, root=False):
+    """
+    Regex bytes (trên text UTF-8) khớp emoji giống emoji.tokenize: đi theo cây xa nhất có
+    thể, không quay lui. Ký tự kế tiếp còn đi tiếp được trong cây thì bắt buộc đi tiếp; chỉ
+    dừng ở một nút khi nút đó là emoji và ký tự kế tiếp không phải nhánh con (nếu không thì
+    không khớp gì).
+    """
+    paths = [(ch.encode(), b'' if child == {'': True} else _emoji_sequence_pattern(child))
+             for ch, child in node.items() if ch]
+    if root:
+        # Mỗi nhánh gốc bắt đầu bằng một byte cố định nên re quét nhanh tới các byte đó
+        by_lead = {}
+        for data, tail in paths:
+            by_lead.setdefault(data[0], []).append((data[1:], tail))
+        return b'|'.join(re.escape(bytes([lead])) + _utf8_alternatives(rest)
+                         for lead, rest in sorted(by_lead.items()))
+    body = _utf8_alternatives(paths)
+    if '' in node:
+        stop = _utf8_alternatives([(data, b'') for data, _ in paths])
+        return b'(?:' + body + b'|(?!' + stop + b'))'
+    return body
+
+
+def _codepoint_ranges_class(codepoints, gap=16):
+    """
+    Lớp ký tự [...] chứa mọi codepoint đã cho, gộp các codepoint cách nhau <= gap thành một
+    khoảng: re kiểm tra codepoint ngoài BMP bằng cách duyệt từng khoảng, nên ít khoảng thì
+    quét nhanh (đổi lại lớp có thể khớp thêm vài codepoint lân cận).
+    """
+    ranges = []
+    for codepoint in sorted(codepoints):
+        if ranges and codepoint - ranges[-1][1] <= gap:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return '[' + ''.join(
+        re.escape(chr(start)) if start == end else f'{re.escape(chr(start))}-{re.escape(chr(end))}'
+        for start, end in ranges
+    ) + ']'
+
+
+# Text không khớp regex này thì emoji trong đó đều một codepoint và đi đường str.translate
+EMOJI_SEQUENCE_HINT_REGEX = re.compile(_codepoint_ranges_class(EMOJI_SEQUENCE_CODEPOINTS))
+# Chạy trên bytes UTF-8 thay vì str: lớp ký tự ngoài BMP của re là danh sách khoảng phải
+# duyệt lần lượt, còn lớp byte là bitmap. Mã hóa/giải mã UTF-8 nhanh và giữ nguyên ranh giới
+# ký tự (byte đầu của ký tự không bao giờ trùng byte tiếp nối nên match luôn trọn ký tự).
+EMOJI_SEQUENCE_REGEX = re.compile(_emoji_sequence_pattern(_emoji_trie(), root=True))
+
+URL_REGEX = re.compile(r'https?://\S+|www\.\S+|\S+\.(com|org|net|co|vn|io)(/\S*)?')
+HTML_REGEX = re.compile(r"<[^>]+>")
+MENTION_REGEX = re.compile(r"@[\w\._]+")
+HASHTAG_REGEX = re.compile(r"#\w+")
+UI_INDICATORS = [
+    "đã chỉnh sửa", "[đã chỉnh sửa]", "(đã chỉnh sửa)",
+    "see more", "xem thêm", "see translation", "xem bản dịch",
+    "ẩn bớt", "xem ít hơn", "dịch", "translated", "more", "less",
+    "see more reactions"
+]
+# Xóa tuần tự theo đúng thứ tự của notebook
+UI_INDICATOR_REGEXES = [re.compile(r'(?i)' + re.escape(ind)) for ind in UI_INDICATORS]
+LONE_PUNCT_REGEX = re.compile(r'(?<!\w)[\^\'\`\~\"\,\.]+(?!\w)')
+
+# ===== 3. Ký tự kéo dài =====
+ELONGATED_REGEX = regex.compile(r"([\p{L}])\1{2,}", flags=regex.IGNORECASE)
+
+# ===== 5. Dấu câu =====
+VIET_CHARACTERS = (
+    "àáảãạăằắẳẵặâầấẩẫậ"
+    "èéẻẽẹêềếểễệ"
+    "ìíỉĩị"
+    "òóỏõọôồốổỗộơờớởỡợ"
+    "ùúủũụưừứửữự"
+    "ỳýỷỹỵ"
+    "đ"
+)
+PUNCTUATION_REGEX = regex.compile(rf"[^{VIET_CHARACTERS}a-zA-Z0-9\s]+")
+WHITESPACE_REGEX = regex.compile(r"\s+")
+# Mọi ký tự không phải dấu câu hay khoảng trắng: sau bước 5 text chỉ còn các đoạn này nối bằng " ".
+# Viết "[..][..]*" thay vì "[..]+" để pattern bắt đầu bằng lớp ký tự: re khi đó quét nhanh
+# tới ký tự đầu tiên khớp thay vì thử khớp ở từng vị trí
+WORD_CHARACTERS_REGEX = re.compile(rf"[{VIET_CHARACTERS}a-zA-Z0-9][{VIET_CHARACTERS}a-zA-Z0-9]*")
+
+
+class CodepointTable(dict):
+    """
+    Bảng str.translate phân loại từng codepoint một lần (lười): lần đầu gặp một
+    codepoint, classify(ch) quyết định giữ (trả về ord(ch)), xóa (None) hay thay
+    bằng chuỗi khác; các lần sau là tra dict ở tốc độ C.
+    """
+
+    def __init__(self, classify):
+        super().__init__()
+        self.classify = classify
+
+    def __missing__(self, codepoint):
+        value = self.classify(chr(codepoint))
+        self[codepoint] = value
+        return value
+
+
+def _classify_emoji(ch):
+    codepoint = ord(ch)
+    if codepoint in EMOJI_SINGLE_CODEPOINTS:
+        return " "
+    if codepoint in VARIATION_SELECTORS:
+        return None
+    return codepoint
+
+
+EMOJI_TABLE = CodepointTable(_classify_emoji)
+
+
+def _collapse_spaces(text):
+    """Giống re.sub(r'\\s+', ' ', text).strip(): str.split dùng cùng định nghĩa khoảng trắng với re"""
+    return ' '.join(text.split())
+
+
+# ===== 1. Normalize Unicode (NFC) + lowercase =====
+def normalize_unicode_lower(text):
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize('NFC', text)
+    return text.lower()
+
+
+# ===== 2. Remove Emoji, links/HTML tags/mentions/hashtags/UI indicators =====
+def _replace_emoji_sequences(text):
+    """Giống emoji.replace_emoji(text, replace=" ") cho text có chuỗi emoji nhiều codepoint"""
+    data = EMOJI_SEQUENCE_REGEX.sub(b" ", text.encode("utf-8", "surrogatepass"))
+    if ZERO_WIDTH_JOINER_UTF8 in data:
+        # ZWJ nối các emoji thành chuỗi ngoài RGI: emoji.tokenize gộp cả chuỗi (hiếm)
+        try:
+            return emoji.replace_emoji(text, replace=" ")
+        except Exception:
+            return EMOJI_REGEX.sub(" ", text)
+    return data.replace(b"\xef\xb8\x8f", b"").replace(b"\xef\xb8\x8e", b"").decode("utf-8", "surrogatepass")
+
+
+def remove_emoji_emoticon(text):
+    # Không emoji nào nằm trọn trong ASCII
+    if not text.isascii():
+        if EMOJI_SEQUENCE_HINT_REGEX.search(text) is None:
+            text = text.translate(EMOJI_TABLE)
+        else:
+            # Có codepoint của chuỗi emoji nhiều codepoint
+            text = _replace_emoji_sequences(text)
+
+    # Xóa bằng regex (mọi emoticon bắt đầu bằng ':', '=' hoặc '<')
+    if ':' in text or '=' in text or '<' in text:
+        text = EMOTICON_REGEX.sub(" ", text)
+
+    # Loại bỏ khoảng trắng dư thừa
+    return _collapse_spaces(text)
+
+
+def remove_html_url_mention_hashtag(text):
+    if not isinstance(text, str):
+        return ""
+
+    # Xóa URL
+    text = URL_REGEX.sub(" ", text)
+
+    # Xóa HTML tags
+    text = HTML_REGEX.sub(" ", text)
+
+    # Xóa mentions và hashtags
+    text = MENTION_REGEX.sub(" ", text)
+    text = HASHTAG_REGEX.sub(" ", text)
+
+    # Xóa ui_indicators
+    for pattern in UI_INDICATOR_REGEXES:
+        text = pattern.sub(" ", text)
+
+    # Loại bỏ dấu câu riêng lẻ
+    text = LONE_PUNCT_REGEX.sub(' ', text)
+
+    # Làm sạch khoảng trắng dư thừa
+    return _collapse_spaces(text)
+
+
+# ===== 3. Reduce elongated characters =====
+def reduce_elongated(text):
+    if not isinstance(text, str):
+        return ""
+    return ELONGATED_REGEX.sub(r"\1\1", text)
+
+
+# ===== 4. Lexical Normalization =====
+def load_abbreviation_dictionary(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_lexical_patterns(norm_dict):
+    """
+    Compile từ điển teencode thành list (pattern, từ chuẩn): mixed → pure → words, dài trước.
+
+    Đây là cách làm gốc của notebook (mỗi mục một lần quét), giữ lại để đối chiếu;
+    pipeline dùng LexicalNormalizer (một lần quét cho cả từ điển).
+    """
+    mixed, pure, words = [], [], []
+    for slang, std in norm_dict.items():
+        esc = re.escape(slang)
+        # classification
+        if re.fullmatch(r"[^\w\s]+", slang):
+            pure.append((esc, std))
+        elif re.search(r"[^\w\s]", slang) and re.search(r"\w", slang):
+            mixed.append((esc, std))
+        else:
+            # add \b for normal words
+            words.append((rf"\b{esc}\b", std))
+
+    # sort desc
+    for lst in (mixed, pure, words):
+        lst.sort(key=lambda x: -len(x[0].replace(r"\b", "")))
+
+    return [
+        (re.compile(pat, flags=re.IGNORECASE), std)
+        for pat, std in (mixed + pure + words)
+    ]
+
+
+def apply_lexical_normalization(text, patterns):
+    if not isinstance(text, str):
+        return text
+    for pattern, std in patterns:
+        text = pattern.sub(std, text)
+    return text
+
+
+# ===== 5. Remove punctuation =====
+def remove_punctuation(text):
+    if not isinstance(text, str):
+        return ""
+    # Giữ chữ Việt + chữ Anh + số; dấu câu và khoảng trắng (\s của module regex) đều là phân cách
+    return " ".join(WORD_CHARACTERS_REGEX.findall(text))
+
+
+# ===== 6. Whitespace Stripping =====
+def strip_extra_spaces(text):
+    if not isinstance(text, str):
+        return ""
+    return WHITESPACE_REGEX.sub(" ", text).strip()
+
+
+# ===== 7. Deduplication =====
+def deduplicate_comments(df, col):
+    return df.drop_duplicates(subset=[col]).reset_index(drop=True)
+
+
+def normalize_text(text, lexical_normalizer=None):
+    """
+    Bước 1-6 cho một comment trong một lần gọi, kết quả giống chạy lần lượt từng bước.
+
+    Bước 6 (strip_extra_spaces) được bỏ qua vì remove_punctuation đã trả về chuỗi
+    với khoảng trắng đã gộp và strip bằng cùng pattern.
+    """
+    text = normalize_unicode_lower(text)
+    text = remove_emoji_emoticon(text)
+    text = remove_html_url_mention_hashtag(text)
+    text = reduce_elongated(text)
+    if lexical_normalizer is not None:
+        text = lexical_normalizer.normalize(text)
+    return remove_punctuation(text)
+
+
+# Dưới ngưỡng này chạy tuần tự vì chi phí gửi dữ liệu sang process lớn hơn lợi ích
+MIN_PARALLEL_ROWS = 2000
+
+# Lexical normalizer của worker process (mỗi process compile một lần)
+_WORKER_LEXICAL_NORMALIZER = None
+
+
+def _init_worker(norm_dict):
+    global _WORKER_LEXICAL_NORMALIZER
+    _WORKER_LEXICAL_NORMALIZER = LexicalNormalizer(norm_dict) if norm_dict else None
+
+
+def _normalize_chunk(texts):
+    return [normalize_text(text, _WORKER_LEXICAL_NORMALIZER) for text in texts]
+
+
+class TextNormalizer:
+    """
+    Pipeline chuẩn hóa bước 1-6 dùng chung cho notebook, CLI và benchmark.
+
+    Từ điển teencode được compile một lần; normalize_many chạy tuần tự hoặc chia
+    chunk cho một process pool (kết quả giữ đúng thứ tự đầu vào).
+    """
+
+    def __init__(self, norm_dict=None, workers=1, chunk_size=20000):
+        self.norm_dict = norm_dict or {}
+        self.lexical_normalizer = LexicalNormalizer(self.norm_dict) if self.norm_dict else None
+        self.workers = max(1, workers or 1)
+        self.chunk_size = chunk_size
+        self._executor = None
+
+    @classmethod
+    def from_dictionary_file(cls, path, **kwargs):
+        return cls(load_abbreviation_dictionary(path), **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def normalize(self, text):
+        return normalize_text(text, self.lexical_normalizer)
+
+    __call__ = normalize
+
+    def normalize_many(self, texts):
+        """Chuẩn hóa một list/Series comment, trả về list cùng thứ tự"""
+        texts = list(texts)
+        if self.workers <= 1 or len(texts) < MIN_PARALLEL_ROWS:
+            return [normalize_text(text, self.lexical_normalizer) for text in texts]
+
+        if self._executor is None:
+            # Pool được giữ lại giữa các lần gọi (chế độ streaming gọi nhiều lần)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.norm_dict,)
+            )
+        # Vài task cho mỗi worker để cân bằng tải, tối đa chunk_size dòng mỗi task
+        task_size = max(1, min(self.chunk_size, -(-len(texts) // (self.workers * 4))))
+        chunks = [texts[start:start + task_size] for start in range(0, len(texts), task_size)]
+        return [text for part in self._executor.map(_normalize_chunk, chunks) for text in part]
+
+    def normalize_series(self, series):
+        return pd.Series(self.normalize_many(series), index=series.index)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,227 @@
+import argparse
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+TOKEN_ESTIMATOR_FILENAME = "token_estimator.sqlite"
+
+# Chữ Latin có dấu (tiếng Việt) dạng dựng sẵn hoặc dấu kết hợp: tokenizer tách
+# các ký tự này khác hẳn ASCII, nên mỗi nhóm có hệ số riêng
+LATIN_EXTENDED_REGEX = re.compile(r"[\u00c0-\u024f\u1e00-\u1eff\u0300-\u036f]")
+WORD_REGEX = re.compile(r"\S+")
+
+FEATURE_NAMES = ("bias", "ascii_chars", "latin_extended_chars", "other_chars", "utf8_bytes", "words")
+
+# Cần ít nhất chừng này mẫu mới dùng hệ số đã fit, trước đó dùng len(text) // 4
+MIN_SAMPLES = 20
+# Fit lại sau mỗi chừng này mẫu mới; chỉ fit trên MAX_FIT_SAMPLES mẫu gần nhất
+REFIT_EVERY = 10
+MAX_FIT_SAMPLES = 5000
+# Ridge nhỏ vì utf8_bytes gần như là tổ hợp tuyến tính của các đếm ký tự
+RIDGE = 1e-3
+
+
+def text_features(text):
+    """Vector đặc trưng ký tự / byte của text (thứ tự như FEATURE_NAMES)"""
+    if not isinstance(text, str):
+        text = ""
+    chars = len(text)
+    utf8_bytes = len(text.encode('utf-8', 'surrogatepass'))
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    latin_extended = len(LATIN_EXTENDED_REGEX.findall(text))
+    other = chars - ascii_chars - latin_extended
+    words = len(WORD_REGEX.findall(text))
+    return [1.0, ascii_chars, latin_extended, other, utf8_bytes, words]
+
+
+def naive_estimate(text):
+    """Ước tính cũ: 4 ký tự = 1 token"""
+    if not isinstance(text, str):
+        return 0
+    return max(1, len(text) // 4)
+
+
+class TokenEstimator:
+    """
+    Ước tính số token của prompt theo từng model, học từ usage_metadata.
+
+    Mỗi request gửi đi ghi lại đặc trưng của prompt (số ký tự ASCII / Latin có dấu /
+    khác, số byte UTF-8, số từ) cùng prompt_token_count thực tế vào SQLite. Hệ số
+    tuyến tính được fit (ridge least squares) trên các mẫu của model và fit lại
+    định kỳ; khi chưa đủ MIN_SAMPLES mẫu thì dùng len(text) // 4. Mỗi mẫu cũng lưu
+    giá trị đã dự đoán lúc gửi, nên báo cáo có cả sai số thực tế (ngoài mẫu).
+    Dùng an toàn từ nhiều thread.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.coefficients = None
+        self._new_samples = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_samples ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " model TEXT NOT NULL,"
+            + "".join(f" {name} REAL NOT NULL," for name in FEATURE_NAMES[1:]) +
+            " predicted INTEGER,"
+            " calibrated INTEGER NOT NULL,"
+            " actual INTEGER NOT NULL,"
+            " recorded_at TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS token_samples_model ON token_samples (model, id)")
+        self.conn.commit()
+        self.fit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _samples(self, limit=MAX_FIT_SAMPLES):
+        rows = self.conn.execute(
+            f"SELECT {', '.join(FEATURE_NAMES[1:])}, predicted, calibrated, actual FROM token_samples"
+            " WHERE model = ? ORDER BY id DESC LIMIT ?",
+            (self.model_name, limit)
+        ).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_NAMES) + 2)
+        features = np.column_stack([np.ones(len(rows)), data[:, :len(FEATURE_NAMES) - 1]])
+        return features, data[:, -3], data[:, -2].astype(bool), data[:, -1]
+
+    def fit(self):
+        """Fit lại hệ số từ các mẫu đã lưu; trả về True nếu đủ mẫu"""
+        with self._lock:
+            features, _, _, actual = self._samples()
+            self._new_samples = 0
+            if len(actual) < MIN_SAMPLES:
+                self.coefficients = None
+                return False
+            # Chuẩn hóa theo cột để ridge phạt đều các đặc trưng có thang khác nhau
+            scale = np.maximum(np.abs(features).max(axis=0), 1.0)
+            scaled = features / scale
+            gram = scaled.T @ scaled + RIDGE * len(actual) * np.eye(scaled.shape[1])
+            self.coefficients = np.linalg.solve(gram, scaled.T @ actual) / scale
+            return True
+
+    @property
+    def calibrated(self):
+        return self.coefficients is not None
+
+    def estimate(self, text, fragment=False):
+        """
+        Số token ước tính của text.
+        fragment=True: text là một phần của prompt lớn hơn (vd. một post trong batch),
+        không cộng phần token cố định của mỗi request.
+        """
+        if not isinstance(text, str):
+            return 0
+        coefficients = self.coefficients
+        if coefficients is None:
+            return naive_estimate(text)
+        features = text_features(text)
+        if fragment:
+            features[0] = 0.0
+        return max(1, int(round(float(np.dot(coefficients, features)))))
+
+    def record(self, text, actual_tokens):
+        """Lưu một mẫu (prompt đã gửi, prompt_token_count thực tế)"""
+        if not isinstance(text, str) or not actual_tokens:
+            return
+        predicted = self.estimate(text)
+        with self._lock:
+            self.conn.execute(
+                f"INSERT INTO token_samples (model, {', '.join(FEATURE_NAMES[1:])}, predicted, calibrated, actual,"
+                " recorded_at) VALUES (?, " + "?, " * (len(FEATURE_NAMES) - 1) + "?, ?, ?, ?)",
+                (self.model_name, *text_features(text)[1:], predicted, int(self.calibrated), int(actual_tokens),
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            self.conn.commit()
+            self._new_samples += 1
+            refit = self._new_samples >= REFIT_EVERY or (not self.calibrated and self._new_samples >= 1)
+        if refit:
+            self.fit()
+
+    def error_stats(self):
+        """
+        Sai số ước tính trên các mẫu của model.
+
+        Returns:
+            dict: samples, calibrated, mape/p90 của ước tính đã fit (trên các mẫu
+            hiện có), mape của len // 4, và live_mape - sai số lúc gửi của các mẫu
+            được dự đoán bằng hệ số đã fit (None nếu chưa có)
+        """
+        with self._lock:
+            features, predicted, was_calibrated, actual = self._samples()
+            coefficients = self.coefficients
+        stats = {'model': self.model_name, 'samples': len(actual), 'calibrated': coefficients is not None,
+                 'mape': None, 'p90_error': None, 'naive_mape': None, 'live_mape': None}
+        if len(actual) == 0:
+            return stats
+        # Cột ký tự = ascii + latin có dấu + khác
+        naive = np.maximum(1, (features[:, 1] + features[:, 2] + features[:, 3]) // 4)
+        stats['naive_mape'] = float(np.mean(np.abs(naive - actual) / actual) * 100)
+        if coefficients is not None:
+            errors = np.abs(np.maximum(1, np.round(features @ coefficients)) - actual) / actual * 100
+            stats['mape'] = float(errors.mean())
+            stats['p90_error'] = float(np.percentile(errors, 90))
+        if was_calibrated.any():
+            live = np.abs(predicted[was_calibrated] - actual[was_calibrated]) / actual[was_calibrated] * 100
+            stats['live_mape'] = float(live.mean())
+        return stats
+
+    def report(self):
+        """Chuỗi tóm tắt sai số để in ra cuối mỗi lần chạy"""
+        stats = self.error_stats()
+        if not stats['calibrated']:
+            return (f"Token estimator ({self.model_name}): {stats['samples']}/{MIN_SAMPLES} mẫu,"
+                    f" đang dùng len // 4")
+        text = (f"Token estimator ({self.model_name}): {stats['samples']:,} mẫu,"
+                f" sai số TB {stats['mape']:.1f}% (p90 {stats['p90_error']:.1f}%)"
+                f" so với {stats['naive_mape']:.1f}% của len // 4")
+        if stats['live_mape'] is not None:
+            text += f", sai số lúc gửi {stats['live_mape']:.1f}%"
+        return text
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report token estimator accuracy per model')
+    parser.add_argument('estimator', help='Path to token_estimator.sqlite')
+    args = parser.parse_args()
+
+    if not Path(args.estimator).exists():
+        print(f"❌ Không tìm thấy file: {args.estimator}")
+        return
+
+    conn = sqlite3.connect(args.estimator)
+    try:
+        models = [row[0] for row in conn.execute("SELECT DISTINCT model FROM token_samples ORDER BY model")]
+    finally:
+        conn.close()
+    if not models:
+        print("Chưa có mẫu nào")
+    for model in models:
+        with TokenEstimator(args.estimator, model) as estimator:
+            print(estimator.report())
+            if estimator.calibrated:
+                coefficients = ", ".join(
+                    f"{name}={value:.4f}" for name, value in zip(FEATURE_NAMES, estimator.coefficients)
+                )
+                print(f"  {coefficients}")
+
+
+if __name__ == "__main__":
+    main()